@@ -8,6 +8,8 @@ const BitrixContactsPage = () => {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
   const [showContactForm, setShowContactForm] = useState(false)
+  const [nextPage, setNextPage] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     fetchContacts()
@@ -19,7 +21,8 @@ const BitrixContactsPage = () => {
       setError(null)
       
       const data = await bitrixAPI.getContacts()
-      setContacts(data)
+      setContacts(data.results)
+      setNextPage(data.next)
     } catch (err) {
       console.error('Error fetching contacts:', err)
       setError('Failed to fetch contacts. Please try again.')
@@ -29,6 +32,20 @@ const BitrixContactsPage = () => {
     }
   }
 
+  const fetchMoreContacts = async () => {
+    try {
+      setLoadingMore(true)
+      const data = await bitrixAPI.getContacts(nextPage)
+      setContacts((previous) => [...previous, ...data.results])
+      setNextPage(data.next)
+    } catch (err) {
+      console.error('Error fetching contacts:', err)
+      toast.error('Failed to fetch more contacts')
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleContactCreated = () => {
     fetchContacts() // Refresh the contact list
     setShowContactForm(false) // Hide the form
@@ -80,7 +97,7 @@ const BitrixContactsPage = () => {
         <div>
           <h1 className="text-3xl font-bold text-gray-900">Bitrix Contacts</h1>
           <p className="text-gray-600 mt-2">
-            Contacts synced from Bitrix24 CRM ({contacts.length} total)
+            Contacts synced from Bitrix24 CRM ({contacts.length}{nextPage ? '+' : ''} shown)
           </p>
         </div>
         <div className="flex items-center space-x-3">
@@ -218,6 +235,18 @@ const BitrixContactsPage = () => {
               </div>
             ))}
           </div>
+
+          {nextPage && (
+            <div className="flex justify-center">
+              <button
+                onClick={fetchMoreContacts}
+                disabled={loadingMore}
+                className="btn-secondary"
+              >
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </>
       )}
     </div>
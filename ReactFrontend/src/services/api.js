@@ -221,9 +221,11 @@ const bitrix24DirectApi = axios.create({
 
 // Bitrix API calls
 export const bitrixAPI = {
-  getContacts: async () => {
+  // Returns one page of contacts ({ results, next, previous }); pass the
+  // next link of the previous page to continue
+  getContacts: async (pageUrl = null) => {
     try {
-      const response = await bitrixApi.get('/bitrix-contacts/')
+      const response = await bitrixApi.get(pageUrl || '/bitrix-contacts/')
       return response.data
     } catch (error) {
       throw error.response?.data || { message: 'Failed to fetch Bitrix contacts' }
@@ -242,13 +244,11 @@ export const bitrixAPI = {
   // Sales Orders / Deals API
   getDeals: async (stageId = 'UC_3MCI1C') => {
     try {
-      const response = await bitrix24DirectApi.get('/crm.deal.list', {
-        params: {
-          'filter[STAGE_ID]': stageId,
-          'select': ['ID', 'TITLE', 'STAGE_ID', 'OPPORTUNITY', 'CURRENCY_ID', 'CONTACT_ID', 'COMPANY_ID', 'DATE_CREATE', 'DATE_MODIFY']
-        }
+      // Served from the backend, which caches the Bitrix24 deal list for all users
+      const response = await bitrixApi.get('/bitrix-deals/', {
+        params: { stage_id: stageId }
       })
-      return response.data.result || []
+      return response.data
     } catch (error) {
       throw error.response?.data || { message: 'Failed to fetch deals' }
     }
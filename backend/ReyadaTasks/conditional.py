@@ -0,0 +1,38 @@
+"""
+Conditional GET helpers shared by the API views
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    Build a weak ETag from the values a response depends on
+    """
+    digest = hashlib.blake2b('\x1f'.join(str(part) for part in parts).encode(), digest_size=16)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    Return a 304 response when the request's If-None-Match or
+    If-Modified-Since header still matches, otherwise None
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """
+    Add ETag and Last-Modified to a response and make clients revalidate it.
+    Responses depend on the caller's token, so shared caches must not keep them.
+    """
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
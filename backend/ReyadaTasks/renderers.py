@@ -0,0 +1,55 @@
+"""
+JSON renderer backed by orjson
+"""
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # Optional, the stdlib encoder is used without it
+    orjson = None
+
+# A number orjson writes differently from Python's float repr: an exponent
+# (1e20 for 1e+20, 1e-7 for 1e-07) or a plain 0.0000x for what repr writes
+# as 1e-05. Strings never match, as they start with a quote, so a false
+# positive only costs a fallback to JSONRenderer.
+FLOAT_MISMATCH = re.compile(rb'(?:^|[:,\[])-?(?:\d+(?:\.\d+)?e|0\.0000)')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement for DRF's JSONRenderer that encodes with orjson.
+
+    Output is byte for byte what JSONRenderer produces with the default
+    COMPACT_JSON and UNICODE_JSON settings. Datetimes and the types orjson
+    does not know, such as Decimal or lazy translations, go through DRF's
+    encoder. Indented or ASCII-only output, integers wider than 64 bits,
+    floats orjson writes in another notation, or a missing orjson, fall
+    back to JSONRenderer.
+
+    The one difference left: NaN and infinities render as null, where
+    JSONRenderer raises ValueError under the default STRICT_JSON.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            # Integers wider than 64 bits, which the stdlib encoder handles
+            return super().render(data, accepted_media_type, renderer_context)
+        if FLOAT_MISMATCH.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, these are invalid in JavaScript strings
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
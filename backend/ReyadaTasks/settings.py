@@ -104,6 +104,27 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default, which needs no external service but is private to
+# each process. Set CACHE_DIR to share one file-based cache between the web
+# workers and the management commands that invalidate it.
+CACHE_DIR = os.getenv('CACHE_DIR')
+
+if CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -161,8 +182,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Same output as rest_framework.renderers.JSONRenderer, encoded with orjson
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'ReyadaTasks.renderers.ORJSONRenderer',
     ],
 }
 
@@ -223,3 +245,48 @@ BITRIX24_DOMAIN = os.getenv('BITRIX24_DOMAIN', 'b24-0r8mng.bitrix24.com')
 BITRIX24_USER_ID = os.getenv('BITRIX24_USER_ID', '1')
 BITRIX24_TOKEN = os.getenv('BITRIX24_TOKEN', 'iolappou7w3kdu2w')
 BITRIX24_BASE_URL = f"https://{BITRIX24_DOMAIN}/rest/{BITRIX24_USER_ID}/{BITRIX24_TOKEN}"
+
+# Bitrix24 client: connection pool size, timeouts (seconds) and retries for 5xx/429 responses
+BITRIX24_POOL_SIZE = int(os.getenv('BITRIX24_POOL_SIZE', '10'))
+BITRIX24_CONNECT_TIMEOUT = float(os.getenv('BITRIX24_CONNECT_TIMEOUT', '5'))
+BITRIX24_READ_TIMEOUT = float(os.getenv('BITRIX24_READ_TIMEOUT', '30'))
+BITRIX24_MAX_RETRIES = int(os.getenv('BITRIX24_MAX_RETRIES', '5'))
+
+# Bitrix24 calls made while a user request waits: shorter timeouts and fewer retries
+BITRIX24_REQUEST_CONNECT_TIMEOUT = float(os.getenv('BITRIX24_REQUEST_CONNECT_TIMEOUT', '2'))
+BITRIX24_REQUEST_READ_TIMEOUT = float(os.getenv('BITRIX24_REQUEST_READ_TIMEOUT', '10'))
+BITRIX24_REQUEST_MAX_RETRIES = int(os.getenv('BITRIX24_REQUEST_MAX_RETRIES', '2'))
+
+# Bitrix24 rate limiting (per process): sustained requests per second and burst size
+BITRIX24_RATE_LIMIT = float(os.getenv('BITRIX24_RATE_LIMIT', '2'))
+BITRIX24_RATE_BURST = int(os.getenv('BITRIX24_RATE_BURST', '50'))
+
+# Bitrix24 outbox: failed deliveries are dead-lettered after this many attempts
+BITRIX24_OUTBOX_MAX_ATTEMPTS = int(os.getenv('BITRIX24_OUTBOX_MAX_ATTEMPTS', '8'))
+
+# Bitrix24 deals cache: seconds a cached list is fresh, then served stale while it refreshes
+BITRIX24_DEALS_CACHE_TTL = int(os.getenv('BITRIX24_DEALS_CACHE_TTL', '60'))
+BITRIX24_DEALS_CACHE_STALE = int(os.getenv('BITRIX24_DEALS_CACHE_STALE', '300'))
+
+# Token Bitrix24 sends with outbound webhook calls; events are rejected while unset
+BITRIX24_APPLICATION_TOKEN = os.getenv('BITRIX24_APPLICATION_TOKEN', '')
+
+# Contacts list: default and largest page size a client may request with ?page_size=
+BITRIX24_CONTACTS_PAGE_SIZE = int(os.getenv('BITRIX24_CONTACTS_PAGE_SIZE', '50'))
+BITRIX24_CONTACTS_MAX_PAGE_SIZE = int(os.getenv('BITRIX24_CONTACTS_MAX_PAGE_SIZE', '500'))
+
+# Contacts list response cache: seconds a cached page is kept (0 disables it).
+# Writes invalidate pages at once within a shared cache; with the local memory
+# cache, writes from other processes only show once this expires.
+BITRIX24_CONTACTS_CACHE_TTL = int(os.getenv('BITRIX24_CONTACTS_CACHE_TTL', '30'))
+
+# Contacts export: rows read from the database and encoded per chunk
+BITRIX24_EXPORT_CHUNK_SIZE = int(os.getenv('BITRIX24_EXPORT_CHUNK_SIZE', '2000'))
+
+# Most contacts accepted by one POST to /api/bitrix-contacts/bulk/
+BITRIX24_BULK_CREATE_MAX = int(os.getenv('BITRIX24_BULK_CREATE_MAX', '2000'))
+
+# Contact imports: rows validated and written per transaction, and where
+# error reports of uploaded files are kept (not publicly served)
+BITRIX24_IMPORT_CHUNK_SIZE = int(os.getenv('BITRIX24_IMPORT_CHUNK_SIZE', '1000'))
+BITRIX24_IMPORT_REPORT_DIR = os.getenv('BITRIX24_IMPORT_REPORT_DIR') or str(BASE_DIR / 'import_reports')
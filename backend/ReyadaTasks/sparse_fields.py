@@ -0,0 +1,86 @@
+"""
+Sparse fieldsets: ?fields= and ?omit= query parameters for serializers
+"""
+from drf_yasg import openapi
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+# Swagger parameters of the views that support sparse fieldsets
+SPARSE_FIELDS_PARAMETERS = [
+    openapi.Parameter(
+        'fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+        description="Comma-separated fields to return; profile.bio style names select nested fields"
+    ),
+    openapi.Parameter(
+        'omit', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+        description="Comma-separated fields to leave out"
+    ),
+]
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def requested_fields(request):
+    """
+    Return the (fields, omit) name lists of a read request, or None for a
+    parameter that was not given
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    fields = request.query_params.get('fields')
+    omit = request.query_params.get('omit')
+    return (_split(fields) if fields else None), (_split(omit) if omit else None)
+
+
+def _group(names):
+    # 'profile.bio' selects bio within the nested profile serializer
+    groups = {}
+    for name in names:
+        head, _, rest = name.partition('.')
+        groups.setdefault(head, [])
+        if rest:
+            groups[head].append(rest)
+    return groups
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin that keeps only the fields listed in `fields` and drops
+    those listed in `omit`.
+
+    Both are taken from the keyword arguments, or else from the ?fields= and
+    ?omit= parameters of a GET request in the serializer context. Dotted
+    names such as profile.bio select within nested serializers that use this
+    mixin too. Unknown names raise a ValidationError.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        omit = kwargs.pop('omit', None)
+        super().__init__(*args, **kwargs)
+        if fields is None and omit is None:
+            fields, omit = requested_fields(self.context.get('request'))
+        if fields is not None or omit is not None:
+            self.select_fields(fields, omit)
+
+    def select_fields(self, fields=None, omit=None):
+        wanted = _group(fields) if fields is not None else {name: [] for name in self.fields}
+        omitted = _group(omit or [])
+        for param, groups in (('fields', wanted), ('omit', omitted)):
+            unknown = [name for name in groups if name not in self.fields]
+            if unknown:
+                raise serializers.ValidationError({param: [f"Unknown fields: {', '.join(unknown)}."]})
+
+        for name in list(self.fields):
+            if name not in wanted or (name in omitted and not omitted[name]):
+                self.fields.pop(name)
+                continue
+
+            nested_fields, nested_omit = wanted[name], omitted.get(name, [])
+            if nested_fields or nested_omit:
+                nested = getattr(self.fields[name], 'child', self.fields[name])
+                if not isinstance(nested, SparseFieldsMixin):
+                    raise serializers.ValidationError({'fields': [f'{name} has no nested fields.']})
+                nested.select_fields(nested_fields or None, nested_omit or None)
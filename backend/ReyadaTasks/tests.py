@@ -0,0 +1,30 @@
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from rest_framework.renderers import JSONRenderer
+
+from .renderers import ORJSONRenderer
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def test_output_matches_json_renderer(self):
+        values = [
+            None, True, 0, -1, 2 ** 63 - 1, 2 ** 64, -2 ** 70,
+            0.1, 1.5, 1e15, 1e16, 1e20, -2.5e30, 0.0001, 1e-05, 3.2e-05, 1e-07, 5e-324,
+            'text', 'ünïcode', 'line break ', '1e5', '"quoted"', '',
+            Decimal('1.10'), uuid.UUID(int=1), datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc),
+            [], {}, {1: 'int key'}, {'nested': [1e20, {'x': 1e-05}]},
+        ]
+        for value in values + [values, {'values': values}]:
+            with self.subTest(value=value):
+                self.assertEqual(ORJSONRenderer().render(value), JSONRenderer().render(value))
+
+    def test_indented_output_matches_json_renderer(self):
+        data = {'a': [1, 2.5, 'b']}
+
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
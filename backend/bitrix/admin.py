@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import BitrixContact
+from django.utils import timezone
+from .cache import contacts_changed
+from .models import BitrixContact, BitrixDeal, BitrixOutbox, BitrixSyncRun, BitrixSyncState
+from .search import search_contacts
 
 
 @admin.register(BitrixContact)
@@ -7,8 +10,86 @@ class BitrixContactAdmin(admin.ModelAdmin):
     """
     Admin interface for BitrixContact model
     """
-    list_display = ['full_name', 'email', 'created_at', 'updated_at']
-    list_filter = ['created_at', 'updated_at']
-    search_fields = ['name', 'last_name', 'email']
-    readonly_fields = ['created_at', 'updated_at']
+    list_display = ['full_name', 'email', 'sync_status', 'deleted_at', 'created_at', 'updated_at']
+    list_filter = ['sync_status', 'deleted_at', 'created_at', 'updated_at']
+    search_fields = ['search_text', 'phone_digits']
+    readonly_fields = ['sync_hash', 'created_at', 'updated_at']
     ordering = ['last_name', 'name']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Same indexed search as the API instead of icontains on every column
+        if not search_term:
+            return queryset, False
+        return search_contacts(queryset, search_term), False
+
+    # Deletes bypass BitrixContact.save(), so the list caches and ETags are
+    # invalidated here
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        contacts_changed()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        contacts_changed()
+
+
+@admin.register(BitrixDeal)
+class BitrixDealAdmin(admin.ModelAdmin):
+    """
+    Admin interface for BitrixDeal model
+    """
+    list_display = ['title', 'bitrix_id', 'stage_id', 'opportunity', 'currency_id', 'date_modify']
+    list_filter = ['stage_id', 'currency_id']
+    search_fields = ['title', 'bitrix_id']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(BitrixSyncState)
+class BitrixSyncStateAdmin(admin.ModelAdmin):
+    """
+    Admin interface for BitrixSyncState model
+    """
+    list_display = ['portal', 'entity', 'last_modified', 'completed_at', 'updated_at']
+    list_filter = ['entity']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(BitrixSyncRun)
+class BitrixSyncRunAdmin(admin.ModelAdmin):
+    """
+    Read-only admin interface for BitrixSyncRun history
+    """
+    list_display = [
+        'started_at', 'entity', 'mode', 'status', 'rows_processed', 'rows_per_second',
+        'requests', 'retries', 'rate_limited', 'duration',
+    ]
+    list_filter = ['entity', 'mode', 'status']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BitrixOutbox)
+class BitrixOutboxAdmin(admin.ModelAdmin):
+    """
+    Admin interface for BitrixOutbox model
+    """
+    list_display = ['contact', 'operation', 'status', 'attempts', 'next_attempt_at', 'bitrix_id', 'created_at']
+    list_filter = ['status', 'operation']
+    search_fields = ['contact__email', 'idempotency_key']
+    readonly_fields = ['idempotency_key', 'created_at', 'updated_at']
+    actions = ['retry_entries']
+
+    @admin.action(description='Retry selected entries now')
+    def retry_entries(self, request, queryset):
+        updated = queryset.exclude(status=BitrixOutbox.STATUS_SYNCED).update(
+            status=BitrixOutbox.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        BitrixContact.objects.filter(
+            outbox_entries__in=queryset, sync_status=BitrixContact.SYNC_FAILED
+        ).update(sync_status=BitrixContact.SYNC_PENDING, updated_at=timezone.now())
+        contacts_changed()
+        self.message_user(request, f'{updated} entries queued for retry.')
@@ -0,0 +1,103 @@
+"""
+Creation of many contacts at once, for the bulk endpoint and imports
+"""
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from .cache import contacts_changed
+from .models import DUPLICATE_EMAIL_MESSAGE, BitrixContact, refresh_search_tokens
+from .outbox import enqueue_contact_adds
+from .serializers import BitrixContactSerializer
+
+DUPLICATE_IN_BATCH_MESSAGE = 'This email already appears earlier in the list.'
+
+STATUS_CREATED = 'created'
+STATUS_ERROR = 'error'
+
+
+def _error(index, errors):
+    return {'index': index, 'status': STATUS_ERROR, 'errors': errors}
+
+
+def validate_contacts(items, seen=()):
+    """
+    Validate contacts given as API request dicts with the
+    BitrixContactSerializer rules.
+
+    Returns (valid, errors): `valid` maps the normalized email of each valid
+    item to (index, validated data), in order, and `errors` maps the index
+    of each rejected item to its errors. Only the first item with a given
+    email is valid, and emails in `seen` are rejected as repeats too.
+    """
+    # One serializer validates every item, so its fields are built once
+    # rather than per item, which would cost more than the inserts
+    serializer = BitrixContactSerializer()
+
+    valid = {}
+    errors = {}
+    for index, item in enumerate(items):
+        try:
+            data = serializer.run_validation(item)
+        except ValidationError as e:
+            errors[index] = as_serializer_error(e)
+            continue
+        email = data['email']
+        if email in valid or email in seen:
+            errors[index] = {'email': [DUPLICATE_IN_BATCH_MESSAGE]}
+            continue
+        valid[email] = (index, data)
+    return valid, errors
+
+
+def create_contacts(items):
+    """
+    Validate contacts given as API request dicts and create the valid ones.
+
+    Every item is validated by BitrixContactSerializer. Emails taken by
+    existing contacts are found with one query, and repeats within `items`
+    keep only their first occurrence. The new contacts and their outbox
+    entries are written with one bulk insert each in a single transaction;
+    process_bitrix_outbox then pushes them to Bitrix24 50 per batch call.
+
+    Returns one result per item, in order: {'index', 'status': 'created',
+    'contact'} or {'index', 'status': 'error', 'errors'}.
+    """
+    results = [None] * len(items)
+    valid, errors = validate_contacts(items)
+    for index, item_errors in errors.items():
+        results[index] = _error(index, item_errors)
+
+    # A concurrent request may create one of the emails between the lookup
+    # and the insert; the unique index then rejects the whole insert, and the
+    # second lookup sees the other request's rows
+    for attempt in range(2):
+        taken = BitrixContact.objects.filter(email__in=list(valid)).values_list('email', flat=True)
+        for email in taken:
+            index, _ = valid.pop(email)
+            results[index] = _error(index, {'email': [DUPLICATE_EMAIL_MESSAGE]})
+
+        contacts = []
+        for _, data in valid.values():
+            contact = BitrixContact(**data, sync_status=BitrixContact.SYNC_PENDING)
+            contact.refresh_search_fields()
+            contacts.append(contact)
+        if not contacts:
+            break
+
+        try:
+            with transaction.atomic():
+                BitrixContact.objects.bulk_create(contacts)
+                refresh_search_tokens(contacts)
+                enqueue_contact_adds(contacts)
+                contacts_changed()
+        except IntegrityError:
+            if attempt:
+                raise
+        else:
+            break
+
+    rows = [{field: getattr(contact, field) for field in BitrixContactSerializer.VALUE_FIELDS} for contact in contacts]
+    for (index, _), data in zip(valid.values(), BitrixContactSerializer.from_values(rows)):
+        results[index] = {'index': index, 'status': STATUS_CREATED, 'contact': data}
+    return results
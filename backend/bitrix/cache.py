@@ -0,0 +1,132 @@
+"""
+Caching helpers for data read from Bitrix24 and for API responses
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# How long a caller without a cached value waits for another request that
+# is already fetching it before giving up with CacheWaitTimeout
+DEFAULT_WAIT_TIMEOUT = 10.0
+
+# Version of the contacts table, part of every cached contact list key
+CONTACTS_VERSION_KEY = 'bitrix:contacts:version'
+
+
+class CacheWaitTimeout(Exception):
+    """
+    Raised when another caller is still fetching a missing value after the
+    wait timeout
+    """
+
+
+def get_or_refresh(key, fetch, ttl, stale_ttl, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+    """
+    Return the cached value for `key`, calling `fetch()` to build it.
+
+    Values are fresh for `ttl` seconds and then served stale for another
+    `stale_ttl` seconds while a single background thread refreshes them. On a
+    miss only one caller fetches; concurrent callers wait for its result, so
+    N simultaneous requests cost one upstream call instead of N, and raise
+    CacheWaitTimeout if it takes longer than `wait_timeout`.
+    """
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+
+    if entry is not None:
+        if time.time() - entry['fetched_at'] < ttl:
+            return entry['value']
+
+        # Stale: answer immediately and let one caller revalidate
+        if cache.add(lock_key, True, timeout=int(wait_timeout) + 60):
+            thread = threading.Thread(
+                target=_refresh, args=(key, lock_key, fetch, ttl, stale_ttl), daemon=True
+            )
+            thread.start()
+        return entry['value']
+
+    return _fetch_once(key, lambda: _store(key, fetch(), ttl, stale_ttl), wait_timeout)['value']
+
+
+def get_or_build(key, build, timeout, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+    """
+    Return the cached value for `key`, calling `build()` on a miss.
+
+    Only one caller builds a missing value while concurrent callers wait
+    for it, so a burst of requests after an invalidation costs one build.
+    Waiters raise CacheWaitTimeout if it takes longer than `wait_timeout`.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        return entry['value']
+
+    def store():
+        entry = {'value': build()}
+        cache.set(key, entry, timeout=timeout)
+        return entry
+
+    return _fetch_once(key, store, wait_timeout)['value']
+
+
+def _fetch_once(key, store, wait_timeout):
+    """
+    Run `store()` in a single caller per key and return the stored entry;
+    the other callers poll the cache for it until `wait_timeout`, then
+    raise CacheWaitTimeout rather than fetching too
+    """
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, timeout=int(wait_timeout) + 60):
+        try:
+            return store()
+        finally:
+            cache.delete(lock_key)
+
+    # Another request is fetching the value, wait for it
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+
+    # Fetching here as well would turn a slow upstream into N calls
+    logger.warning(f"Gave up waiting {wait_timeout}s for {key} to be fetched")
+    raise CacheWaitTimeout(key)
+
+
+def _store(key, value, ttl, stale_ttl):
+    entry = {'value': value, 'fetched_at': time.time()}
+    cache.set(key, entry, timeout=ttl + stale_ttl)
+    return entry
+
+
+def _refresh(key, lock_key, fetch, ttl, stale_ttl):
+    try:
+        _store(key, fetch(), ttl, stale_ttl)
+    except Exception as e:
+        # Keep serving the stale value; the next request after the lock
+        # expires will try again
+        logger.warning(f"Background refresh of {key} failed: {e}")
+        return
+    cache.delete(lock_key)
+
+
+def contacts_version():
+    """
+    Return the current version of the contacts table
+    """
+    return cache.get_or_set(CONTACTS_VERSION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def contacts_changed():
+    """
+    Invalidate every cached contact list once the current transaction
+    commits. Call after any write to BitrixContact rows.
+    """
+    transaction.on_commit(lambda: cache.set(CONTACTS_VERSION_KEY, uuid.uuid4().hex, timeout=None))
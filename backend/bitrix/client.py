@@ -0,0 +1,405 @@
+"""
+Bitrix24 REST client shared by every part of the app that talks to Bitrix24.
+
+All calls go through one process-wide requests.Session, so TCP and TLS
+connections are pooled and kept alive between calls, and through the shared
+rate limiter from bitrix.fetcher.
+"""
+import logging
+import random
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .fetcher import get_rate_limiter, reset_rate_limiter
+from .metrics import measure
+
+logger = logging.getLogger(__name__)
+
+# Bitrix24 list methods always return this many rows per call
+PAGE_SIZE = 50
+
+# Maximum number of sub-commands accepted by the batch method
+BATCH_LIMIT = 50
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+
+# Budget of calls made while a user request waits on them
+DEFAULT_REQUEST_CONNECT_TIMEOUT = 2
+DEFAULT_REQUEST_READ_TIMEOUT = 10
+DEFAULT_REQUEST_MAX_RETRIES = 2
+DEFAULT_REQUEST_BACKOFF = 0.5
+
+
+class BitrixError(Exception):
+    """
+    Error reported by the Bitrix24 REST API
+    """
+
+    def __init__(self, code, description=''):
+        self.code = code
+        self.description = description
+        super().__init__(f"{code}: {description}" if description else str(code))
+
+
+class QueryLimitExceeded(BitrixError):
+    """
+    Raised when Bitrix24 rejects a call with QUERY_LIMIT_EXCEEDED
+    """
+
+    def __init__(self, description='Too many requests'):
+        super().__init__('QUERY_LIMIT_EXCEEDED', description)
+
+
+def http_build_query(params, prefix=None):
+    """
+    Encode nested parameters the way PHP does (order[ID]=ASC&select[0]=ID),
+    which is the format Bitrix24 expects inside batch commands.
+    """
+    if isinstance(params, dict):
+        items = params.items()
+    elif isinstance(params, (list, tuple)):
+        items = enumerate(params)
+    else:
+        return f"{quote(prefix)}={quote(str(params))}"
+
+    parts = []
+    for key, value in items:
+        name = f"{prefix}[{key}]" if prefix else str(key)
+        parts.append(http_build_query(value, name))
+    return '&'.join(part for part in parts if part)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the process-wide Session used for Bitrix24 calls
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = getattr(settings, 'BITRIX24_POOL_SIZE', DEFAULT_POOL_SIZE)
+            # Retries are handled by BitrixClient so they can respect the rate limiter
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+class BitrixClient:
+    """
+    Client for the Bitrix24 REST API.
+
+    Every call waits for a token from the rate limiter. Calls rejected with
+    QUERY_LIMIT_EXCEEDED or HTTP 429 pause the limiter and are retried, and
+    5xx responses and connection failures are retried with jittered
+    exponential backoff.
+
+    When given a SyncMetrics, the client records HTTP wait and JSON decode
+    time and counts requests, retries, rate-limit hits and server errors.
+    """
+
+    def __init__(self, base_url=None, limiter=None, timeout=None, max_retries=None, backoff=None,
+                 metrics=None):
+        self.base_url = (base_url or settings.BITRIX24_BASE_URL).rstrip('/')
+        self.limiter = limiter or get_rate_limiter()
+        self.timeout = timeout or (
+            getattr(settings, 'BITRIX24_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+            getattr(settings, 'BITRIX24_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+        )
+        self.max_retries = (
+            max_retries if max_retries is not None
+            else getattr(settings, 'BITRIX24_MAX_RETRIES', DEFAULT_MAX_RETRIES)
+        )
+        self.backoff = backoff if backoff is not None else DEFAULT_BACKOFF
+        self.metrics = metrics
+        self.session = get_session()
+
+    def _count(self, name):
+        if self.metrics is not None:
+            self.metrics.count(name)
+
+    def _delay(self, attempt):
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def _retrying(self, func, *args, idempotent=True):
+        # A rate-limited call was rejected before it ran, so it is always
+        # retried. After a dropped connection or a 5xx the call may have run
+        # anyway, so only calls that are safe to repeat are retried then.
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            self._count('requests')
+            try:
+                return func(*args)
+            except QueryLimitExceeded:
+                self._count('rate_limited')
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._delay(attempt)
+                # Pausing the shared limiter makes every caller back off together
+                self.limiter.pause(delay)
+            except (requests.ConnectionError, requests.HTTPError) as e:
+                status_code = getattr(e.response, 'status_code', None)
+                if status_code is not None and status_code < 500:
+                    raise
+                self._count('server_errors')
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self._delay(attempt)
+                time.sleep(delay)
+            attempt += 1
+            self._count('retries')
+            logger.warning(f"Retrying Bitrix24 call, attempt {attempt}/{self.max_retries}")
+
+    def _post(self, method, payload):
+        with measure(self.metrics, 'http_wait'):
+            response = self.session.post(f"{self.base_url}/{method}.json", json=payload, timeout=self.timeout)
+
+        with measure(self.metrics, 'json_decode'):
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+
+        if response.status_code in (429, 503):
+            error = data.get('error') if isinstance(data, dict) else None
+            if response.status_code == 429 or error == 'QUERY_LIMIT_EXCEEDED':
+                raise QueryLimitExceeded()
+
+        if data is None:
+            response.raise_for_status()
+            raise BitrixError('INVALID_RESPONSE', f'{method} returned a non-JSON response')
+
+        if isinstance(data, dict) and 'error' in data:
+            if response.status_code >= 500:
+                response.raise_for_status()
+            raise BitrixError(data['error'], data.get('error_description', ''))
+
+        response.raise_for_status()
+        return data
+
+    def _batch(self, commands, halt):
+        data = self._post('batch', {'halt': 1 if halt else 0, 'cmd': commands})
+        batch = data.get('result')
+        if not isinstance(batch, dict) or 'result' not in batch:
+            raise BitrixError('INVALID_RESPONSE', 'batch returned an unexpected response')
+
+        # Without halt the other commands have already run, so per-command
+        # errors are returned to the caller instead of retrying the batch
+        errors = batch.get('result_error')
+        if halt and errors and isinstance(errors, dict):
+            if any(
+                isinstance(error, dict) and error.get('error') == 'QUERY_LIMIT_EXCEEDED'
+                for error in errors.values()
+            ):
+                raise QueryLimitExceeded('Rate limit exceeded inside batch')
+            key, error = next(iter(errors.items()))
+            error = error if isinstance(error, dict) else {}
+            raise BitrixError(error.get('error', 'BATCH_ERROR'), f"{key}: {error.get('error_description', '')}")
+
+        # PHP encodes empty maps as [], so normalise the optional sections
+        return {
+            section: batch.get(section) if isinstance(batch.get(section), dict) else {}
+            for section in ('result', 'result_error', 'result_total', 'result_next')
+        }
+
+    def call(self, method, params=None, idempotent=True):
+        """
+        Call a REST method and return the decoded response. Pass
+        idempotent=False for calls that create records, so a server error
+        or dropped connection is raised instead of retried.
+        """
+        return self._retrying(self._post, method, params or {}, idempotent=idempotent)
+
+    def batch(self, commands, halt=True, idempotent=True):
+        """
+        Run up to 50 commands in one request.
+
+        `commands` maps keys to (method, params) tuples. Returns a dict with the
+        result, result_error, result_total and result_next maps keyed the same way.
+        As with call(), batches that create records pass idempotent=False.
+        """
+        if len(commands) > BATCH_LIMIT:
+            raise ValueError(f'A batch accepts at most {BATCH_LIMIT} commands')
+        encoded = {
+            key: f"{method}?{http_build_query(params)}" if params else method
+            for key, (method, params) in commands.items()
+        }
+        return self._retrying(self._batch, encoded, halt, idempotent=idempotent)
+
+    def list_page(self, method, params=None, start=0):
+        """
+        Fetch one page of a list method and return (rows, total, next)
+        """
+        data = self.call(method, {**(params or {}), 'start': start})
+        if 'result' not in data:
+            raise BitrixError('INVALID_RESPONSE', f'{method} returned no result')
+        return data['result'], data.get('total'), data.get('next')
+
+    def list_pages_batch(self, method, params, offsets):
+        """
+        Fetch several pages of a list method in one batch request and return
+        [(rows, total, next)] in offset order
+        """
+        commands = {
+            f'page_{offset}': (method, {**(params or {}), 'start': offset})
+            for offset in offsets
+        }
+        batch = self.batch(commands)
+        return [
+            (batch['result'].get(key) or [], batch['result_total'].get(key), batch['result_next'].get(key))
+            for key in commands
+        ]
+
+    def iter_pages(self, method, params=None):
+        """
+        Yield every page of a list method as (rows, total).
+
+        The first page is fetched directly to learn the total, the rest are
+        requested 50 pages per batch call.
+        """
+        rows, total, start = self.list_page(method, params, 0)
+        yield rows, total
+
+        while start is not None:
+            stop = max(total or 0, start + PAGE_SIZE)
+            offsets = list(range(start, stop, PAGE_SIZE))[:BATCH_LIMIT]
+            pages = self.list_pages_batch(method, params, offsets)
+            for rows, page_total, _ in pages:
+                yield rows, page_total if page_total is not None else total
+            # Keep going while the last page reports more, in case rows were added
+            _, last_total, start = pages[-1]
+            total = last_total if last_total is not None else total
+
+    def iter_modified_pages(self, method, params):
+        """
+        Yield (rows, has_more) for every row of a list method matching params
+        in DATE_MODIFY, ID order, paging by keyset instead of offset.
+
+        Each call asks for the rows modified at or after the last row seen,
+        with start=-1 so Bitrix24 skips counting them, and drops the rows up
+        to that one. A record edited during the run moves to the end of the
+        order, where it is fetched again, and the rows still to come keep
+        their place, so none is skipped before the watermark passes it. When
+        a whole page shares the last row's DATE_MODIFY second, that second is
+        paged through by ID.
+        """
+        def position(row):
+            return parse_datetime(row['DATE_MODIFY']), int(row['ID'])
+
+        query = params.get('filter', {})
+        order = params['order']
+        last = None
+        same_second = False
+
+        while True:
+            rows, _, _ = self.list_page(method, {**params, 'filter': query, 'order': order}, start=-1)
+            has_more = len(rows) == PAGE_SIZE
+            if last is not None and not same_second:
+                rows = [row for row in rows if position(row) > position(last)]
+                if has_more and not rows:
+                    # Only rows already seen fit in the page
+                    same_second = True
+                    modified = last['DATE_MODIFY']
+                    query = {'>=DATE_MODIFY': modified, '<=DATE_MODIFY': modified, '>ID': last['ID']}
+                    order = {'ID': 'ASC'}
+                    continue
+
+            yield rows, has_more or same_second
+            if rows:
+                last = rows[-1]
+
+            if same_second and has_more:
+                query = {**query, '>ID': last['ID']}
+            elif same_second:
+                # The second is exhausted, carry on after it
+                same_second = False
+                query = {'>DATE_MODIFY': last['DATE_MODIFY']}
+                order = params['order']
+            elif has_more:
+                query = {'>=DATE_MODIFY': last['DATE_MODIFY']}
+            else:
+                return
+
+    def contact_list(self, params=None, start=0):
+        """
+        Fetch one page of crm.contact.list
+        """
+        return self.list_page('crm.contact.list', params, start)
+
+    def contact_add(self, fields, params=None):
+        """
+        Create a contact with crm.contact.add and return its Bitrix ID
+        """
+        return self.call('crm.contact.add', {'fields': fields, 'params': params or {}}, idempotent=False)['result']
+
+    def deal_list(self, params=None, start=0):
+        """
+        Fetch one page of crm.deal.list
+        """
+        return self.list_page('crm.deal.list', params, start)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide BitrixClient
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = BitrixClient()
+        return _client
+
+
+_request_client = None
+
+
+def get_request_client():
+    """
+    Return the process-wide BitrixClient for calls made while a user request
+    waits on them. Its short timeouts, few retries and short backoff make an
+    unreachable portal fail within seconds instead of holding the worker.
+    """
+    global _request_client
+    with _client_lock:
+        if _request_client is None:
+            _request_client = BitrixClient(
+                timeout=(
+                    getattr(settings, 'BITRIX24_REQUEST_CONNECT_TIMEOUT', DEFAULT_REQUEST_CONNECT_TIMEOUT),
+                    getattr(settings, 'BITRIX24_REQUEST_READ_TIMEOUT', DEFAULT_REQUEST_READ_TIMEOUT),
+                ),
+                max_retries=getattr(settings, 'BITRIX24_REQUEST_MAX_RETRIES', DEFAULT_REQUEST_MAX_RETRIES),
+                backoff=DEFAULT_REQUEST_BACKOFF,
+            )
+        return _request_client
+
+
+def reset_client():
+    """
+    Drop the shared clients and rate limiter so they are rebuilt from the
+    current settings, e.g. after pointing BITRIX24_BASE_URL elsewhere
+    """
+    global _client, _request_client
+    with _client_lock:
+        _client = None
+        _request_client = None
+    reset_rate_limiter()
@@ -0,0 +1,56 @@
+"""
+Reading Bitrix24 CRM deals
+"""
+from django.conf import settings
+
+from .cache import get_or_refresh
+from .client import get_request_client
+from .models import BitrixSyncState
+from .sync import current_portal
+
+# Deal fields served to the frontend
+DEAL_FIELDS = [
+    'ID', 'TITLE', 'STAGE_ID', 'OPPORTUNITY', 'CURRENCY_ID',
+    'CONTACT_ID', 'COMPANY_ID', 'DATE_CREATE', 'DATE_MODIFY',
+]
+
+DEFAULT_CACHE_TTL = 60
+DEFAULT_CACHE_STALE = 300
+
+
+def fetch_deals(stage_id):
+    """
+    Fetch every deal in a stage from Bitrix24, with the short retry budget
+    of user-facing calls since a request is waiting on the result
+    """
+    params = {
+        'filter': {'STAGE_ID': stage_id},
+        'select': DEAL_FIELDS,
+        'order': {'ID': 'DESC'},
+    }
+    deals = []
+    for rows, _ in get_request_client().iter_pages('crm.deal.list', params):
+        deals.extend(rows)
+    return deals
+
+
+def get_deals(stage_id):
+    """
+    Return the deals in a stage through the shared cache
+    """
+    return get_or_refresh(
+        f'bitrix:deals:{stage_id}',
+        lambda: fetch_deals(stage_id),
+        ttl=getattr(settings, 'BITRIX24_DEALS_CACHE_TTL', DEFAULT_CACHE_TTL),
+        stale_ttl=getattr(settings, 'BITRIX24_DEALS_CACHE_STALE', DEFAULT_CACHE_STALE),
+    )
+
+
+def mirror_is_synced():
+    """
+    Whether sync_bitrix_deals has completed a full sync of the configured
+    portal, so BitrixDeal can answer deal reads instead of Bitrix24
+    """
+    return BitrixSyncState.objects.filter(
+        portal=current_portal(), entity=BitrixSyncState.ENTITY_DEAL, completed_at__isnull=False
+    ).exists()
@@ -0,0 +1,149 @@
+"""
+Push-based updates from Bitrix24 outbound webhooks.
+
+The webhook view only records each event. process_events later collapses
+the queued events to one refetch per changed record and asks Bitrix24 for
+the current state of up to 2,500 records per batch request, so a burst of
+edits costs a handful of calls instead of one per event.
+"""
+import hmac
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import contacts_changed
+from .client import BATCH_LIMIT, PAGE_SIZE, get_client
+from .deals import DEAL_FIELDS
+from .models import BitrixContact, BitrixDeal, BitrixEvent
+from .sync import CONTACT_FIELDS, parse_contact, parse_deal, upsert_contacts, upsert_deals
+
+logger = logging.getLogger(__name__)
+
+# Outbound webhook events handled, by the entity they change
+EVENT_ENTITIES = {
+    'ONCRMCONTACTADD': BitrixEvent.ENTITY_CONTACT,
+    'ONCRMCONTACTUPDATE': BitrixEvent.ENTITY_CONTACT,
+    'ONCRMCONTACTDELETE': BitrixEvent.ENTITY_CONTACT,
+    'ONCRMDEALADD': BitrixEvent.ENTITY_DEAL,
+    'ONCRMDEALUPDATE': BitrixEvent.ENTITY_DEAL,
+    'ONCRMDEALDELETE': BitrixEvent.ENTITY_DEAL,
+}
+
+# List method and selected fields used to refetch each entity
+ENTITY_SOURCES = {
+    BitrixEvent.ENTITY_CONTACT: ('crm.contact.list', CONTACT_FIELDS),
+    BitrixEvent.ENTITY_DEAL: ('crm.deal.list', DEAL_FIELDS),
+}
+
+DEFAULT_LIMIT = 5000
+
+
+@dataclass
+class EventResult:
+    """
+    Counts of one process_events pass
+    """
+    events: int = 0
+    upserted: int = 0
+    deleted: int = 0
+
+
+def is_valid_token(token):
+    """
+    Check the application_token sent with an outbound webhook call
+    """
+    expected = getattr(settings, 'BITRIX24_APPLICATION_TOKEN', '')
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(str(token), expected)
+
+
+def fetch_records(client, entity, bitrix_ids):
+    """
+    Return {Bitrix ID: record} for the given IDs that still exist.
+
+    Each list command filters on 50 IDs and a batch carries 50 commands, so
+    one request covers up to 2,500 records.
+    """
+    method, select = ENTITY_SOURCES[entity]
+    chunks = [bitrix_ids[i:i + PAGE_SIZE] for i in range(0, len(bitrix_ids), PAGE_SIZE)]
+
+    records = {}
+    for i in range(0, len(chunks), BATCH_LIMIT):
+        commands = {
+            f'ids_{index}': (method, {'filter': {'@ID': chunk}, 'select': select})
+            for index, chunk in enumerate(chunks[i:i + BATCH_LIMIT], start=i)
+        }
+        batch = client.batch(commands)
+        for rows in batch['result'].values():
+            for row in rows or []:
+                records[int(row['ID'])] = row
+    return records
+
+
+def apply_records(entity, bitrix_ids, records):
+    """
+    Upsert fetched records and remove local rows whose record is gone:
+    contacts are soft-deleted, deals deleted. Returns (upserted, deleted)
+    counts.
+    """
+    missing = [bitrix_id for bitrix_id in bitrix_ids if bitrix_id not in records]
+
+    if entity == BitrixEvent.ENTITY_CONTACT:
+        rows = [row for row in map(parse_contact, records.values()) if row is not None]
+        result = upsert_contacts(rows)
+        now = timezone.now()
+        deleted = BitrixContact.objects.filter(bitrix_id__in=missing, deleted_at__isnull=True).update(
+            deleted_at=now, updated_at=now
+        )
+        if deleted:
+            contacts_changed()
+    else:
+        rows = [row for row in map(parse_deal, records.values()) if row is not None]
+        result = upsert_deals(rows)
+        deleted, _ = BitrixDeal.objects.filter(bitrix_id__in=missing).delete()
+
+    return len(result.created) + len(result.updated), deleted
+
+
+def process_events(limit=DEFAULT_LIMIT, client=None):
+    """
+    Apply up to `limit` queued events and return an EventResult.
+
+    Events are coalesced by (entity, ID): whatever happened to a record, its
+    current state is fetched once, and a record that no longer exists is
+    deleted locally. Events received while a pass runs are left for the next
+    one, and a failed fetch leaves the whole pass queued.
+    """
+    client = client or get_client()
+    result = EventResult()
+
+    events = list(BitrixEvent.objects.order_by('id').values_list('id', 'entity', 'bitrix_id')[:limit])
+    if not events:
+        return result
+
+    changed = {}
+    for _, entity, bitrix_id in events:
+        changed.setdefault(entity, set()).add(bitrix_id)
+
+    fetched = {
+        entity: fetch_records(client, entity, sorted(bitrix_ids))
+        for entity, bitrix_ids in changed.items()
+    }
+
+    with transaction.atomic():
+        for entity, bitrix_ids in changed.items():
+            upserted, deleted = apply_records(entity, bitrix_ids, fetched[entity])
+            result.upserted += upserted
+            result.deleted += deleted
+        BitrixEvent.objects.filter(pk__in=[pk for pk, _, _ in events]).delete()
+
+    result.events = len(events)
+    logger.info(
+        f"Applied {result.events} Bitrix24 events: "
+        f"{result.upserted} records upserted, {result.deleted} deleted"
+    )
+    return result
@@ -0,0 +1,63 @@
+"""
+Streaming export of Bitrix contacts as CSV or NDJSON
+"""
+import csv
+import io
+from itertools import islice
+
+from django.conf import settings
+from ReyadaTasks.renderers import ORJSONRenderer
+from .serializers import BitrixContactSerializer
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _chunks(queryset, chunk_size):
+    # iterator() reads through a server-side cursor on PostgreSQL, so only
+    # one chunk of rows is held in memory at a time
+    rows = queryset.values(*BitrixContactSerializer.VALUE_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield BitrixContactSerializer.from_values(chunk)
+
+
+def _csv_lines(chunks, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # The header goes out before the query runs, so the client gets its
+    # first bytes straight away
+    writer.writerow(fields)
+    yield buffer.getvalue()
+
+    for contacts in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([contact[field] for field in fields] for contact in contacts)
+        yield buffer.getvalue()
+
+
+def _ndjson_lines(chunks, fields):
+    renderer = ORJSONRenderer()
+    for contacts in chunks:
+        yield b''.join(
+            renderer.render({field: contact[field] for field in fields}) + b'\n'
+            for contact in contacts
+        )
+
+
+def export_contacts(queryset, export_format, fields, chunk_size=None):
+    """
+    Return an iterator over the encoded export of `queryset`, one chunk of
+    rows per item, with the values the contacts API returns for `fields`
+    """
+    chunk_size = chunk_size or getattr(settings, 'BITRIX24_EXPORT_CHUNK_SIZE', 2000)
+    chunks = _chunks(queryset.order_by('id'), chunk_size)
+    if export_format == 'ndjson':
+        return _ndjson_lines(chunks, fields)
+    return _csv_lines(chunks, fields)
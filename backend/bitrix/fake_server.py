@@ -0,0 +1,506 @@
+"""
+In-process stand-in for the Bitrix24 REST API, used by the benchmark_bitrix_sync
+command and for trying the sync commands without a live portal.
+
+FakeBitrixServer serves crm.contact.list, crm.contact.add, crm.deal.list and
+batch over HTTP on localhost with the same request and response shapes as a
+webhook URL. Contacts and deals are generated on demand from their index, so
+a portal of a million contacts costs no memory until records are changed.
+Latency, rate limiting and error injection are configurable.
+"""
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from django.utils.dateparse import parse_datetime
+
+from .client import BATCH_LIMIT, PAGE_SIZE
+
+# Records are timestamped one second apart from this moment
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+DEAL_STAGES = ['NEW', 'PREPARATION', 'UC_3MCI1C', 'WON']
+
+FIRST_NAMES = ['Ahmed', 'Sara', 'Omar', 'Lina', 'Youssef', 'Mona', 'Karim', 'Nour', 'Hassan', 'Rana']
+LAST_NAMES = ['Haddad', 'Khalil', 'Nasser', 'Saleh', 'Mansour', 'Farouk', 'Aziz', 'Darwish', 'Hamdan', 'Sallal']
+
+
+def parse_php_query(query):
+    """
+    Decode a PHP-style query string (filter[>=DATE_MODIFY]=...&select[0]=ID)
+    into nested dicts and lists, the inverse of client.http_build_query
+    """
+    params = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        name, _, rest = key.partition('[')
+        parts = [name] + (rest[:-1].split('][') if rest else [])
+        target = params
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return _listify(params)
+
+
+def _listify(value):
+    if not isinstance(value, dict):
+        return value
+    value = {key: _listify(item) for key, item in value.items()}
+    if value and all(key.isdigit() for key in value):
+        return [value[key] for key in sorted(value, key=int)]
+    return value
+
+
+def format_datetime(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def _modified_filters(filters):
+    # (operator, datetime) for every DATE_MODIFY comparison in a filter
+    return [
+        (key[:-len('DATE_MODIFY')], parse_datetime(value))
+        for key, value in filters.items()
+        if key.endswith('DATE_MODIFY') and key[:-len('DATE_MODIFY')] in ('>=', '>', '<=', '<')
+    ]
+
+
+def _compare(left, operator, right):
+    return {
+        '>=': left >= right, '>': left > right, '<=': left <= right, '<': left < right,
+    }[operator]
+
+
+class FakeBitrixError(Exception):
+    def __init__(self, code, description='', status=400):
+        self.code = code
+        self.description = description
+        self.status = status
+        super().__init__(code)
+
+
+class FakeBitrixServer:
+    """
+    Fake Bitrix24 portal served from a background thread.
+
+    Use it as a context manager, or call start() and stop(), and point
+    BitrixClient at `url`.
+
+    contacts, deals   number of generated records
+    latency           seconds added to every response
+    rate_limit, burst requests per second accepted before answering 503
+                      QUERY_LIMIT_EXCEEDED (None disables the limit)
+    error_rate        fraction of requests answered with HTTP 500
+    missing_email_every
+                      every Nth contact has no email (0 gives all an email)
+    """
+
+    def __init__(self, contacts=10000, deals=1000, latency=0.0, rate_limit=None, burst=50,
+                 error_rate=0.0, missing_email_every=20, seed=0):
+        self.contact_count = contacts
+        self.deal_count = deals
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.error_rate = error_rate
+        self.missing_email_every = missing_email_every
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self._tokens = float(burst)
+        self._tokens_updated = time.monotonic()
+
+        # Contacts and deals changed since generation, by index
+        self._contacts = {}
+        self._deals = {}
+        self._deleted = set()
+        self._deleted_deals = set()
+        self._version = 0
+        self._id_cache = {}
+
+        self._server = None
+        self._thread = None
+
+    # Lifecycle
+
+    def start(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        server.daemon_threads = True
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, name='fake-bitrix', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/rest/1/fake'
+
+    # Stats
+
+    def stats(self):
+        """
+        Return counters: requests, rate_limited, errors, batch_commands and
+        calls:<method>
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    # Data
+
+    def contact(self, index):
+        """
+        Return the contact at `index` as crm.contact.list would
+        """
+        if index in self._contacts:
+            return self._contacts[index]
+        number = index + 1
+        contact = {
+            'ID': str(number),
+            'NAME': FIRST_NAMES[index % len(FIRST_NAMES)],
+            'LAST_NAME': LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)],
+            'EMAIL': [{'VALUE': f'contact{number}@example.com', 'VALUE_TYPE': 'WORK'}],
+            'PHONE': [{'VALUE': f'+1 555 {number:07d}', 'VALUE_TYPE': 'WORK'}],
+            'DATE_MODIFY': format_datetime(BASE_TIME + timedelta(seconds=index)),
+        }
+        if self.missing_email_every and number % self.missing_email_every == 0:
+            contact['EMAIL'] = []
+        return contact
+
+    def deal(self, index):
+        """
+        Return the deal at `index` as crm.deal.list would
+        """
+        if index in self._deals:
+            return self._deals[index]
+        number = index + 1
+        created = BASE_TIME + timedelta(seconds=index)
+        return {
+            'ID': str(number),
+            'TITLE': f'Deal {number}',
+            'STAGE_ID': DEAL_STAGES[index % len(DEAL_STAGES)],
+            'OPPORTUNITY': f'{(number * 37) % 10000}.00',
+            'CURRENCY_ID': 'USD',
+            'CONTACT_ID': str(index % max(self.contact_count, 1) + 1),
+            'COMPANY_ID': '0',
+            'DATE_CREATE': format_datetime(created),
+            'DATE_MODIFY': format_datetime(created),
+        }
+
+    def touch_contacts(self, count):
+        """
+        Modify `count` evenly spread contacts, as edits in the portal would,
+        and return their IDs
+        """
+        step = max(self.contact_count // max(count, 1), 1)
+        indexes = [index for index in range(0, self.contact_count, step) if index not in self._deleted][:count]
+        modified = datetime.now(timezone.utc)
+        with self._lock:
+            for index in indexes:
+                contact = dict(self.contact(index))
+                contact['NAME'] = f"{contact['NAME']} (edited)"
+                contact['DATE_MODIFY'] = format_datetime(modified)
+                self._contacts[index] = contact
+            self._version += 1
+        return [index + 1 for index in indexes]
+
+    def touch_deals(self, ids):
+        """
+        Modify deals by Bitrix ID, as edits in the portal would
+        """
+        modified = datetime.now(timezone.utc)
+        with self._lock:
+            for bitrix_id in ids:
+                index = int(bitrix_id) - 1
+                deal = dict(self.deal(index))
+                deal['TITLE'] = f"{deal['TITLE']} (edited)"
+                deal['DATE_MODIFY'] = format_datetime(modified)
+                self._deals[index] = deal
+            self._version += 1
+
+    def delete_contacts(self, ids):
+        """
+        Remove contacts by Bitrix ID
+        """
+        with self._lock:
+            self._deleted.update(int(bitrix_id) - 1 for bitrix_id in ids)
+            self._version += 1
+
+    def delete_deals(self, ids):
+        """
+        Remove deals by Bitrix ID
+        """
+        with self._lock:
+            self._deleted_deals.update(int(bitrix_id) - 1 for bitrix_id in ids)
+            self._version += 1
+
+    # Request handling
+
+    def _take_token(self):
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._tokens_updated) * self.rate_limit)
+        self._tokens_updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def handle(self, method, params):
+        """
+        Answer one REST call and return (HTTP status, response body)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats[f'calls:{method}'] += 1
+            if not self._take_token():
+                self._stats['rate_limited'] += 1
+                return 503, {'error': 'QUERY_LIMIT_EXCEEDED', 'error_description': 'Too many requests'}
+            if self.error_rate and self._random.random() < self.error_rate:
+                self._stats['errors'] += 1
+                return 500, {'error': 'INTERNAL_SERVER_ERROR', 'error_description': 'Injected error'}
+
+        try:
+            if method == 'batch':
+                return 200, {'result': self._batch(params)}
+            return 200, self._call(method, params)
+        except FakeBitrixError as e:
+            return e.status, {'error': e.code, 'error_description': e.description}
+
+    def _call(self, method, params):
+        if method == 'crm.contact.list':
+            return self._list(params, self._contact_ids, self.contact)
+        if method == 'crm.deal.list':
+            return self._list(params, self._deal_ids, self.deal)
+        if method == 'crm.contact.add':
+            return {'result': self._contact_add(params.get('fields') or {})}
+        raise FakeBitrixError('ERROR_METHOD_NOT_FOUND', 'Method not found!', status=404)
+
+    def _batch(self, params):
+        commands = params.get('cmd') or {}
+        if len(commands) > BATCH_LIMIT:
+            raise FakeBitrixError('ERROR_BATCH_LENGTH_EXCEEDED', 'Max batch length exceeded')
+        halt = str(params.get('halt', '0')) not in ('0', '', 'false')
+        with self._lock:
+            self._stats['batch_commands'] += len(commands)
+
+        sections = {'result': {}, 'result_error': {}, 'result_total': {}, 'result_next': {}}
+        for key, command in commands.items():
+            method, _, query = command.partition('?')
+            try:
+                data = self._call(method, parse_php_query(query))
+            except FakeBitrixError as e:
+                sections['result_error'][key] = {'error': e.code, 'error_description': e.description}
+                if halt:
+                    break
+                continue
+            sections['result'][key] = data['result']
+            if 'total' in data:
+                sections['result_total'][key] = data['total']
+            if 'next' in data:
+                sections['result_next'][key] = data['next']
+
+        # Bitrix24 is a PHP app and encodes empty maps as []
+        return {name: section or [] for name, section in sections.items()}
+
+    def _list(self, params, select_ids, record):
+        ids = select_ids(params.get('filter') or {}, params.get('order') or {})
+        try:
+            start = int(params.get('start') or 0)
+        except ValueError:
+            start = 0
+
+        # start=-1 skips counting, so the response has no total or next
+        count_total = start >= 0
+        start = max(start, 0)
+
+        fields = params.get('select') or []
+        rows = []
+        for index in ids[start:start + PAGE_SIZE]:
+            row = record(index)
+            if fields and '*' not in fields:
+                row = {name: value for name, value in row.items() if name in fields or name == 'ID'}
+            rows.append(row)
+
+        if not count_total:
+            return {'result': rows}
+        data = {'result': rows, 'total': len(ids)}
+        if start + PAGE_SIZE < len(ids):
+            data['next'] = start + PAGE_SIZE
+        return data
+
+    def _cached_ids(self, kind, filters, order, build):
+        key = (kind, json.dumps(filters, sort_keys=True), json.dumps(order, sort_keys=True), self._version)
+        ids = self._id_cache.get(key)
+        if ids is None:
+            ids = build()
+            # Only the most recent queries are worth keeping
+            if len(self._id_cache) > 32:
+                self._id_cache.clear()
+            self._id_cache[key] = ids
+        return ids
+
+    def _contact_ids(self, filters, order):
+        def build():
+            if '@ID' in filters or 'ID' in filters:
+                wanted = filters.get('@ID') or [filters.get('ID')]
+                candidates = sorted({int(bitrix_id) - 1 for bitrix_id in wanted})
+                candidates = [index for index in candidates if 0 <= index < self.contact_count]
+            elif '@ORIGIN_ID' in filters or 'ORIGIN_ID' in filters:
+                wanted = set(filters.get('@ORIGIN_ID') or [filters.get('ORIGIN_ID')])
+                candidates = sorted(
+                    index for index, contact in self._contacts.items()
+                    if contact.get('ORIGIN_ID') in wanted
+                )
+            else:
+                # IDs are index + 1, so >ID=n starts at index n
+                start = int(filters.get('>ID') or 0)
+                stop = self.contact_count
+                modified = _modified_filters(filters)
+                # Generated contacts are timestamped one second apart in index order
+                for operator, value in modified:
+                    seconds = (value - BASE_TIME).total_seconds()
+                    if operator == '>=':
+                        start = max(start, math.ceil(seconds))
+                    elif operator == '>':
+                        start = max(start, math.floor(seconds) + 1)
+                    elif operator == '<=':
+                        stop = min(stop, math.floor(seconds) + 1)
+                    else:
+                        stop = min(stop, math.ceil(seconds))
+                candidates = range(start, max(start, stop))
+                if not self._contacts and not self._deleted:
+                    return candidates
+                candidates = [index for index in candidates if index not in self._contacts]
+                candidates += [
+                    index for index, contact in self._contacts.items()
+                    if index >= int(filters.get('>ID') or 0) and all(
+                        _compare(parse_datetime(contact['DATE_MODIFY']), operator, value)
+                        for operator, value in modified
+                    )
+                ]
+                candidates.sort()
+
+            ids = [index for index in candidates if index not in self._deleted]
+            if 'DATE_MODIFY' in order:
+                ids.sort(key=lambda index: (self.contact(index)['DATE_MODIFY'], index))
+            return ids
+
+        return self._cached_ids('contact', filters, order, build)
+
+    def _deal_ids(self, filters, order):
+        def build():
+            ids = range(self.deal_count)
+            if 'STAGE_ID' in filters:
+                if filters['STAGE_ID'] not in DEAL_STAGES:
+                    return []
+                ids = range(DEAL_STAGES.index(filters['STAGE_ID']), self.deal_count, len(DEAL_STAGES))
+            if '@ID' in filters or 'ID' in filters:
+                wanted = {int(bitrix_id) - 1 for bitrix_id in filters.get('@ID') or [filters.get('ID')]}
+                ids = [index for index in ids if index in wanted]
+            if '>ID' in filters:
+                ids = [index for index in ids if index >= int(filters['>ID'])]
+            modified = _modified_filters(filters)
+            if modified:
+                ids = [
+                    index for index in ids
+                    if all(
+                        _compare(parse_datetime(self.deal(index)['DATE_MODIFY']), operator, value)
+                        for operator, value in modified
+                    )
+                ]
+            if self._deleted_deals:
+                ids = [index for index in ids if index not in self._deleted_deals]
+            ids = list(ids)
+            if 'DATE_MODIFY' in order:
+                ids.sort(key=lambda index: (self.deal(index)['DATE_MODIFY'], index))
+            elif order.get('ID') == 'DESC':
+                ids = ids[::-1]
+            return ids
+
+        return self._cached_ids('deal', filters, order, build)
+
+    def _contact_add(self, fields):
+        if not fields.get('NAME') and not fields.get('LAST_NAME'):
+            raise FakeBitrixError('ERROR_CORE', 'Name or last name is required')
+        with self._lock:
+            index = self.contact_count
+            self.contact_count += 1
+            self._contacts[index] = {
+                'ID': str(index + 1),
+                'NAME': fields.get('NAME', ''),
+                'LAST_NAME': fields.get('LAST_NAME', ''),
+                'EMAIL': fields.get('EMAIL') or [],
+                'PHONE': fields.get('PHONE') or [],
+                'ORIGINATOR_ID': fields.get('ORIGINATOR_ID'),
+                'ORIGIN_ID': fields.get('ORIGIN_ID'),
+                'DATE_MODIFY': format_datetime(datetime.now(timezone.utc)),
+            }
+            self._version += 1
+        return index + 1
+
+    def _handler_class(self):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; without this every
+            # keep-alive response waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def _respond(self, params):
+                path = urlsplit(self.path).path
+                method = path.rsplit('/', 1)[-1]
+                if method.endswith('.json'):
+                    method = method[:-len('.json')]
+
+                status, body = portal.handle(method, params)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond(parse_php_query(urlsplit(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode() if length else ''
+                if 'json' in (self.headers.get('Content-Type') or ''):
+                    params = json.loads(body or '{}')
+                else:
+                    params = parse_php_query(body)
+                self._respond(params)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,126 @@
+"""
+Rate limiting and concurrent execution of Bitrix24 REST calls
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Bitrix24 allows roughly 2 requests per second per portal with a burst allowance
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 50
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `burst`
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        Block until a token is available and take it
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for `seconds` and drop the saved burst, so every
+        thread backs off together after the portal reports the limit
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = 0.0
+            self._updated = now
+            self._paused_until = max(self._paused_until, now + seconds)
+
+
+class ConcurrentFetcher:
+    """
+    Runs Bitrix24 calls on a thread pool, keeping at most `concurrency`
+    requests in flight. Rate limiting and retries are applied by the
+    BitrixClient each call goes through.
+    """
+
+    def __init__(self, concurrency=1):
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        self.concurrency = concurrency
+
+    def map(self, func, items):
+        """
+        Yield func(item) for every item in input order.
+
+        Only `concurrency` calls are queued at a time, so results are consumed
+        as they arrive instead of being collected up front.
+        """
+        if self.concurrency == 1:
+            for item in items:
+                yield func(item)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = deque()
+            try:
+                for item in items:
+                    in_flight.append(executor.submit(func, item))
+                    if len(in_flight) >= self.concurrency:
+                        yield in_flight.popleft().result()
+                while in_flight:
+                    yield in_flight.popleft().result()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Return the process-wide limiter shared by every Bitrix24 caller.
+
+    The bucket is per process, so BITRIX24_RATE_LIMIT should be set to the
+    share of the portal budget each process may use.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TokenBucket(
+                rate=getattr(settings, 'BITRIX24_RATE_LIMIT', DEFAULT_RATE),
+                burst=getattr(settings, 'BITRIX24_RATE_BURST', DEFAULT_BURST),
+            )
+        return _limiter
+
+
+def reset_rate_limiter():
+    """
+    Drop the process-wide limiter so the next caller rebuilds it from settings
+    """
+    global _limiter
+    with _limiter_lock:
+        _limiter = None
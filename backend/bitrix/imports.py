@@ -0,0 +1,258 @@
+"""
+Import of contact lists from CSV or XLSX files.
+
+Files are read as a stream and processed in chunks: each chunk is validated
+with the BitrixContactSerializer rules and upserted by normalized email in
+its own transaction, and rejected rows are written to an error report.
+"""
+import csv
+import io
+import zipfile
+from dataclasses import dataclass
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .bulk import validate_contacts
+from .cache import contacts_changed
+from .models import BitrixContact, BitrixOutbox, refresh_search_tokens
+from .outbox import contact_fields, enqueue_contact_adds
+
+try:
+    import openpyxl
+except ImportError:  # Optional, only needed for XLSX files
+    openpyxl = None
+
+IMPORT_FORMATS = ['csv', 'xlsx']
+
+# Columns read from the file, matched case-insensitively; the header of a
+# contacts export works as is
+IMPORT_COLUMNS = ['name', 'last_name', 'email', 'phone']
+
+# Columns written when an import changes an existing contact
+IMPORT_UPDATE_FIELDS = ['name', 'last_name', 'phone'] + BitrixContact.SEARCH_FIELDS + ['updated_at']
+
+REPORT_COLUMNS = ['row'] + IMPORT_COLUMNS + ['errors']
+
+
+class ImportFileError(Exception):
+    """
+    The file cannot be read as a contact list
+    """
+
+
+@dataclass
+class ImportResult:
+    """
+    Counts of rows handled by one import
+    """
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    rejected: int = 0
+
+
+def detect_format(filename):
+    """
+    Return the import format matching a file name's extension, or None
+    """
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def read_contact_file(file, file_format):
+    """
+    Yield (row number, record) for every non-empty row of a binary file
+    object, where row 1 is the header and records map the IMPORT_COLUMNS
+    found in the header to the row's values
+    """
+    if file_format == 'xlsx':
+        return _xlsx_rows(file)
+    return _csv_rows(file)
+
+
+def _csv_rows(file):
+    # Decoded as it is read; a BOM left by Excel is skipped
+    reader = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    try:
+        yield from _records(reader)
+    except UnicodeDecodeError:
+        raise ImportFileError('The file is not UTF-8 encoded CSV.')
+
+
+def _xlsx_rows(file):
+    if openpyxl is None:
+        raise ImportFileError('openpyxl is required to import XLSX files.')
+    try:
+        # read_only parses the sheet as it is iterated instead of loading it
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError):
+        raise ImportFileError('The file is not a valid XLSX workbook.')
+    try:
+        yield from _records(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def _records(rows):
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The file is empty.')
+    columns = [_cell_text(value).lower().replace(' ', '_') for value in header]
+    if 'email' not in columns:
+        raise ImportFileError('The file has no email column.')
+    positions = {column: columns.index(column) for column in IMPORT_COLUMNS if column in columns}
+
+    for number, values in enumerate(rows, start=2):
+        # Blank cells are kept as '', so the serializer rules apply to them
+        record = {
+            column: _cell_text(values[position]) if position < len(values) else ''
+            for column, position in positions.items()
+        }
+        if any(record.values()):
+            yield number, record
+
+
+def _cell_text(value):
+    # Spreadsheets store numbers such as phones as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return '' if value is None else str(value).strip()
+
+
+def _format_errors(errors):
+    return '; '.join(
+        f"{field}: {' '.join(str(message) for message in messages)}"
+        for field, messages in errors.items()
+    )
+
+
+def import_contacts(rows, chunk_size=None, report=None, dry_run=False, progress=None):
+    """
+    Validate and upsert contacts from (row number, record) pairs, as yielded
+    by read_contact_file(), `chunk_size` rows at a time.
+
+    New emails are created as pending contacts and queued for Bitrix24
+    through the outbox. Contacts that are not in Bitrix24 yet are updated,
+    with the payload of their pending outbox entry. Contacts already in
+    Bitrix24 are skipped, as they can only be changed there. Each chunk is
+    committed on its own, so a file that stops halfway can be imported again.
+
+    Rejected rows, including repeats of an email seen earlier in the file,
+    are written as CSV to the `report` text file. `progress` is called with
+    the running ImportResult after every chunk. Returns the ImportResult.
+    """
+    chunk_size = chunk_size or getattr(settings, 'BITRIX24_IMPORT_CHUNK_SIZE', 1000)
+    result = ImportResult()
+    writer = csv.writer(report) if report is not None else None
+    if writer:
+        writer.writerow(REPORT_COLUMNS)
+
+    # Only the emails are kept across chunks, to reject repeats
+    seen = set()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        records = [record for _, record in chunk]
+        valid, errors = validate_contacts(records, seen)
+        seen.update(valid)
+
+        for index, row_errors in errors.items():
+            number, record = chunk[index]
+            if writer:
+                writer.writerow([number] + [record.get(column, '') for column in IMPORT_COLUMNS] + [_format_errors(row_errors)])
+
+        created, updated, skipped = _upsert_chunk(valid, dry_run)
+        result.rows += len(chunk)
+        result.rejected += len(errors)
+        result.created += created
+        result.updated += updated
+        result.skipped += skipped
+        result.unchanged += len(valid) - created - updated - skipped
+        if progress:
+            progress(result)
+
+    return result
+
+
+def _upsert_chunk(valid, dry_run):
+    """
+    Write one chunk of validated contacts; returns the numbers created,
+    updated and skipped
+    """
+    if not valid:
+        return 0, 0, 0
+
+    # As in bulk.create_contacts, a contact created concurrently since the
+    # lookup fails the insert, and the second lookup finds it
+    for attempt in range(2):
+        existing = {
+            email: (pk, bitrix_id, {'name': name, 'last_name': last_name, 'phone': phone})
+            for email, pk, bitrix_id, name, last_name, phone in BitrixContact.objects.filter(
+                email__in=list(valid)
+            ).values_list('email', 'pk', 'bitrix_id', 'name', 'last_name', 'phone')
+        }
+
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        skipped = 0
+        for email, (_, data) in valid.items():
+            # Only the columns the file has are written; blank optional
+            # values are stored as NULL, as when the API is called without them
+            fields = {field: data[field] or None for field in ['name', 'last_name', 'phone'] if field in data}
+            if email not in existing:
+                contact = BitrixContact(email=email, **fields, sync_status=BitrixContact.SYNC_PENDING)
+                contact.refresh_search_fields()
+                to_create.append(contact)
+                continue
+
+            pk, bitrix_id, current = existing[email]
+            if all(current[field] == value for field, value in fields.items()):
+                continue
+            if bitrix_id is not None:
+                skipped += 1
+                continue
+            # bulk_update bypasses auto_now, so updated_at is set here
+            contact = BitrixContact(pk=pk, email=email, **{**current, **fields}, updated_at=now)
+            contact.refresh_search_fields()
+            to_update.append(contact)
+
+        if dry_run or not (to_create or to_update):
+            break
+        try:
+            with transaction.atomic():
+                BitrixContact.objects.bulk_create(to_create)
+                enqueue_contact_adds(to_create)
+                BitrixContact.objects.bulk_update(to_update, IMPORT_UPDATE_FIELDS)
+                refresh_search_tokens(to_create + to_update)
+                _refresh_outbox_payloads(to_update, now)
+                contacts_changed()
+        except IntegrityError:
+            if attempt:
+                raise
+        else:
+            break
+
+    return len(to_create), len(to_update), skipped
+
+
+def _refresh_outbox_payloads(contacts, now):
+    # Updated contacts are not in Bitrix24 yet; their pending entries must
+    # push the new values
+    by_pk = {contact.pk: contact for contact in contacts}
+    entries = list(
+        BitrixOutbox.objects.filter(contact_id__in=list(by_pk), status=BitrixOutbox.STATUS_PENDING)
+        .only('pk', 'contact_id')
+    )
+    for entry in entries:
+        entry.payload = contact_fields(by_pk[entry.contact_id])
+        entry.updated_at = now
+    BitrixOutbox.objects.bulk_update(entries, ['payload', 'updated_at'])
@@ -0,0 +1,304 @@
+import json
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.test import APIRequestFactory, force_authenticate
+from bitrix.client import reset_client
+from bitrix.fake_server import FakeBitrixServer
+from bitrix.outbox import process_outbox
+from bitrix.views import BitrixContactViewSet
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+SCENARIOS = ['full', 'batch', 'concurrent', 'incremental', 'deals', 'create']
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'bitrix_sync.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the Bitrix24 sync paths against a local fake portal and '
+        'compare the results with saved baselines. Runs in a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=SCENARIOS,
+            help=f'Scenario to run, may be repeated (default: all of {", ".join(SCENARIOS)})',
+        )
+        parser.add_argument(
+            '--contacts',
+            type=int,
+            default=10000,
+            help='Number of contacts in the fake portal (default: 10000)',
+        )
+        parser.add_argument(
+            '--deals',
+            type=int,
+            default=1000,
+            help='Number of deals in the fake portal (default: 1000)',
+        )
+        parser.add_argument(
+            '--creates',
+            type=int,
+            default=200,
+            help='Number of contacts posted by the create scenario (default: 200)',
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Seconds the fake portal waits before each response (default: 0)',
+        )
+        parser.add_argument(
+            '--portal-rate',
+            type=float,
+            default=None,
+            help='Requests per second the fake portal accepts before QUERY_LIMIT_EXCEEDED (default: unlimited)',
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests the fake portal fails with HTTP 500 (default: 0)',
+        )
+        parser.add_argument(
+            '--client-rate',
+            type=float,
+            default=1000.0,
+            help='Client-side rate limit in requests per second (default: 1000)',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=str(DEFAULT_BASELINE),
+            help='Baseline file to compare with (default: benchmarks/bitrix_sync.json)',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Store these results as the new baseline',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed relative regression before the command fails (default: 0.2)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON',
+        )
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or SCENARIOS
+        if options['contacts'] < 1 or options['deals'] < 1 or options['creates'] < 1:
+            raise CommandError('--contacts, --deals and --creates must be positive integers')
+        if not 0 <= options['error_rate'] < 1:
+            raise CommandError('--error-rate must be between 0 and 1')
+        if options['client_rate'] <= 0:
+            raise CommandError('--client-rate must be a positive number')
+
+        server = FakeBitrixServer(
+            contacts=options['contacts'],
+            deals=options['deals'],
+            latency=options['latency'],
+            rate_limit=options['portal_rate'],
+            error_rate=options['error_rate'],
+        )
+
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            # DEBUG would keep every query's SQL in memory and skew the figures
+            with server, override_settings(
+                DEBUG=False,
+                BITRIX24_BASE_URL=server.url,
+                BITRIX24_RATE_LIMIT=options['client_rate'],
+                BITRIX24_RATE_BURST=max(int(options['client_rate']), 1),
+            ):
+                reset_client()
+                try:
+                    results = {
+                        name: self._measure(server, name, options)
+                        for name in scenarios
+                    }
+                finally:
+                    reset_client()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        def key(name):
+            # Results only compare between runs over the same portal size
+            return f"{name}@{options['contacts']}"
+
+        baseline_path = Path(options['baseline'])
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(key(name))
+            if previous:
+                regressions += self._compare(name, result, previous, options['tolerance'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for name, result in results.items():
+                self._report(name, result, baseline.get(key(name)))
+
+        if options['save_baseline']:
+            baseline.update({key(name): result for name, result in results.items()})
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline_path}'))
+        elif regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+
+    def _measure(self, server, name, options):
+        """
+        Run one scenario and return its metrics
+        """
+        prepare, run = getattr(self, f'_scenario_{name}')(server, options)
+        prepare()
+        server.reset_stats()
+
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            started = time.perf_counter()
+            rows = run()
+            elapsed = time.perf_counter() - started
+
+        stats = server.stats()
+        return {
+            'rows': rows,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+            'requests': stats.get('requests', 0),
+            'rate_limited': stats.get('rate_limited', 0),
+            'errors': stats.get('errors', 0),
+            'db_queries': queries,
+            'peak_rss_mb': self._peak_rss(),
+        }
+
+    def _peak_rss(self):
+        if resource is None:
+            return None
+        # ru_maxrss is the peak of the whole process, in kilobytes on Linux
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    def _compare(self, name, result, previous, tolerance):
+        regressions = []
+        if previous.get('rows_per_second') and result['rows_per_second'] is not None:
+            if result['rows_per_second'] < previous['rows_per_second'] * (1 - tolerance):
+                regressions.append(
+                    f"{name}: {result['rows_per_second']} rows/s, baseline {previous['rows_per_second']}"
+                )
+        for metric in ('requests', 'db_queries'):
+            if previous.get(metric) is not None and result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {result[metric]} {metric}, baseline {previous[metric]}")
+        return regressions
+
+    def _report(self, name, result, previous):
+        line = (
+            f"{name:<12} {result['rows']:>8} rows  {result['seconds']:>8.3f}s  "
+            f"{result['rows_per_second'] or 0:>10.1f} rows/s  "
+            f"{result['requests']:>6} requests  {result['db_queries']:>6} queries  "
+            f"{result['peak_rss_mb'] or 0:>7.1f} MB peak RSS"
+        )
+        if result['rate_limited'] or result['errors']:
+            line += f"  ({result['rate_limited']} rate limited, {result['errors']} errors)"
+        if previous and previous.get('rows_per_second') and result['rows_per_second']:
+            change = result['rows_per_second'] / previous['rows_per_second'] - 1
+            line += f"  {change:+.0%} vs baseline"
+        self.stdout.write(line)
+
+    # Scenarios return (prepare, run); only run is measured, and it returns
+    # the number of rows handled
+
+    def _reset(self):
+        # Truncating the test database avoids loading every row to cascade deletes
+        call_command('flush', interactive=False, verbosity=0)
+
+    def _sync_contacts(self, *args):
+        call_command('sync_bitrix_contacts', *args, stdout=StringIO())
+
+    def _scenario_full(self, server, options):
+        def run():
+            self._sync_contacts()
+            return server.contact_count
+        return self._reset, run
+
+    def _scenario_batch(self, server, options):
+        def run():
+            self._sync_contacts('--batch')
+            return server.contact_count
+        return self._reset, run
+
+    def _scenario_concurrent(self, server, options):
+        def run():
+            self._sync_contacts('--concurrency', '4')
+            return server.contact_count
+        return self._reset, run
+
+    def _scenario_incremental(self, server, options):
+        touched = []
+
+        def prepare():
+            self._reset()
+            self._sync_contacts('--batch')
+            touched[:] = server.touch_contacts(max(server.contact_count // 100, 1))
+
+        def run():
+            self._sync_contacts('--incremental')
+            return len(touched)
+        return prepare, run
+
+    def _scenario_deals(self, server, options):
+        def run():
+            call_command('sync_bitrix_deals', stdout=StringIO())
+            return server.deal_count
+        return self._reset, run
+
+    def _scenario_create(self, server, options):
+        factory = APIRequestFactory()
+        view = BitrixContactViewSet.as_view({'post': 'create'})
+        user = []
+
+        def prepare():
+            self._reset()
+            user[:] = [get_user_model().objects.get_or_create(email='benchmark@example.com')[0]]
+
+        def run():
+            for number in range(options['creates']):
+                request = factory.post('/api/bitrix-contacts/', {
+                    'name': 'Benchmark',
+                    'last_name': f'Contact {number}',
+                    'email': f'benchmark{number}@example.com',
+                }, format='json')
+                force_authenticate(request, user=user[0])
+                response = view(request)
+                if response.status_code != 201:
+                    raise CommandError(f'Create failed with {response.status_code}: {response.data}')
+            while process_outbox(limit=500).synced:
+                pass
+            return options['creates']
+        return prepare, run
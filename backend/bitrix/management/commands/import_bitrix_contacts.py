@@ -0,0 +1,85 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from bitrix.imports import IMPORT_FORMATS, ImportFileError, detect_format, import_contacts, read_contact_file
+
+
+class Command(BaseCommand):
+    help = 'Import contacts from a CSV or XLSX file, upserting them by email'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file with name, last_name, email and phone columns')
+        parser.add_argument(
+            '--format',
+            choices=IMPORT_FORMATS,
+            default=None,
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Rows validated and written per transaction (default: BITRIX24_IMPORT_CHUNK_SIZE)',
+        )
+        parser.add_argument(
+            '--report',
+            default=None,
+            help='CSV file for rejected rows and their errors (default: PATH.errors.csv)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the file and report what would change without writing',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        if file_format is None:
+            raise CommandError('Cannot tell the file format from its extension; pass --format')
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be a positive integer')
+        report_path = options['report'] or f'{path}.errors.csv'
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        def progress(result):
+            self.stdout.write(
+                f'{result.rows} rows: {result.created} created, {result.updated} updated, '
+                f'{result.rejected} rejected'
+            )
+
+        try:
+            with open(path, 'rb') as file, open(report_path, 'w', encoding='utf-8', newline='') as report:
+                result = import_contacts(
+                    read_contact_file(file, file_format),
+                    chunk_size=options['chunk_size'],
+                    report=report,
+                    dry_run=options['dry_run'],
+                    progress=progress,
+                )
+        except ImportFileError as e:
+            os.remove(report_path)
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected rows written to {report_path}'))
+        else:
+            os.remove(report_path)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Import completed! '
+                f'Rows: {result.rows}, '
+                f'Created: {result.created}, '
+                f'Updated: {result.updated}, '
+                f'Unchanged: {result.unchanged}, '
+                f'Skipped (already in Bitrix24): {result.skipped}, '
+                f'Rejected: {result.rejected}'
+            )
+        )
+        if result.created and not options['dry_run']:
+            self.stdout.write('New contacts are queued; run process_bitrix_outbox to push them to Bitrix24')
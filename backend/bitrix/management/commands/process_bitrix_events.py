@@ -0,0 +1,64 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from bitrix.client import BitrixError
+from bitrix.events import DEFAULT_LIMIT, process_events
+
+
+class Command(BaseCommand):
+    help = 'Apply queued Bitrix24 webhook events, refetching changed records in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=DEFAULT_LIMIT,
+            help=f'Maximum number of events applied per pass (default: {DEFAULT_LIMIT})',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep applying events instead of exiting after one pass',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help=(
+                'Seconds to wait between passes in --loop mode; events arriving '
+                'meanwhile are coalesced into the next pass (default: 2)'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        if limit < 1:
+            raise CommandError('--limit must be a positive integer')
+
+        while True:
+            try:
+                result = process_events(limit=limit)
+            except (requests.RequestException, BitrixError) as e:
+                if not options['loop']:
+                    raise CommandError(f'Failed to fetch data from Bitrix24 API: {e}')
+                # The events stay queued and are retried on the next pass
+                self.stderr.write(f'Failed to fetch data from Bitrix24 API: {e}')
+                time.sleep(options['interval'])
+                continue
+
+            if result.events:
+                self.stdout.write(
+                    f'Events: {result.events}, '
+                    f'Upserted: {result.upserted}, '
+                    f'Deleted: {result.deleted}'
+                )
+
+            if not options['loop']:
+                if not result.events:
+                    self.stdout.write('No events queued')
+                return
+
+            # Go straight to the next pass while a full batch was claimed
+            if result.events < limit:
+                time.sleep(options['interval'])
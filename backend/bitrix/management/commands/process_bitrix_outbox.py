@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bitrix.outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending Bitrix24 writes recorded in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=100,
+            help='Maximum number of entries delivered per pass (default: 100)',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=None,
+            help='Dead-letter entries after this many failed attempts (default: BITRIX24_OUTBOX_MAX_ATTEMPTS)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep draining the outbox instead of exiting after one pass',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to sleep between passes when the outbox is empty in --loop mode (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        max_attempts = options['max_attempts']
+
+        if limit < 1:
+            raise CommandError('--limit must be a positive integer')
+        if max_attempts is not None and max_attempts < 1:
+            raise CommandError('--max-attempts must be a positive integer')
+
+        while True:
+            result = process_outbox(limit=limit, max_attempts=max_attempts)
+            handled = result.synced + result.retried + result.dead
+
+            if handled:
+                self.stdout.write(
+                    f'Synced: {result.synced}, '
+                    f'Retrying: {result.retried}, '
+                    f'Dead-lettered: {result.dead}'
+                )
+
+            if not options['loop']:
+                if not handled:
+                    self.stdout.write('Outbox is empty')
+                return
+
+            # Go straight to the next pass while a full batch was claimed
+            if handled < limit:
+                time.sleep(options['interval'])
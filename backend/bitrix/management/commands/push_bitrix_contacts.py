@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from bitrix.models import BitrixContact, BitrixOutbox
+from bitrix.outbox import enqueue_unsynced_contacts, process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Push local contacts that are not in Bitrix24 yet, 50 per batch request'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=500,
+            help='Number of contacts claimed per pass (default: 500)',
+        )
+        parser.add_argument(
+            '--include-failed',
+            action='store_true',
+            help='Also queue contacts whose previous push was dead-lettered',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many contacts would be pushed',
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        if limit < 1:
+            raise CommandError('--limit must be a positive integer')
+
+        if options['dry_run']:
+            statuses = [BitrixContact.SYNC_PENDING]
+            if options['include_failed']:
+                statuses.append(BitrixContact.SYNC_FAILED)
+            count = BitrixContact.objects.filter(bitrix_id__isnull=True, sync_status__in=statuses).count()
+            self.stdout.write(self.style.WARNING(f'[DRY RUN] Would push {count} contacts'))
+            return
+
+        queued = enqueue_unsynced_contacts(include_failed=options['include_failed'])
+        pending = BitrixOutbox.objects.filter(status=BitrixOutbox.STATUS_PENDING).count()
+        self.stdout.write(f'Queued {queued} contacts, {pending} outbox entries pending')
+
+        synced = retried = dead = 0
+        while True:
+            result = process_outbox(limit=limit)
+            handled = result.synced + result.retried + result.dead
+            if not handled:
+                break
+
+            synced += result.synced
+            retried += result.retried
+            dead += result.dead
+            self.stdout.write(
+                f'Pushed {result.synced}, retrying {result.retried}, dead-lettered {result.dead}'
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Push completed! '
+                f'Synced: {synced}, '
+                f'Retrying later: {retried}, '
+                f'Dead-lettered: {dead}'
+            )
+        )
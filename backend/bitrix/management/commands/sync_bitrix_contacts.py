@@ -1,8 +1,25 @@
+import json
+import uuid
+from contextlib import nullcontext
+
 import requests
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from django.conf import settings
-from bitrix.models import BitrixContact
+from django.utils import timezone
+from bitrix.client import BATCH_LIMIT, PAGE_SIZE, BitrixClient, BitrixError
+from bitrix.events import fetch_records
+from bitrix.fetcher import ConcurrentFetcher, TokenBucket
+from bitrix.metrics import PHASES, SyncMetrics, measure
+from bitrix.models import BitrixSyncRun, BitrixSyncState
+from bitrix.sync import (
+    CONTACT_FIELDS,
+    DEFAULT_BATCH_SIZE,
+    get_sync_state,
+    latest_modified,
+    parse_contact,
+    reconcile_contacts,
+    upsert_contacts,
+)
 
 
 class Command(BaseCommand):
@@ -19,125 +36,301 @@ class Command(BaseCommand):
             action='store_true',
             help='Enable verbose output',
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help=(
+                'Only fetch contacts modified since the last successful sync, '
+                'committing and advancing the watermark page by page'
+            ),
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help=(
+                'Continue an interrupted full sync after the last committed page '
+                'instead of starting again from the first contact'
+            ),
+        )
+        parser.add_argument(
+            '--reconcile',
+            action='store_true',
+            help=(
+                'Instead of syncing, stream every contact ID from Bitrix24 and '
+                'soft-delete local contacts that no longer exist there'
+            ),
+        )
+        parser.add_argument(
+            '--batch',
+            action='store_true',
+            help=(
+                'Fetch up to 50 list calls per HTTP request through the Bitrix24 '
+                'batch method'
+            ),
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Number of Bitrix24 requests kept in flight (default: 1)',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=None,
+            help=(
+                'Maximum Bitrix24 requests per second for this run '
+                '(default: BITRIX24_RATE_LIMIT, shared with the rest of the process)'
+            ),
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=PAGE_SIZE,
+            help=(
+                'Number of contacts processed per page. Bitrix24 serves 50 rows per call, '
+                'larger values group several calls into one page (default: 50)'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of rows per bulk INSERT/UPDATE statement (default: 500)',
+        )
+        parser.add_argument(
+            '--max-pages',
+            type=int,
+            default=None,
+            help=(
+                'Stop after processing this many pages (default: no limit). A full '
+                'sync stopped this way can be continued with --resume'
+            ),
+        )
+        parser.add_argument(
+            '--report',
+            metavar='PATH',
+            default=None,
+            help=(
+                'Write a JSON report with per-phase timings, request counters and '
+                'per-page figures to PATH, also when the sync fails'
+            ),
+        )
 
     def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        incremental = options['incremental']
+        resume = options['resume']
+        reconcile = options['reconcile']
+        use_batch = options['batch']
+        page_size = options['page_size']
+        max_pages = options['max_pages']
+        batch_size = options['batch_size']
+        concurrency = options['concurrency']
+        rate = options['rate']
+
+        if page_size < 1:
+            raise CommandError('--page-size must be a positive integer')
+        if max_pages is not None and max_pages < 1:
+            raise CommandError('--max-pages must be a positive integer')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be a positive integer')
+        if concurrency < 1:
+            raise CommandError('--concurrency must be a positive integer')
+        if rate is not None and rate <= 0:
+            raise CommandError('--rate must be a positive number')
+        if resume and incremental:
+            raise CommandError(
+                '--resume applies to full syncs; --incremental always continues from its watermark'
+            )
+
+        if reconcile and (incremental or resume):
+            raise CommandError('--reconcile cannot be combined with --incremental or --resume')
+
+        metrics = SyncMetrics()
+        client = BitrixClient(
+            limiter=TokenBucket(rate=rate) if rate is not None else None, metrics=metrics
+        )
+        fetcher = ConcurrentFetcher(concurrency=concurrency)
+
+        if reconcile:
+            mode = BitrixSyncRun.MODE_RECONCILE
+        elif incremental:
+            mode = BitrixSyncRun.MODE_INCREMENTAL
+        else:
+            mode = BitrixSyncRun.MODE_RESUME if resume else BitrixSyncRun.MODE_FULL
+
+        # Dry runs leave no history, but can still write a report
+        run = BitrixSyncRun(entity=BitrixSyncState.ENTITY_CONTACT, mode=mode)
+        if not dry_run:
+            run.save()
+
+        error = ''
+        try:
+            if reconcile:
+                self._reconcile(client, fetcher, use_batch, dry_run, metrics)
+            else:
+                self._sync(client, fetcher, options, metrics, run)
+            run.status = BitrixSyncRun.STATUS_SUCCEEDED
+        except BaseException as e:
+            run.status = BitrixSyncRun.STATUS_FAILED
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            self._finish_run(run, metrics, error, dry_run, options['report'])
+
+    def _sync(self, client, fetcher, options, metrics, run):
+        """
+        Fetch contacts page by page and upsert them
+        """
         dry_run = options['dry_run']
         verbose = options['verbose']
+        incremental = options['incremental']
+        resume = options['resume']
+        use_batch = options['batch']
+        page_size = options['page_size']
+        max_pages = options['max_pages']
+        batch_size = options['batch_size']
+
+        state = get_sync_state(BitrixSyncState.ENTITY_CONTACT)
 
-        # Bitrix24 API URL from settings
-        bitrix_base_url = getattr(settings, 'BITRIX24_BASE_URL', 'https://b24-0r8mng.bitrix24.com/rest/1/iolappou7w3kdu2w')
-        api_url = f"{bitrix_base_url}/crm.contact.list.json"
-        
-        # API parameters
+        # API parameters, ordered so that offsets stay stable between calls
         params = {
-            'select': ['NAME', 'LAST_NAME', 'EMAIL', 'PHONE'],
-            'order': {'LAST_NAME': 'ASC'}
+            'select': CONTACT_FIELDS,
+            'order': {'ID': 'ASC'}
         }
+        if incremental:
+            params['order'] = {'DATE_MODIFY': 'ASC', 'ID': 'ASC'}
+            if state.last_modified:
+                # Inclusive bound: Bitrix timestamps have second precision, so rows
+                # edited in the same second as the watermark are fetched again
+                # rather than missed. Re-applying them is a no-op.
+                params['filter'] = {'>=DATE_MODIFY': state.last_modified.isoformat()}
+
+        # Full syncs keep a checkpoint of the last committed page. Resuming
+        # filters on ID rather than reusing the offset, so contacts deleted
+        # in Bitrix24 meanwhile do not shift the remaining pages.
+        resuming = resume and state.run_id is not None
+        if resuming and state.cursor_id is not None:
+            params['filter'] = {'>ID': state.cursor_id}
+        run_id = state.run_id if resuming else uuid.uuid4()
+        if not incremental:
+            run.run_id = run_id
+            if not resuming:
+                run.mode = BitrixSyncRun.MODE_FULL
 
         try:
             self.stdout.write(self.style.SUCCESS('Starting Bitrix24 contact sync...'))
-            
+
+            if resuming:
+                self.stdout.write(
+                    f'Resuming sync {run_id} ({state.cursor_offset} contacts already processed)'
+                )
+            elif resume:
+                self.stdout.write(self.style.WARNING('No interrupted sync to resume, starting from the beginning'))
+            elif not incremental and state.run_id is not None:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Discarding checkpoint of unfinished sync {state.run_id} '
+                        f'({state.cursor_offset} contacts processed); use --resume to continue it'
+                    )
+                )
+
             if verbose:
-                self.stdout.write(f'API URL: {api_url}')
+                self.stdout.write(f'API URL: {client.base_url}/crm.contact.list.json')
                 self.stdout.write(f'Parameters: {params}')
-            
-            # Make API request
-            response = requests.get(api_url, params=params, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if 'result' not in data:
-                raise CommandError('Invalid API response format')
-            
-            contacts = data['result']
-            
-            if verbose:
-                self.stdout.write(f'Retrieved {len(contacts)} contacts from API')
-            
+                if incremental:
+                    self.stdout.write(f'Watermark: {state.last_modified or "none, fetching everything"}')
+
             # Process contacts
+            start_offset = state.cursor_offset if resuming else 0
+            processed_contacts = start_offset
             new_contacts = 0
             updated_contacts = 0
             skipped_contacts = 0
-            
-            with transaction.atomic():
-                for contact_data in contacts:
-                    # Extract contact information
-                    name = contact_data.get('NAME', '').strip()
-                    last_name = contact_data.get('LAST_NAME', '').strip()
-                    email_list = contact_data.get('EMAIL', [])
-                    phone_list = contact_data.get('PHONE', [])
-                    
-                    # Skip contacts without email
-                    if not email_list or not isinstance(email_list, list):
-                        skipped_contacts += 1
-                        if verbose:
-                            self.stdout.write(f'Skipping contact without email: {name} {last_name}')
-                        continue
-                    
-                    # Use the first email address
-                    email = email_list[0].get('VALUE', '').strip() if email_list else ''
-                    
-                    if not email:
-                        skipped_contacts += 1
-                        if verbose:
-                            self.stdout.write(f'Skipping contact without valid email: {name} {last_name}')
-                        continue
-                    
-                    # Use the first phone number
-                    phone = ''
-                    if phone_list and isinstance(phone_list, list) and phone_list:
-                        phone = phone_list[0].get('VALUE', '').strip()
-                    
-                    if dry_run:
-                        if verbose:
-                            self.stdout.write(f'[DRY RUN] Would process: {name} {last_name} ({email})')
-                        continue
-                    
-                    # Check if contact already exists
-                    contact, created = BitrixContact.objects.get_or_create(
-                        email=email,
-                        defaults={
-                            'name': name,
-                            'last_name': last_name,
-                            'phone': phone,
-                        }
+            last_modified = state.last_modified
+            run_modified = state.cursor_modified if resuming else None
+            pages_processed = 0
+
+            if not incremental and not dry_run and not resuming:
+                state.start_run(run_id)
+                state.save()
+
+            # Every page is committed on its own together with the watermark
+            # or checkpoint, so an interrupted sync keeps its finished pages
+            # and no transaction stays open for the length of the run.
+            page_transaction = nullcontext if dry_run else transaction.atomic
+
+            if incremental:
+                responses = (
+                    (rows, None, has_more)
+                    for rows, has_more in client.iter_modified_pages('crm.contact.list', params)
+                )
+            else:
+                responses = self._fetch_pages(client, fetcher, params, use_batch)
+            pages = self._iter_pages(responses, page_size, max_pages)
+            for page_number, (contacts, total) in enumerate(pages, start=1):
+                with page_transaction():
+                    page_new, page_updated, page_skipped = self._process_page(
+                        contacts, dry_run, verbose, batch_size, metrics
                     )
-                    
-                    if created:
-                        new_contacts += 1
-                        if verbose:
-                            self.stdout.write(f'Created new contact: {contact}')
-                    else:
-                        # Update existing contact if data has changed
-                        updated = False
-                        if contact.name != name:
-                            contact.name = name
-                            updated = True
-                        if contact.last_name != last_name:
-                            contact.last_name = last_name
-                            updated = True
-                        if contact.phone != phone:
-                            contact.phone = phone
-                            updated = True
-                        
-                        if updated:
-                            contact.save()
-                            updated_contacts += 1
-                            if verbose:
-                                self.stdout.write(f'Updated existing contact: {contact}')
-                        elif verbose:
-                            self.stdout.write(f'No changes for contact: {contact}')
-            
+                    last_modified = latest_modified(contacts, last_modified)
+                    run_modified = latest_modified(contacts, run_modified)
+
+                    with measure(metrics, 'db_write'):
+                        if incremental and not dry_run and last_modified != state.last_modified:
+                            state.last_modified = last_modified
+                            state.save()
+                        elif not incremental and not dry_run and contacts:
+                            state.cursor_id = int(contacts[-1]['ID'])
+                            state.cursor_offset = processed_contacts + len(contacts)
+                            state.cursor_modified = run_modified
+                            state.save()
+
+                pages_processed += 1
+                processed_contacts += len(contacts)
+                new_contacts += page_new
+                updated_contacts += page_updated
+                skipped_contacts += page_skipped
+                metrics.count('rows_processed', len(contacts))
+                metrics.count('rows_created', page_new)
+                metrics.count('rows_updated', page_updated)
+                metrics.count('rows_skipped', page_skipped)
+                metrics.end_page(
+                    page_number, len(contacts), created=page_new, updated=page_updated, skipped=page_skipped
+                )
+
+                # A resumed run is only told how many contacts follow the checkpoint
+                if total is not None:
+                    total += start_offset
+
+                # Per-page progress report
+                self.stdout.write(
+                    f'Page {page_number}: {len(contacts)} contacts '
+                    f'(new {page_new}, updated {page_updated}, skipped {page_skipped}) - '
+                    f'{processed_contacts}/{total if total is not None else "?"} processed'
+                )
+
+            completed = max_pages is None or pages_processed < max_pages
+
+            # A complete full sync clears its checkpoint and seeds the
+            # watermark for later incremental runs
+            if not incremental and not dry_run and completed:
+                if run_modified and (last_modified is None or run_modified > last_modified):
+                    last_modified = run_modified
+                state.finish_run()
+                state.last_modified = last_modified
+                state.save()
+
             # Print summary
             if dry_run:
                 self.stdout.write(
                     self.style.WARNING(
-                        f'[DRY RUN] Would have processed {len(contacts)} contacts, '
+                        f'[DRY RUN] Would have processed {processed_contacts} contacts, '
                         f'skipped {skipped_contacts} without valid email'
                     )
                 )
-            else:
+            elif completed:
                 self.stdout.write(
                     self.style.SUCCESS(
                         f'Sync completed successfully! '
@@ -146,8 +339,211 @@ class Command(BaseCommand):
                         f'Skipped contacts: {skipped_contacts}'
                     )
                 )
-        
-        except requests.RequestException as e:
-            raise CommandError(f'Failed to fetch data from Bitrix24 API: {e}')
+                self.stdout.write(f'Watermark: {state.last_modified}')
+            else:
+                # --max-pages stopped the run before the last page
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Sync stopped at --max-pages {max_pages} before all contacts were synced. '
+                        f'New contacts: {new_contacts}, '
+                        f'Updated contacts: {updated_contacts}, '
+                        f'Skipped contacts: {skipped_contacts}'
+                    )
+                )
+                if incremental:
+                    self.stdout.write(
+                        f'Watermark: {state.last_modified}; run again with --incremental to continue'
+                    )
+                else:
+                    self.stdout.write(
+                        f'Stopped after {state.cursor_offset} contacts; '
+                        f'run again with --resume to continue sync {run_id}'
+                    )
+
+        except (requests.RequestException, BitrixError) as e:
+            hint = '' if incremental or dry_run else '; run again with --resume to continue'
+            raise CommandError(f'Failed to fetch data from Bitrix24 API: {e}{hint}')
+        except CommandError:
+            raise
         except Exception as e:
             raise CommandError(f'Unexpected error during sync: {e}')
+
+    def _reconcile(self, client, fetcher, use_batch, dry_run, metrics):
+        """
+        Soft-delete local contacts missing from Bitrix24, reading only IDs
+        """
+        params = {'select': ['ID'], 'order': {'ID': 'ASC'}}
+        checked = 0
+
+        def remote_ids():
+            nonlocal checked
+            for rows, _, _ in self._fetch_pages(client, fetcher, params, use_batch):
+                checked += len(rows)
+                for row in rows:
+                    yield int(row['ID'])
+
+        try:
+            self.stdout.write(self.style.SUCCESS('Starting Bitrix24 contact reconciliation...'))
+            deleted = reconcile_contacts(
+                remote_ids(),
+                lambda bitrix_ids: fetch_records(client, BitrixSyncState.ENTITY_CONTACT, bitrix_ids),
+                dry_run=dry_run,
+            )
+        except (requests.RequestException, BitrixError) as e:
+            raise CommandError(f'Failed to fetch data from Bitrix24 API: {e}')
+        finally:
+            metrics.count('rows_processed', checked)
+
+        metrics.count('rows_deleted', deleted)
+
+        if dry_run:
+            self.stdout.write(
+                self.style.WARNING(f'[DRY RUN] Would have soft-deleted {deleted} contacts missing from Bitrix24')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Reconciliation completed! '
+                    f'Checked {checked} Bitrix24 contacts, '
+                    f'soft-deleted {deleted} local contacts'
+                )
+            )
+
+    def _finish_run(self, run, metrics, error, dry_run, report_path):
+        """
+        Store the figures of this run on its history row and in the report
+        """
+        summary = metrics.summary()
+        counters = summary['counters']
+
+        run.finished_at = timezone.now()
+        run.error = error
+        run.duration = summary['duration']
+        run.rows_per_second = summary['rows_per_second']
+        run.phases = summary['phases']
+        for name in ('rows_processed', 'rows_created', 'rows_updated', 'rows_skipped',
+                     'rows_deleted', 'requests', 'retries', 'rate_limited'):
+            setattr(run, name, counters.get(name, 0))
+        if not dry_run:
+            run.save()
+
+        self.stdout.write(
+            'Timings: '
+            + ', '.join(f"{phase} {summary['phases'][phase]['seconds']:.2f}s" for phase in PHASES)
+            + f" - {run.requests} requests, {run.retries} retries, {run.rate_limited} rate limited, "
+            f"{run.rows_per_second or 0:.1f} rows/s"
+        )
+
+        if report_path:
+            report = {
+                'entity': run.entity,
+                'mode': run.mode,
+                'status': run.status,
+                'run_id': run.run_id,
+                'dry_run': dry_run,
+                'started_at': run.started_at,
+                'finished_at': run.finished_at,
+                'error': error,
+                **summary,
+                'pages': metrics.pages,
+            }
+            with open(report_path, 'w') as report_file:
+                json.dump(report, report_file, indent=2, default=str)
+                report_file.write('\n')
+
+    def _process_page(self, contacts, dry_run, verbose, batch_size, metrics=None):
+        """
+        Upsert one page of Bitrix24 contacts and return (new, updated, skipped) counts
+        """
+        rows = []
+        skipped = 0
+
+        for contact_data in contacts:
+            row = parse_contact(contact_data)
+
+            # Skip contacts without a valid email
+            if row is None:
+                skipped += 1
+                if verbose:
+                    name = (contact_data.get('NAME') or '').strip()
+                    last_name = (contact_data.get('LAST_NAME') or '').strip()
+                    self.stdout.write(f'Skipping contact without valid email: {name} {last_name}')
+                continue
+
+            if dry_run and verbose:
+                self.stdout.write(
+                    f"[DRY RUN] Would process: {row['name']} {row['last_name']} ({row['email']})"
+                )
+            rows.append(row)
+
+        if dry_run:
+            return 0, 0, skipped
+
+        result = upsert_contacts(rows, batch_size=batch_size, metrics=metrics)
+
+        if verbose:
+            for contact in result.created:
+                self.stdout.write(f'Created new contact: {contact}')
+            for contact in result.updated:
+                self.stdout.write(f'Updated existing contact: {contact}')
+            for contact in result.unchanged:
+                self.stdout.write(f'No changes for contact: {contact}')
+
+        return len(result.created), len(result.updated), skipped + result.duplicates
+
+    def _iter_pages(self, responses, page_size, max_pages=None):
+        """
+        Regroup Bitrix24 list responses into (contacts, total) pages of page_size.
+
+        Only the current page is held in memory, so memory use stays flat
+        regardless of how many contacts the portal has.
+        """
+        pages = 0
+        page = []
+
+        for rows, total, has_more in responses:
+            page.extend(rows)
+
+            # Group Bitrix calls until the requested page size is reached
+            while len(page) >= page_size or (not has_more and page):
+                yield page[:page_size], total
+                page = page[page_size:]
+                pages += 1
+                if max_pages is not None and pages >= max_pages:
+                    return
+
+    def _fetch_pages(self, client, fetcher, params, use_batch):
+        """
+        Yield (rows, total, has_more) for every list call.
+
+        The first page is fetched directly to learn the total. The remaining
+        offsets are then split into units of work, one list call each or up
+        to 50 per batch request, which the fetcher runs concurrently and
+        returns in offset order.
+        """
+        responses = [client.contact_list(params, start=0)]
+        per_request = BATCH_LIMIT if use_batch else 1
+
+        def run(offsets):
+            if use_batch:
+                return client.list_pages_batch('crm.contact.list', params, offsets)
+            return [client.contact_list(params, start=offsets[0])]
+
+        while True:
+            _, total, start = responses[-1]
+            for index, (rows, rows_total, _) in enumerate(responses):
+                yield rows, rows_total, index < len(responses) - 1 or start is not None
+            if start is None:
+                return
+
+            stop = max(total or 0, start + PAGE_SIZE)
+            offsets = list(range(start, stop, PAGE_SIZE))
+            units = [offsets[i:i + per_request] for i in range(0, len(offsets), per_request)]
+
+            # The portal may have grown since the total was read, so keep
+            # going as long as the last call reports another page
+            responses = []
+            for unit_responses in fetcher.map(run, units):
+                for response in responses:
+                    yield response[0], response[1], True
+                responses = unit_responses
@@ -0,0 +1,234 @@
+from array import array
+from contextlib import nullcontext
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from bitrix.client import BitrixClient, BitrixError
+from bitrix.deals import DEAL_FIELDS
+from bitrix.events import fetch_records
+from bitrix.fetcher import TokenBucket
+from bitrix.models import BitrixSyncState
+from bitrix.sync import (
+    DEFAULT_BATCH_SIZE,
+    get_sync_state,
+    latest_modified,
+    parse_deal,
+    reconcile_deals,
+    upsert_deals,
+)
+
+
+class Command(BaseCommand):
+    help = 'Sync deals from Bitrix24 CRM API into the local BitrixDeal table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Run the command without making any database changes',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Enable verbose output',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help=(
+                'Only fetch deals modified since the last successful sync, '
+                'committing and advancing the watermark page by page'
+            ),
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=None,
+            help=(
+                'Maximum Bitrix24 requests per second for this run '
+                '(default: BITRIX24_RATE_LIMIT, shared with the rest of the process)'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of rows per bulk INSERT/UPDATE statement (default: 500)',
+        )
+        parser.add_argument(
+            '--max-pages',
+            type=int,
+            default=None,
+            help='Stop after processing this many pages of 50 deals (default: no limit)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        verbose = options['verbose']
+        incremental = options['incremental']
+        max_pages = options['max_pages']
+        batch_size = options['batch_size']
+        rate = options['rate']
+
+        if max_pages is not None and max_pages < 1:
+            raise CommandError('--max-pages must be a positive integer')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be a positive integer')
+        if rate is not None and rate <= 0:
+            raise CommandError('--rate must be a positive number')
+
+        client = BitrixClient(limiter=TokenBucket(rate=rate) if rate is not None else None)
+        state = get_sync_state(BitrixSyncState.ENTITY_DEAL)
+
+        # API parameters, ordered so that pages stay stable between calls
+        params = {
+            'select': DEAL_FIELDS,
+            'order': {'ID': 'ASC'}
+        }
+        if incremental:
+            params['order'] = {'DATE_MODIFY': 'ASC', 'ID': 'ASC'}
+            if state.last_modified:
+                # Inclusive bound, see sync_bitrix_contacts
+                params['filter'] = {'>=DATE_MODIFY': state.last_modified.isoformat()}
+
+        try:
+            self.stdout.write(self.style.SUCCESS('Starting Bitrix24 deal sync...'))
+
+            if verbose:
+                self.stdout.write(f'API URL: {client.base_url}/crm.deal.list.json')
+                self.stdout.write(f'Parameters: {params}')
+                if incremental:
+                    self.stdout.write(f'Watermark: {state.last_modified or "none, fetching everything"}')
+
+            processed_deals = 0
+            new_deals = 0
+            updated_deals = 0
+            skipped_deals = 0
+            deleted_deals = 0
+            pages_processed = 0
+            last_modified = state.last_modified
+
+            # IDs read by a full sync, ascending, to find deals deleted upstream
+            started_at = timezone.now()
+            seen_ids = array('Q')
+
+            # Every page is committed on its own, as in sync_bitrix_contacts;
+            # deal syncs are short, so they restart rather than resume
+            page_transaction = nullcontext if dry_run else transaction.atomic
+
+            if incremental:
+                # Keyset paging, see BitrixClient.iter_modified_pages
+                pages = (
+                    (rows, None)
+                    for rows, _ in client.iter_modified_pages('crm.deal.list', params)
+                    if rows
+                )
+            else:
+                pages = client.iter_pages('crm.deal.list', params)
+            for page_number, (deals, total) in enumerate(pages, start=1):
+                with page_transaction():
+                    page_new, page_updated, page_skipped = self._process_page(
+                        deals, dry_run, verbose, batch_size
+                    )
+                    last_modified = latest_modified(deals, last_modified)
+
+                    if incremental and not dry_run and last_modified != state.last_modified:
+                        state.last_modified = last_modified
+                        state.save()
+
+                if not incremental:
+                    seen_ids.extend(int(deal['ID']) for deal in deals if deal.get('ID'))
+                pages_processed += 1
+                processed_deals += len(deals)
+                new_deals += page_new
+                updated_deals += page_updated
+                skipped_deals += page_skipped
+
+                # Per-page progress report
+                self.stdout.write(
+                    f'Page {page_number}: {len(deals)} deals '
+                    f'(new {page_new}, updated {page_updated}, skipped {page_skipped}) - '
+                    f'{processed_deals}/{total if total is not None else "?"} processed'
+                )
+                if max_pages is not None and page_number >= max_pages:
+                    break
+
+            completed = max_pages is None or pages_processed < max_pages
+
+            # A complete full sync removes the deals deleted in Bitrix24,
+            # which incremental runs never see, records that the mirror is
+            # current and seeds the watermark for later incremental runs
+            if not incremental and completed:
+                deleted_deals, restored_deals = reconcile_deals(
+                    seen_ids,
+                    started_at,
+                    lambda bitrix_ids: fetch_records(client, BitrixSyncState.ENTITY_DEAL, bitrix_ids),
+                    dry_run=dry_run,
+                )
+                if verbose and restored_deals:
+                    self.stdout.write(f'Fetched {restored_deals} deals missed while paging')
+                if not dry_run:
+                    state.finish_run()
+                    state.last_modified = last_modified
+                    state.save()
+
+            # Print summary
+            if dry_run:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'[DRY RUN] Would have processed {processed_deals} deals, '
+                        f'skipped {skipped_deals} without an ID, '
+                        f'deleted {deleted_deals} missing from Bitrix24'
+                    )
+                )
+            else:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'Sync completed successfully! '
+                        f'New deals: {new_deals}, '
+                        f'Updated deals: {updated_deals}, '
+                        f'Deleted deals: {deleted_deals}, '
+                        f'Skipped deals: {skipped_deals}'
+                    )
+                )
+                if incremental or completed:
+                    self.stdout.write(f'Watermark: {state.last_modified}')
+
+        except (requests.RequestException, BitrixError) as e:
+            raise CommandError(f'Failed to fetch data from Bitrix24 API: {e}')
+        except CommandError:
+            raise
+        except Exception as e:
+            raise CommandError(f'Unexpected error during sync: {e}')
+
+    def _process_page(self, deals, dry_run, verbose, batch_size):
+        """
+        Upsert one page of Bitrix24 deals and return (new, updated, skipped) counts
+        """
+        rows = []
+        skipped = 0
+
+        for deal_data in deals:
+            row = parse_deal(deal_data)
+            if row is None:
+                skipped += 1
+                continue
+
+            if dry_run and verbose:
+                self.stdout.write(f"[DRY RUN] Would process: {row['title']} ({row['bitrix_id']})")
+            rows.append(row)
+
+        if dry_run:
+            return 0, 0, skipped
+
+        result = upsert_deals(rows, batch_size=batch_size)
+
+        if verbose:
+            for deal in result.created:
+                self.stdout.write(f'Created new deal: {deal}')
+            for deal in result.updated:
+                self.stdout.write(f'Updated existing deal: {deal}')
+
+        return len(result.created), len(result.updated), skipped + result.duplicates
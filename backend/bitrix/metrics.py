@@ -0,0 +1,99 @@
+"""
+Instrumentation for Bitrix24 syncs: time spent per phase and request counters
+"""
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Phases reported for every sync, in pipeline order
+PHASES = ['http_wait', 'json_decode', 'db_lookup', 'db_write']
+
+
+class SyncMetrics:
+    """
+    Thread-safe accumulator of phase timings and counters for one sync run.
+
+    Phase times are summed over every thread, so with concurrent fetching
+    http_wait can exceed the wall-clock duration of the run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.seconds = {phase: 0.0 for phase in PHASES}
+        self.calls = {phase: 0 for phase in PHASES}
+        self.counters = {}
+        self.pages = []
+        self._last_page = self._snapshot()
+
+    @contextmanager
+    def timer(self, phase):
+        """
+        Add the time spent inside the block to `phase`
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.seconds[phase] = self.seconds.get(phase, 0.0) + elapsed
+                self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _snapshot(self):
+        return time.perf_counter(), dict(self.seconds), dict(self.counters)
+
+    def end_page(self, number, rows, **counts):
+        """
+        Record what happened since the previous page ended
+        """
+        with self._lock:
+            now, seconds, counters = self._snapshot()
+        last_time, last_seconds, last_counters = self._last_page
+        self._last_page = (now, seconds, counters)
+
+        self.pages.append({
+            'page': number,
+            'rows': rows,
+            'seconds': round(now - last_time, 4),
+            'phases': {
+                phase: round(seconds[phase] - last_seconds.get(phase, 0.0), 4)
+                for phase in seconds
+            },
+            'requests': counters.get('requests', 0) - last_counters.get('requests', 0),
+            **counts,
+        })
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self._started
+
+    def summary(self):
+        """
+        Return the totals as a JSON-serialisable dict
+        """
+        duration = self.duration
+        with self._lock:
+            counters = dict(self.counters)
+            phases = {
+                phase: {'seconds': round(self.seconds[phase], 4), 'calls': self.calls[phase]}
+                for phase in self.seconds
+            }
+        rows = counters.get('rows_processed', 0)
+        return {
+            'duration': round(duration, 4),
+            'rows_per_second': round(rows / duration, 1) if duration else None,
+            'counters': counters,
+            'phases': phases,
+        }
+
+
+def measure(metrics, phase):
+    """
+    Time a block into `metrics`, or do nothing when metrics is None
+    """
+    return metrics.timer(phase) if metrics is not None else nullcontext()
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-16 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0002_bitrixcontact_phone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BitrixSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('portal', models.CharField(max_length=255)),
+                ('entity', models.CharField(choices=[('contact', 'Contact')], max_length=20)),
+                ('last_modified', models.DateTimeField(blank=True, help_text='DATE_MODIFY of the newest record committed by the last sync', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Bitrix Sync State',
+                'verbose_name_plural': 'Bitrix Sync States',
+                'constraints': [models.UniqueConstraint(fields=('portal', 'entity'), name='unique_bitrix_sync_state')],
+            },
+        ),
+    ]
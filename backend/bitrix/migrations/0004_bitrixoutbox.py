@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-16 22:35
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0003_bitrixsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitrixcontact',
+            name='sync_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('synced', 'Synced'), ('failed', 'Failed')], default='synced', help_text='Whether the contact has been written to Bitrix24', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='BitrixOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(choices=[('contact.add', 'Add contact')], max_length=20)),
+                ('payload', models.JSONField(default=dict)),
+                ('idempotency_key', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('synced', 'Synced'), ('dead', 'Dead letter')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('bitrix_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_entries', to='bitrix.bitrixcontact')),
+            ],
+            options={
+                'verbose_name': 'Bitrix Outbox Entry',
+                'verbose_name_plural': 'Bitrix Outbox',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='bitrix_outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-16 22:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0004_bitrixoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitrixcontact',
+            name='bitrix_id',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, help_text='ID of the contact in Bitrix24 CRM', null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-16 22:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0005_bitrixcontact_bitrix_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bitrixsyncstate',
+            name='entity',
+            field=models.CharField(choices=[('contact', 'Contact'), ('deal', 'Deal')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='BitrixDeal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bitrix_id', models.PositiveBigIntegerField(help_text='ID of the deal in Bitrix24 CRM', unique=True)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('stage_id', models.CharField(blank=True, max_length=50)),
+                ('opportunity', models.DecimalField(blank=True, decimal_places=2, max_digits=18, null=True)),
+                ('currency_id', models.CharField(blank=True, max_length=10)),
+                ('contact_bitrix_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('company_bitrix_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('date_create', models.DateTimeField(blank=True, null=True)),
+                ('date_modify', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Bitrix Deal',
+                'verbose_name_plural': 'Bitrix Deals',
+                'ordering': ['-bitrix_id'],
+                'indexes': [models.Index(fields=['stage_id', 'date_modify'], name='bitrix_deal_stage_idx'), models.Index(fields=['date_modify'], name='bitrix_deal_modified_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-16 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0006_bitrixdeal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BitrixEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=50)),
+                ('entity', models.CharField(choices=[('contact', 'Contact'), ('deal', 'Deal')], max_length=20)),
+                ('bitrix_id', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Bitrix Event',
+                'verbose_name_plural': 'Bitrix Events',
+                'ordering': ['id'],
+            },
+        ),
+    ]
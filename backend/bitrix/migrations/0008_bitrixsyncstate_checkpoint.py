@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0007_bitrixevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitrixsyncstate',
+            name='cursor_id',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Bitrix ID of the last record committed by the unfinished full sync', null=True),
+        ),
+        migrations.AddField(
+            model_name='bitrixsyncstate',
+            name='cursor_modified',
+            field=models.DateTimeField(blank=True, help_text='Newest DATE_MODIFY committed by the unfinished full sync', null=True),
+        ),
+        migrations.AddField(
+            model_name='bitrixsyncstate',
+            name='cursor_offset',
+            field=models.PositiveIntegerField(default=0, help_text='Number of records processed by the unfinished full sync'),
+        ),
+        migrations.AddField(
+            model_name='bitrixsyncstate',
+            name='run_id',
+            field=models.UUIDField(blank=True, help_text='Full sync that wrote the checkpoint; cleared once it completes', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0008_bitrixsyncstate_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitrixcontact',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, help_text='When the contact was found to be deleted in Bitrix24', null=True),
+        ),
+        migrations.AddField(
+            model_name='bitrixcontact',
+            name='sync_hash',
+            field=models.CharField(blank=True, default='', help_text='Hash of the synced fields as last received from Bitrix24', max_length=16),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-16 22:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0009_bitrixcontact_sync_hash_deleted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BitrixSyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('contact', 'Contact'), ('deal', 'Deal')], max_length=20)),
+                ('mode', models.CharField(choices=[('full', 'Full'), ('incremental', 'Incremental'), ('resume', 'Resume'), ('reconcile', 'Reconcile')], max_length=20)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('run_id', models.UUIDField(blank=True, help_text='Checkpoint run this sync wrote to, shared by a run and its resumes', null=True)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('rows_processed', models.PositiveIntegerField(default=0)),
+                ('rows_created', models.PositiveIntegerField(default=0)),
+                ('rows_updated', models.PositiveIntegerField(default=0)),
+                ('rows_skipped', models.PositiveIntegerField(default=0)),
+                ('rows_deleted', models.PositiveIntegerField(default=0)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('retries', models.PositiveIntegerField(default=0)),
+                ('rate_limited', models.PositiveIntegerField(default=0)),
+                ('duration', models.FloatField(blank=True, help_text='Wall-clock seconds', null=True)),
+                ('rows_per_second', models.FloatField(blank=True, null=True)),
+                ('phases', models.JSONField(blank=True, default=dict, help_text='Seconds and calls per sync phase')),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Bitrix Sync Run',
+                'verbose_name_plural': 'Bitrix Sync Runs',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
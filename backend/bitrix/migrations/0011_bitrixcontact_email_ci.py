@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-16 22:55
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def lowercase_emails(apps, schema_editor):
+    """
+    Store existing emails lowercased, refusing to guess which of two
+    addresses that differ only in case should be kept
+    """
+    BitrixContact = apps.get_model('bitrix', 'BitrixContact')
+    duplicates = (
+        BitrixContact.objects.annotate(email_lower=Lower('email'))
+        .values('email_lower')
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+        .values_list('email_lower', flat=True)
+    )
+    duplicates = list(duplicates[:10])
+    if duplicates:
+        raise RuntimeError(
+            'Contacts whose emails differ only in case must be merged before migrating: '
+            + ', '.join(duplicates)
+        )
+    BitrixContact.objects.exclude(email=Lower('email')).update(email=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0010_bitrixsyncrun'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bitrixcontact',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='unique_bitrix_contact_email_ci', violation_error_message='A contact with this email already exists.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-16 22:56
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0011_bitrixcontact_email_ci'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitrixcontact',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('last_name', models.Value('')), django.db.models.functions.comparison.Coalesce('name', models.Value('')), models.F('id'), condition=models.Q(('deleted_at__isnull', True)), name='bitrix_contact_list_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2 on 2026-10-16 22:58
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+TRIGRAM_INDEX = 'bitrix_contact_search_trgm_idx'
+
+
+# Copies of bitrix.search as of this migration, which must not change with it
+def normalize_search_text(*values):
+    text = ' '.join(value for value in values if value)
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def phone_digits(phone):
+    return re.sub(r'\D', '', phone or '')
+
+
+def fill_search_fields(apps, schema_editor):
+    BitrixContact = apps.get_model('bitrix', 'BitrixContact')
+    contacts = BitrixContact.objects.order_by('pk')
+    last = 0
+    while True:
+        chunk = list(contacts.filter(pk__gt=last)[:1000])
+        if not chunk:
+            return
+        for contact in chunk:
+            contact.search_text = normalize_search_text(contact.name, contact.last_name, contact.email)
+            contact.phone_digits = phone_digits(contact.phone)[:20]
+        BitrixContact.objects.bulk_update(chunk, ['search_text', 'phone_digits'])
+        last = chunk[-1].pk
+
+
+def create_trigram_index(apps, schema_editor):
+    # Substring search on PostgreSQL; other backends only use the B-tree
+    # indexes for prefix search
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} '
+        'ON bitrix_bitrixcontact USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0012_bitrixcontact_list_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitrixcontact',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Digits of the phone number, for prefix search', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='bitrixcontact',
+            name='search_text',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Name, last name and email, normalized for search', max_length=800),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-16 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0013_bitrixcontact_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitrixcontact',
+            index=models.Index(fields=['updated_at'], name='bitrix_contact_updated_idx'),
+        ),
+    ]
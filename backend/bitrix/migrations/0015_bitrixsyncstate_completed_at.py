@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-16 23:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_completed(apps, schema_editor):
+    """
+    Treat states with a watermark and no unfinished run as synced, as the
+    deals endpoint did before completions were recorded
+    """
+    BitrixSyncState = apps.get_model('bitrix', 'BitrixSyncState')
+    BitrixSyncState.objects.filter(last_modified__isnull=False, run_id__isnull=True).update(
+        completed_at=F('updated_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0014_bitrixcontact_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitrixsyncstate',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, help_text='When the last full sync of the portal completed', null=True),
+        ),
+        migrations.RunPython(mark_completed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-16 23:55
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def release_duplicate_bitrix_ids(apps, schema_editor):
+    """
+    Keep the most recently updated contact of every Bitrix ID held by more
+    than one row, and soft-delete the others, which an email change in
+    Bitrix24 left behind
+    """
+    BitrixContact = apps.get_model('bitrix', 'BitrixContact')
+    duplicated = (
+        BitrixContact.objects.filter(bitrix_id__isnull=False)
+        .values('bitrix_id').annotate(rows=Count('id')).filter(rows__gt=1)
+        .values_list('bitrix_id', flat=True)
+    )
+    now = timezone.now()
+    for bitrix_id in list(duplicated):
+        stale = BitrixContact.objects.filter(bitrix_id=bitrix_id).order_by('-updated_at', '-id')[1:]
+        BitrixContact.objects.filter(pk__in=[contact.pk for contact in stale]).update(
+            bitrix_id=None, deleted_at=now
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0015_bitrixsyncstate_completed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(release_duplicate_bitrix_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bitrixcontact',
+            name='bitrix_id',
+            field=models.PositiveBigIntegerField(blank=True, help_text='ID of the contact in Bitrix24 CRM', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='bitrixcontact',
+            constraint=models.UniqueConstraint(condition=models.Q(('bitrix_id__isnull', False)), fields=('bitrix_id',), name='unique_bitrix_contact_bitrix_id'),
+        ),
+    ]
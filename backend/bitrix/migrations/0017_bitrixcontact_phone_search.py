@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 00:10
+
+from django.db import migrations, models
+
+TRIGRAM_INDEX = 'bitrix_contact_phone_trgm_idx'
+
+
+def create_trigram_index(apps, schema_editor):
+    # Phone digits match anywhere, see bitrix.search; pg_trgm was created
+    # by 0013_bitrixcontact_search
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} '
+        'ON bitrix_bitrixcontact USING gin (phone_digits gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0016_bitrixcontact_unique_bitrix_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bitrixcontact',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Digits of the phone number, for search', max_length=20),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
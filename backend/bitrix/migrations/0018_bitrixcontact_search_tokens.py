@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-17 00:25
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copy of bitrix.search.search_tokens as of this migration
+def search_tokens(search_text, phone):
+    tokens = set()
+    for word in search_text.split():
+        tokens.add(word)
+        tokens.update(part for part in re.split(r'[\W_]+', word) if part)
+    tokens.update(re.findall(r'\d+', phone or ''))
+    return {token[:100] for token in tokens}
+
+
+def fill_search_tokens(apps, schema_editor):
+    BitrixContact = apps.get_model('bitrix', 'BitrixContact')
+    BitrixContactSearchToken = apps.get_model('bitrix', 'BitrixContactSearchToken')
+    contacts = BitrixContact.objects.order_by('pk')
+    last = 0
+    while True:
+        chunk = list(contacts.filter(pk__gt=last)[:1000])
+        if not chunk:
+            return
+        for contact in chunk:
+            contact.phone_digits_reversed = contact.phone_digits[::-1]
+        BitrixContact.objects.bulk_update(chunk, ['phone_digits_reversed'])
+        BitrixContactSearchToken.objects.bulk_create([
+            BitrixContactSearchToken(contact_id=contact.pk, token=token)
+            for contact in chunk
+            for token in sorted(search_tokens(contact.search_text, contact.phone))
+        ])
+        last = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0017_bitrixcontact_phone_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitrixcontact',
+            name='phone_digits_reversed',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Digits of the phone number in reverse, for suffix search', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='BitrixContactSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=100)),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='bitrix.bitrixcontact')),
+            ],
+            options={
+                'verbose_name': 'Bitrix Contact Search Token',
+                'verbose_name_plural': 'Bitrix Contact Search Tokens',
+            },
+        ),
+        migrations.RunPython(fill_search_tokens, migrations.RunPython.noop),
+    ]
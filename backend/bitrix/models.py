@@ -1,14 +1,75 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+
+from .cache import contacts_changed
+from .search import TOKEN_MAX_LENGTH, normalize_search_text, phone_digits, search_tokens
+
+# Message shared by the constraint and the API when an email is taken
+DUPLICATE_EMAIL_MESSAGE = 'A contact with this email already exists.'
+
+
+def normalize_email(email):
+    """
+    Return the form contact emails are stored in
+    """
+    return (email or '').strip().lower()
 
 
 class BitrixContact(models.Model):
     """
     Model to store Bitrix24 CRM contacts
     """
+    SYNC_PENDING = 'pending'
+    SYNC_SYNCED = 'synced'
+    SYNC_FAILED = 'failed'
+    SYNC_STATUS_CHOICES = [
+        (SYNC_PENDING, 'Pending'),
+        (SYNC_SYNCED, 'Synced'),
+        (SYNC_FAILED, 'Failed'),
+    ]
+
+    # Columns derived from the others for search, see refresh_search_fields
+    SEARCH_FIELDS = ['search_text', 'phone_digits', 'phone_digits_reversed']
+
     name = models.CharField(max_length=255, blank=True, null=True)
     last_name = models.CharField(max_length=255, blank=True, null=True)
+    # Stored lowercased; the plain unique index is the conflict target of
+    # the sync's bulk upsert, the Lower(email) constraint below makes the
+    # uniqueness case-insensitive
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # Unique when set, by the constraint below; the sync matches on it first
+    bitrix_id = models.PositiveBigIntegerField(
+        blank=True, null=True,
+        help_text='ID of the contact in Bitrix24 CRM'
+    )
+    sync_status = models.CharField(
+        max_length=10, choices=SYNC_STATUS_CHOICES, default=SYNC_SYNCED,
+        help_text='Whether the contact has been written to Bitrix24'
+    )
+    sync_hash = models.CharField(
+        max_length=16, blank=True, default='',
+        help_text='Hash of the synced fields as last received from Bitrix24'
+    )
+    deleted_at = models.DateTimeField(
+        blank=True, null=True,
+        help_text='When the contact was found to be deleted in Bitrix24'
+    )
+    search_text = models.CharField(
+        max_length=800, blank=True, default='', editable=False, db_index=True,
+        help_text='Name, last name and email, normalized for search'
+    )
+    phone_digits = models.CharField(
+        max_length=20, blank=True, default='', editable=False, db_index=True,
+        help_text='Digits of the phone number, for search'
+    )
+    phone_digits_reversed = models.CharField(
+        max_length=20, blank=True, default='', editable=False, db_index=True,
+        help_text='Digits of the phone number in reverse, for suffix search'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -16,12 +77,299 @@ class BitrixContact(models.Model):
         ordering = ['last_name', 'name']
         verbose_name = 'Bitrix Contact'
         verbose_name_plural = 'Bitrix Contacts'
+        constraints = [
+            models.UniqueConstraint(
+                Lower('email'),
+                name='unique_bitrix_contact_email_ci',
+                violation_error_message=DUPLICATE_EMAIL_MESSAGE,
+            ),
+            models.UniqueConstraint(
+                fields=['bitrix_id'],
+                condition=models.Q(bitrix_id__isnull=False),
+                name='unique_bitrix_contact_bitrix_id',
+            ),
+        ]
+        indexes = [
+            # Newest change, the validator of conditional GETs on the contacts list
+            models.Index(fields=['updated_at'], name='bitrix_contact_updated_idx'),
+            # Keyset pagination of the contacts list (bitrix/pagination.py)
+            models.Index(
+                Coalesce('last_name', models.Value('')),
+                Coalesce('name', models.Value('')),
+                models.F('id'),
+                name='bitrix_contact_list_idx',
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         full_name = f"{self.name or ''} {self.last_name or ''}".strip()
         return f"{full_name} ({self.email})" if full_name else self.email
 
+    def save(self, *args, **kwargs):
+        self.email = normalize_email(self.email)
+        self.refresh_search_fields()
+        super().save(*args, **kwargs)
+        refresh_search_tokens([self])
+        contacts_changed()
+
+    def refresh_search_fields(self):
+        """
+        Recompute the search columns; bulk writes must call this themselves,
+        and refresh_search_tokens() once the contacts are written
+        """
+        self.search_text = normalize_search_text(self.name, self.last_name, self.email)
+        self.phone_digits = phone_digits(self.phone)[:20]
+        self.phone_digits_reversed = self.phone_digits[::-1]
+
     @property
     def full_name(self):
         """Return the contact's full name"""
         return f"{self.name or ''} {self.last_name or ''}".strip()
+
+
+class BitrixContactSearchToken(models.Model):
+    """
+    Word of a contact's name, email or phone, for indexed prefix search, see
+    bitrix.search
+    """
+    contact = models.ForeignKey(BitrixContact, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=TOKEN_MAX_LENGTH, db_index=True)
+
+    class Meta:
+        verbose_name = 'Bitrix Contact Search Token'
+        verbose_name_plural = 'Bitrix Contact Search Tokens'
+
+    def __str__(self):
+        return self.token
+
+
+def refresh_search_tokens(contacts):
+    """
+    Replace the search tokens of saved contacts with those of their current
+    search columns
+    """
+    BitrixContactSearchToken.objects.filter(contact_id__in=[contact.pk for contact in contacts]).delete()
+    BitrixContactSearchToken.objects.bulk_create([
+        BitrixContactSearchToken(contact_id=contact.pk, token=token)
+        for contact in contacts
+        for token in sorted(search_tokens(contact.search_text, contact.phone))
+    ], batch_size=1000)
+
+
+class BitrixDeal(models.Model):
+    """
+    Local copy of a Bitrix24 CRM deal, kept current by the sync_bitrix_deals command
+    """
+    bitrix_id = models.PositiveBigIntegerField(unique=True, help_text='ID of the deal in Bitrix24 CRM')
+    title = models.CharField(max_length=255, blank=True)
+    stage_id = models.CharField(max_length=50, blank=True)
+    opportunity = models.DecimalField(max_digits=18, decimal_places=2, blank=True, null=True)
+    currency_id = models.CharField(max_length=10, blank=True)
+    contact_bitrix_id = models.PositiveBigIntegerField(blank=True, null=True)
+    company_bitrix_id = models.PositiveBigIntegerField(blank=True, null=True)
+    date_create = models.DateTimeField(blank=True, null=True)
+    date_modify = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-bitrix_id']
+        verbose_name = 'Bitrix Deal'
+        verbose_name_plural = 'Bitrix Deals'
+        indexes = [
+            models.Index(fields=['stage_id', 'date_modify'], name='bitrix_deal_stage_idx'),
+            models.Index(fields=['date_modify'], name='bitrix_deal_modified_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title or 'Untitled deal'} ({self.bitrix_id})"
+
+
+class BitrixSyncState(models.Model):
+    """
+    Per-portal sync progress for a Bitrix24 CRM entity
+    """
+    ENTITY_CONTACT = 'contact'
+    ENTITY_DEAL = 'deal'
+    ENTITY_CHOICES = [
+        (ENTITY_CONTACT, 'Contact'),
+        (ENTITY_DEAL, 'Deal'),
+    ]
+
+    portal = models.CharField(max_length=255)
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    last_modified = models.DateTimeField(
+        blank=True, null=True,
+        help_text='DATE_MODIFY of the newest record committed by the last sync'
+    )
+    run_id = models.UUIDField(
+        blank=True, null=True,
+        help_text='Full sync that wrote the checkpoint; cleared once it completes'
+    )
+    cursor_id = models.PositiveBigIntegerField(
+        blank=True, null=True,
+        help_text='Bitrix ID of the last record committed by the unfinished full sync'
+    )
+    cursor_offset = models.PositiveIntegerField(
+        default=0,
+        help_text='Number of records processed by the unfinished full sync'
+    )
+    cursor_modified = models.DateTimeField(
+        blank=True, null=True,
+        help_text='Newest DATE_MODIFY committed by the unfinished full sync'
+    )
+    completed_at = models.DateTimeField(
+        blank=True, null=True,
+        help_text='When the last full sync of the portal completed'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Bitrix Sync State'
+        verbose_name_plural = 'Bitrix Sync States'
+        constraints = [
+            models.UniqueConstraint(fields=['portal', 'entity'], name='unique_bitrix_sync_state'),
+        ]
+
+    def __str__(self):
+        return f"{self.portal} {self.entity} (modified since {self.last_modified})"
+
+    def start_run(self, run_id):
+        """
+        Reset the checkpoint for a new full sync
+        """
+        self.run_id = run_id
+        self.cursor_id = None
+        self.cursor_offset = 0
+        self.cursor_modified = None
+
+    def finish_run(self):
+        """
+        Clear the checkpoint of a completed full sync and record its completion
+        """
+        self.start_run(None)
+        self.completed_at = timezone.now()
+
+
+class BitrixOutbox(models.Model):
+    """
+    Pending write to Bitrix24, recorded in the same transaction as the local
+    change and delivered by the process_bitrix_outbox command
+    """
+    OPERATION_CONTACT_ADD = 'contact.add'
+    OPERATION_CHOICES = [
+        (OPERATION_CONTACT_ADD, 'Add contact'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_SYNCED = 'synced'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SYNCED, 'Synced'),
+        (STATUS_DEAD, 'Dead letter'),
+    ]
+
+    contact = models.ForeignKey(BitrixContact, on_delete=models.CASCADE, related_name='outbox_entries')
+    operation = models.CharField(max_length=20, choices=OPERATION_CHOICES)
+    payload = models.JSONField(default=dict)
+    idempotency_key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    bitrix_id = models.PositiveBigIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Bitrix Outbox Entry'
+        verbose_name_plural = 'Bitrix Outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='bitrix_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.operation} for {self.contact} ({self.status})"
+
+
+class BitrixEvent(models.Model):
+    """
+    Change notification received from a Bitrix24 outbound webhook, queued
+    until the process_bitrix_events command applies it
+    """
+    ENTITY_CONTACT = BitrixSyncState.ENTITY_CONTACT
+    ENTITY_DEAL = BitrixSyncState.ENTITY_DEAL
+    ENTITY_CHOICES = BitrixSyncState.ENTITY_CHOICES
+
+    event = models.CharField(max_length=50)
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    bitrix_id = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Bitrix Event'
+        verbose_name_plural = 'Bitrix Events'
+
+    def __str__(self):
+        return f"{self.event} {self.bitrix_id}"
+
+
+class BitrixSyncRun(models.Model):
+    """
+    History of sync_bitrix_contacts runs with their timings and counters
+    """
+    ENTITY_CHOICES = BitrixSyncState.ENTITY_CHOICES
+
+    MODE_FULL = 'full'
+    MODE_INCREMENTAL = 'incremental'
+    MODE_RESUME = 'resume'
+    MODE_RECONCILE = 'reconcile'
+    MODE_CHOICES = [
+        (MODE_FULL, 'Full'),
+        (MODE_INCREMENTAL, 'Incremental'),
+        (MODE_RESUME, 'Resume'),
+        (MODE_RECONCILE, 'Reconcile'),
+    ]
+
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    run_id = models.UUIDField(
+        blank=True, null=True,
+        help_text='Checkpoint run this sync wrote to, shared by a run and its resumes'
+    )
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_created = models.PositiveIntegerField(default=0)
+    rows_updated = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    rows_deleted = models.PositiveIntegerField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+    retries = models.PositiveIntegerField(default=0)
+    rate_limited = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(blank=True, null=True, help_text='Wall-clock seconds')
+    rows_per_second = models.FloatField(blank=True, null=True)
+    phases = models.JSONField(default=dict, blank=True, help_text='Seconds and calls per sync phase')
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        verbose_name = 'Bitrix Sync Run'
+        verbose_name_plural = 'Bitrix Sync Runs'
+
+    def __str__(self):
+        return f"{self.entity} {self.mode} sync at {self.started_at} ({self.status})"
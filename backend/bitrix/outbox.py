@@ -0,0 +1,312 @@
+"""
+Transactional outbox for writes from the local database to Bitrix24.
+
+Views record an outbox entry in the same transaction as the local change and
+return immediately; the process_bitrix_outbox command delivers the entries,
+retrying failures with backoff and dead-lettering those that keep failing.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import contacts_changed
+from .client import BATCH_LIMIT, BitrixError, QueryLimitExceeded, get_client
+from .models import BitrixContact, BitrixOutbox
+
+logger = logging.getLogger(__name__)
+
+# Tags contacts created by this app so deliveries can be matched on retry
+ORIGINATOR_ID = 'reyada'
+
+DEFAULT_MAX_ATTEMPTS = 8
+
+# A claimed entry is hidden from other workers for this long
+LEASE = timedelta(minutes=5)
+
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+
+@dataclass
+class OutboxResult:
+    """
+    Counts of entries handled by one process_outbox pass
+    """
+    synced: int = 0
+    retried: int = 0
+    dead: int = 0
+
+
+def contact_fields(contact):
+    """
+    Build the crm.contact.add fields for a local contact
+    """
+    fields = {
+        "NAME": contact.name or "",
+        "LAST_NAME": contact.last_name or "",
+        "EMAIL": [{"VALUE": contact.email, "VALUE_TYPE": "WORK"}]
+    }
+
+    # Add phone if available
+    if contact.phone:
+        fields["PHONE"] = [{"VALUE": contact.phone, "VALUE_TYPE": "WORK"}]
+    return fields
+
+
+def enqueue_contact_add(contact):
+    """
+    Record that a contact must be created in Bitrix24.
+
+    Call this inside the transaction that saves the contact, so the entry
+    exists if and only if the contact does.
+    """
+    return BitrixOutbox.objects.create(
+        contact=contact,
+        operation=BitrixOutbox.OPERATION_CONTACT_ADD,
+        payload=contact_fields(contact),
+    )
+
+
+def enqueue_contact_adds(contacts):
+    """
+    Bulk version of enqueue_contact_add for contacts that were just saved,
+    with one insert for all of their entries
+    """
+    return BitrixOutbox.objects.bulk_create([
+        BitrixOutbox(
+            contact=contact,
+            operation=BitrixOutbox.OPERATION_CONTACT_ADD,
+            payload=contact_fields(contact),
+        )
+        for contact in contacts
+    ])
+
+
+def enqueue_unsynced_contacts(include_failed=False):
+    """
+    Create outbox entries for contacts that still need to reach Bitrix24 and
+    have no pending entry, e.g. rows written by an import. Returns the number
+    of entries created.
+    """
+    statuses = [BitrixContact.SYNC_PENDING]
+    if include_failed:
+        statuses.append(BitrixContact.SYNC_FAILED)
+
+    contacts = (
+        BitrixContact.objects.filter(bitrix_id__isnull=True, sync_status__in=statuses)
+        .exclude(outbox_entries__status=BitrixOutbox.STATUS_PENDING)
+        .order_by('pk')
+    )
+
+    created = 0
+    chunk = []
+    for contact in contacts.iterator(chunk_size=1000):
+        chunk.append(contact)
+        if len(chunk) >= 1000:
+            created += _enqueue_chunk(chunk)
+            chunk = []
+    if chunk:
+        created += _enqueue_chunk(chunk)
+    return created
+
+
+def _enqueue_chunk(contacts):
+    with transaction.atomic():
+        enqueue_contact_adds(contacts)
+        BitrixContact.objects.filter(pk__in=[contact.pk for contact in contacts]).update(
+            sync_status=BitrixContact.SYNC_PENDING, updated_at=timezone.now()
+        )
+        contacts_changed()
+    return len(contacts)
+
+
+def claim_due_entries(limit):
+    """
+    Lease up to `limit` due entries so concurrent workers skip them
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            BitrixOutbox.objects.select_for_update(skip_locked=True)
+            .select_related('contact')
+            .filter(status=BitrixOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:limit]
+        )
+        BitrixOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+            next_attempt_at=now + LEASE
+        )
+    return entries
+
+
+def find_delivered(client, entries):
+    """
+    Return {idempotency key: Bitrix ID} for entries already created upstream
+    """
+    rows, _, _ = client.contact_list({
+        'filter': {
+            'ORIGINATOR_ID': ORIGINATOR_ID,
+            '@ORIGIN_ID': [str(entry.idempotency_key) for entry in entries],
+        },
+        'select': ['ID', 'ORIGIN_ID'],
+    })
+    return {row['ORIGIN_ID']: int(row['ID']) for row in rows if row.get('ORIGIN_ID')}
+
+
+def deliver_batch(client, entries):
+    """
+    Push up to 50 entries with crm.contact.add commands in one batch request.
+
+    Returns {entry pk: Bitrix ID or the exception the command failed with}.
+    The idempotency key travels as ORIGIN_ID, the batch is never repeated by
+    the client, and retried entries are looked up first, so a call that
+    succeeded upstream but failed locally does not create the contact twice.
+    """
+    outcomes = {}
+
+    # last_error too, as retrying an entry from the admin resets attempts
+    retried = [entry for entry in entries if entry.attempts or entry.last_error]
+    if retried:
+        delivered = find_delivered(client, retried)
+        for entry in retried:
+            bitrix_id = delivered.get(str(entry.idempotency_key))
+            if bitrix_id:
+                outcomes[entry.pk] = bitrix_id
+
+    pending = [entry for entry in entries if entry.pk not in outcomes]
+    if not pending:
+        return outcomes
+
+    commands = {
+        f'add_{entry.pk}': ('crm.contact.add', {
+            'fields': {
+                **entry.payload,
+                'ORIGINATOR_ID': ORIGINATOR_ID,
+                'ORIGIN_ID': str(entry.idempotency_key),
+            },
+        })
+        for entry in pending
+    }
+    # halt=0 so one rejected contact does not stop the rest of the batch.
+    # The batch is not retried on a server error or dropped connection, as
+    # Bitrix24 may have created the contacts anyway; the entries are retried
+    # later, after looking up their ORIGIN_ID.
+    batch = client.batch(commands, halt=False, idempotent=False)
+
+    for entry in pending:
+        key = f'add_{entry.pk}'
+        bitrix_id = batch['result'].get(key)
+        if bitrix_id:
+            outcomes[entry.pk] = int(bitrix_id)
+            continue
+
+        error = batch['result_error'].get(key)
+        error = error if isinstance(error, dict) else {}
+        code = error.get('error', 'NO_RESULT')
+        if code == 'QUERY_LIMIT_EXCEEDED':
+            outcomes[entry.pk] = QueryLimitExceeded()
+        else:
+            outcomes[entry.pk] = BitrixError(code, error.get('error_description', ''))
+    return outcomes
+
+
+def mark_synced(delivered):
+    """
+    Record successful deliveries, given as (entry, Bitrix ID) pairs, on the
+    entries and their contacts
+    """
+    now = timezone.now()
+    contacts = []
+    for entry, bitrix_id in delivered:
+        entry.status = BitrixOutbox.STATUS_SYNCED
+        entry.attempts += 1
+        entry.bitrix_id = bitrix_id
+        entry.last_error = ''
+        entry.updated_at = now
+
+        contact = entry.contact
+        contact.bitrix_id = bitrix_id
+        contact.sync_status = BitrixContact.SYNC_SYNCED
+        contact.updated_at = now
+        contacts.append(contact)
+
+    with transaction.atomic():
+        BitrixOutbox.objects.bulk_update(
+            [entry for entry, _ in delivered],
+            ['status', 'attempts', 'bitrix_id', 'last_error', 'updated_at'],
+        )
+        BitrixContact.objects.bulk_update(contacts, ['bitrix_id', 'sync_status', 'updated_at'])
+        contacts_changed()
+
+
+def mark_failed(entry, error, retryable, max_attempts):
+    """
+    Schedule a retry with exponential backoff, or dead-letter the entry once
+    it is not retryable or has used all of its attempts. Returns True if the
+    entry was dead-lettered.
+    """
+    with transaction.atomic():
+        entry.attempts += 1
+        entry.last_error = str(error)[:2000]
+        dead = not retryable or entry.attempts >= max_attempts
+        if dead:
+            entry.status = BitrixOutbox.STATUS_DEAD
+            BitrixContact.objects.filter(pk=entry.contact_id).update(
+                sync_status=BitrixContact.SYNC_FAILED, updated_at=timezone.now()
+            )
+            contacts_changed()
+        else:
+            delay = min(RETRY_BASE_DELAY * (2 ** (entry.attempts - 1)), RETRY_MAX_DELAY)
+            entry.next_attempt_at = timezone.now() + delay
+        entry.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'updated_at'])
+    return dead
+
+
+def process_outbox(limit=100, max_attempts=None, client=None):
+    """
+    Deliver up to `limit` due outbox entries, 50 per batch request, and
+    return an OutboxResult
+    """
+    client = client or get_client()
+    max_attempts = max_attempts or getattr(settings, 'BITRIX24_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    result = OutboxResult()
+
+    entries = claim_due_entries(limit)
+    for i in range(0, len(entries), BATCH_LIMIT):
+        chunk = entries[i:i + BATCH_LIMIT]
+        try:
+            outcomes = deliver_batch(client, chunk)
+        except (requests.RequestException, BitrixError) as e:
+            # The request itself failed, so nothing in the chunk was confirmed
+            outcomes = {entry.pk: e for entry in chunk}
+            batch_failed = True
+        else:
+            batch_failed = False
+
+        delivered = []
+        for entry in chunk:
+            outcome = outcomes[entry.pk]
+            if not isinstance(outcome, Exception):
+                delivered.append((entry, outcome))
+                continue
+
+            # Network failures and rate limits are worth retrying later; a
+            # contact Bitrix rejected will fail the same way again
+            retryable = batch_failed or isinstance(outcome, QueryLimitExceeded)
+            if mark_failed(entry, outcome, retryable, max_attempts):
+                result.dead += 1
+                logger.error(f"Outbox entry {entry.pk} dead-lettered after {entry.attempts} attempts: {outcome}")
+            else:
+                result.retried += 1
+                logger.warning(f"Outbox entry {entry.pk} failed (attempt {entry.attempts}), will retry: {outcome}")
+
+        if delivered:
+            mark_synced(delivered)
+            result.synced += len(delivered)
+            logger.info(f"Delivered {len(delivered)} outbox entries to Bitrix24")
+
+    return result
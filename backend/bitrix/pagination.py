@@ -0,0 +1,123 @@
+"""
+Keyset pagination for the Bitrix contact list
+"""
+import json
+
+from django.conf import settings
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+# Sort keys of the contact list, in order. Names are nullable, so they are
+# compared through COALESCE, matching the bitrix_contact_list_idx index.
+CONTACT_SORT_KEYS = {
+    'sort_last_name': Coalesce('last_name', Value('')),
+    'sort_name': Coalesce('name', Value('')),
+    'id': None,
+}
+
+
+class ContactCursorPagination(CursorPagination):
+    """
+    Cursor pagination over (last_name, name, id).
+
+    DRF's CursorPagination only positions on the first ordering field and
+    skips over ties with an offset. Here the cursor holds the full sort key
+    of the last row, and each page is read with a row comparison against it,
+    so a page costs one index range scan however deep it is.
+    """
+    page_size = getattr(settings, 'BITRIX24_CONTACTS_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'BITRIX24_CONTACTS_MAX_PAGE_SIZE', 500)
+    ordering = tuple(CONTACT_SORT_KEYS)
+    sort_keys = CONTACT_SORT_KEYS
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        position = self._decode_position(cursor)
+        reverse = cursor.reverse if cursor else False
+
+        queryset = queryset.annotate(
+            **{name: expression for name, expression in self.sort_keys.items() if expression is not None}
+        )
+        if position is not None:
+            queryset = queryset.filter(self._after(position, reverse))
+
+        # One extra row tells whether there is another page in this direction
+        order = [f'-{name}' if reverse else name for name in self.sort_keys]
+        rows = list(queryset.order_by(*order)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        self.page = rows
+        return rows
+
+    def _decode_position(self, cursor):
+        if cursor is None or cursor.position is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.sort_keys):
+            raise NotFound(self.invalid_cursor_message)
+        # The cursor comes from the client, so a tampered value must not reach
+        # the query: the name keys are strings and the id an integer
+        for value, expression in zip(position, self.sort_keys.values()):
+            expected = str if expression is not None else int
+            if not isinstance(value, expected) or isinstance(value, bool):
+                raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def _after(self, position, reverse):
+        """
+        Build the row comparison (k1, k2, ...) > position, or < when reverse,
+        expanded as k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...
+        """
+        names = list(self.sort_keys)
+        lookup = 'lt' if reverse else 'gt'
+
+        condition = Q()
+        for index, name in enumerate(names):
+            equal = {prefix: value for prefix, value in zip(names[:index], position)}
+            condition |= Q(**equal, **{f'{name}__{lookup}': position[index]})
+
+        # The redundant bound on the first key lets the planner start an
+        # index range scan instead of evaluating the OR for every row
+        first = Q(**{f'{names[0]}__{lookup}e': position[0]})
+        return first & condition
+
+    def _position(self, row):
+        # Rows are model instances, or dicts when the queryset uses values()
+        if isinstance(row, dict):
+            return json.dumps([row[name] for name in self.sort_keys])
+        return json.dumps([getattr(row, name) for name in self.sort_keys])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = Cursor(offset=0, reverse=False, position=self._position(self.page[-1]))
+        return self.encode_cursor(cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        cursor = Cursor(offset=0, reverse=True, position=self._position(self.page[0]))
+        return self.encode_cursor(cursor)
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+        }
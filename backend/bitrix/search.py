@@ -0,0 +1,102 @@
+"""
+Contact search over the normalized search columns of BitrixContact and its
+search tokens
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+# Shortest term matched anywhere in the text through the trigram index;
+# shorter terms only match as prefixes, which a B-tree index serves
+TRIGRAM_MIN_LENGTH = 3
+
+# Sorts after every character that can follow a prefix
+PREFIX_END = '\uffff'
+
+# Longest search token stored; longer words are matched on this prefix
+TOKEN_MAX_LENGTH = 100
+
+
+def normalize_search_text(*values):
+    """
+    Lowercase, strip accents and collapse whitespace, so search terms and
+    stored text compare the same way
+    """
+    text = ' '.join(value for value in values if value)
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def phone_digits(phone):
+    """
+    Return only the digits of a phone number
+    """
+    return re.sub(r'\D', '', phone or '')
+
+
+def _word_parts(text):
+    # Split at punctuation, so the pieces of an email are words of their own
+    return [part for part in re.split(r'[\W_]+', text) if part]
+
+
+def search_tokens(search_text, phone=None):
+    """
+    Return the tokens a contact is found by with a prefix: every word of its
+    search_text, the parts of those words between punctuation, and the digit
+    groups of its phone number
+    """
+    tokens = set()
+    for word in search_text.split():
+        tokens.add(word)
+        tokens.update(_word_parts(word))
+    tokens.update(re.findall(r'\d+', phone or ''))
+    return {token[:TOKEN_MAX_LENGTH] for token in tokens}
+
+
+def _prefix(field, value):
+    # A range rather than LIKE 'x%', so every backend can use a plain
+    # B-tree index whatever its collation and LIKE case rules
+    return Q(**{f'{field}__gte': value, f'{field}__lt': value + PREFIX_END})
+
+
+def search_contacts(queryset, term):
+    """
+    Filter contacts whose name, last name, email or phone number match the
+    term, using indexes on every backend.
+
+    On PostgreSQL, terms of three or more characters are substring matches
+    served by the trigram indexes on search_text and phone_digits. Other
+    backends, and shorter terms, look up every part of the term as a prefix
+    of the contact's search tokens (words of the name, last name and email,
+    and digit groups of the phone), and match phone digits by prefix or
+    suffix through phone_digits and phone_digits_reversed. There, a run of
+    digits spanning two groups in the middle of a number is not found.
+    """
+    from .models import BitrixContactSearchToken
+
+    text = normalize_search_text(term)
+    digits = phone_digits(term)
+    if not text:
+        return queryset
+    trigram = connection.vendor == 'postgresql'
+
+    if trigram and len(text) >= TRIGRAM_MIN_LENGTH:
+        condition = Q(search_text__contains=text)
+    else:
+        parts = _word_parts(text)
+        condition = Q() if parts else _prefix('search_text', text)
+        for part in parts:
+            tokens = BitrixContactSearchToken.objects.filter(_prefix('token', part[:TOKEN_MAX_LENGTH]))
+            condition &= Q(pk__in=tokens.values('contact_id'))
+
+    # Only terms that look like a phone number search the phone digits
+    if digits and not re.search(r'[^\d\s()+.-]', term):
+        if trigram and len(digits) >= TRIGRAM_MIN_LENGTH:
+            condition |= Q(phone_digits__contains=digits)
+        else:
+            condition |= _prefix('phone_digits', digits) | _prefix('phone_digits_reversed', digits[::-1])
+
+    return queryset.filter(condition)
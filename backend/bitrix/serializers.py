@@ -1,8 +1,12 @@
+from operator import itemgetter
+
+from django.utils import timezone
 from rest_framework import serializers
-from .models import BitrixContact
+from ReyadaTasks.sparse_fields import SparseFieldsMixin
+from .models import BitrixContact, BitrixDeal, normalize_email
 
 
-class BitrixContactSerializer(serializers.ModelSerializer):
+class BitrixContactSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for BitrixContact model
     """
@@ -10,19 +14,70 @@ class BitrixContactSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = BitrixContact
-        fields = ['id', 'name', 'last_name', 'email', 'phone', 'full_name', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'last_name', 'email', 'phone', 'full_name', 'sync_status', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'sync_status', 'created_at', 'updated_at']
+        # Uniqueness is enforced by the database constraint on Lower(email),
+        # which the create view maps to a validation error, instead of a
+        # query per request that could race with a concurrent insert
+        extra_kwargs = {'email': {'validators': []}}
+
+    # Columns read by from_values()
+    VALUE_FIELDS = ['id', 'name', 'last_name', 'email', 'phone', 'sync_status', 'created_at', 'updated_at']
+
+    @classmethod
+    def value_fields(cls, fields):
+        """
+        Return the columns from_values() reads to output `fields`. The ID is
+        always read, as the contacts list pages on it.
+        """
+        columns = {'id'}
+        for field in fields:
+            columns.update(['name', 'last_name'] if field == 'full_name' else [field])
+        return [column for column in cls.VALUE_FIELDS if column in columns]
+
+    @classmethod
+    def from_values(cls, rows, fields=None):
+        """
+        Serialize rows of queryset.values(*VALUE_FIELDS) into exactly what the
+        serializer outputs for the same contacts, without creating model
+        instances or walking the fields of every row. Keep in step with
+        Meta.fields.
+
+        With `fields`, only those keys are output, and the rows only need
+        the columns given by value_fields().
+        """
+        # Resolving the active timezone once, rather than per value, is most
+        # of the saving over the field by field path
+        datetime = serializers.DateTimeField(default_timezone=timezone.get_current_timezone()).to_representation
+        if fields is None:
+            return [
+                {
+                    'id': row['id'],
+                    'name': row['name'],
+                    'last_name': row['last_name'],
+                    'email': row['email'],
+                    'phone': row['phone'],
+                    'full_name': f"{row['name'] or ''} {row['last_name'] or ''}".strip(),
+                    'sync_status': row['sync_status'],
+                    'created_at': datetime(row['created_at']),
+                    'updated_at': datetime(row['updated_at']),
+                }
+                for row in rows
+            ]
+
+        computed = {
+            'full_name': lambda row: f"{row['name'] or ''} {row['last_name'] or ''}".strip(),
+            'created_at': lambda row: datetime(row['created_at']),
+            'updated_at': lambda row: datetime(row['updated_at']),
+        }
+        getters = [(field, computed.get(field) or itemgetter(field)) for field in fields]
+        return [{field: get(row) for field, get in getters} for row in rows]
 
     def validate_email(self, value):
         """
-        Validate email uniqueness
+        Normalize email to the stored form
         """
-        if value:
-            value = value.strip().lower()
-            # Check for existing email (case-insensitive)
-            if BitrixContact.objects.filter(email__iexact=value).exists():
-                raise serializers.ValidationError("A contact with this email already exists.")
-        return value
+        return normalize_email(value) if value else value
 
     def validate_name(self, value):
         """
@@ -43,3 +98,46 @@ class BitrixContactSerializer(serializers.ModelSerializer):
         Clean phone field
         """
         return value.strip() if value else value
+
+
+class BitrixContactExportSerializer(serializers.Serializer):
+    """
+    Query parameters of the contacts export
+    """
+    type = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    fields = serializers.CharField(required=False)
+    updated_since = serializers.DateTimeField(required=False)
+    sync_status = serializers.ChoiceField(choices=BitrixContact.SYNC_STATUS_CHOICES, required=False)
+
+    def validate_fields(self, value):
+        """
+        Split the comma-separated column list and check every column exists
+        """
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in BitrixContactSerializer.Meta.fields]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown fields: {', '.join(unknown)}.")
+        return fields or BitrixContactSerializer.Meta.fields
+
+
+class BitrixDealSerializer(serializers.ModelSerializer):
+    """
+    Serializer for BitrixDeal rows, using the crm.deal.list field names so the
+    frontend reads local and live deals the same way
+    """
+    ID = serializers.CharField(source='bitrix_id')
+    TITLE = serializers.CharField(source='title')
+    STAGE_ID = serializers.CharField(source='stage_id')
+    OPPORTUNITY = serializers.DecimalField(source='opportunity', max_digits=18, decimal_places=2)
+    CURRENCY_ID = serializers.CharField(source='currency_id')
+    CONTACT_ID = serializers.CharField(source='contact_bitrix_id')
+    COMPANY_ID = serializers.CharField(source='company_bitrix_id')
+    DATE_CREATE = serializers.DateTimeField(source='date_create')
+    DATE_MODIFY = serializers.DateTimeField(source='date_modify')
+
+    class Meta:
+        model = BitrixDeal
+        fields = [
+            'ID', 'TITLE', 'STAGE_ID', 'OPPORTUNITY', 'CURRENCY_ID',
+            'CONTACT_ID', 'COMPANY_ID', 'DATE_CREATE', 'DATE_MODIFY',
+        ]
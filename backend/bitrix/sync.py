@@ -0,0 +1,473 @@
+"""
+Helpers for syncing Bitrix24 CRM contacts and deals into the local database
+"""
+import hashlib
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import contacts_changed
+from .metrics import measure
+from .models import BitrixContact, BitrixDeal, BitrixSyncState, normalize_email, refresh_search_tokens
+
+# Contact fields requested from crm.contact.list
+CONTACT_FIELDS = ['ID', 'NAME', 'LAST_NAME', 'EMAIL', 'PHONE', 'DATE_MODIFY']
+
+# Fields the sync owns on BitrixContact
+SYNCED_FIELDS = ['name', 'last_name', 'phone', 'bitrix_id']
+
+# Columns written when a synced contact is created or changed
+CONTACT_WRITE_FIELDS = SYNCED_FIELDS + BitrixContact.SEARCH_FIELDS + ['sync_hash', 'deleted_at', 'updated_at']
+
+# Fields the sync owns on BitrixDeal
+DEAL_SYNCED_FIELDS = [
+    'title', 'stage_id', 'opportunity', 'currency_id', 'contact_bitrix_id',
+    'company_bitrix_id', 'date_create', 'date_modify',
+]
+
+# Rows per INSERT/UPDATE statement
+DEFAULT_BATCH_SIZE = 500
+
+# Local Bitrix IDs read per query, and removed per statement, during reconciliation
+RECONCILE_CHUNK_SIZE = 1000
+
+
+@dataclass
+class UpsertResult:
+    """
+    Outcome of a batched upsert
+    """
+    created: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    unchanged: list = field(default_factory=list)
+    duplicates: int = 0
+
+
+def parse_contact(contact_data):
+    """
+    Convert a Bitrix24 contact record into BitrixContact field values.
+
+    Returns None when the contact has no usable email address.
+    """
+    email_list = contact_data.get('EMAIL', [])
+    phone_list = contact_data.get('PHONE', [])
+
+    if not email_list or not isinstance(email_list, list):
+        return None
+
+    # Use the first email address
+    email = normalize_email(email_list[0].get('VALUE'))
+    if not email:
+        return None
+
+    # Use the first phone number
+    phone = ''
+    if phone_list and isinstance(phone_list, list):
+        phone = (phone_list[0].get('VALUE') or '').strip()
+
+    bitrix_id = contact_data.get('ID')
+
+    return {
+        'email': email,
+        'name': (contact_data.get('NAME') or '').strip(),
+        'last_name': (contact_data.get('LAST_NAME') or '').strip(),
+        'phone': phone,
+        'bitrix_id': int(bitrix_id) if bitrix_id else None,
+    }
+
+
+def _parse_id(value):
+    try:
+        return int(value) or None
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_deal(deal_data):
+    """
+    Convert a Bitrix24 deal record into BitrixDeal field values.
+
+    Returns None when the deal has no ID.
+    """
+    bitrix_id = _parse_id(deal_data.get('ID'))
+    if bitrix_id is None:
+        return None
+
+    try:
+        opportunity = Decimal(str(deal_data['OPPORTUNITY'])).quantize(Decimal('0.01'))
+    except (KeyError, InvalidOperation):
+        opportunity = None
+
+    return {
+        'bitrix_id': bitrix_id,
+        'title': (deal_data.get('TITLE') or '').strip()[:255],
+        'stage_id': deal_data.get('STAGE_ID') or '',
+        'opportunity': opportunity,
+        'currency_id': deal_data.get('CURRENCY_ID') or '',
+        'contact_bitrix_id': _parse_id(deal_data.get('CONTACT_ID')),
+        'company_bitrix_id': _parse_id(deal_data.get('COMPANY_ID')),
+        'date_create': parse_bitrix_datetime(deal_data.get('DATE_CREATE')),
+        'date_modify': parse_bitrix_datetime(deal_data.get('DATE_MODIFY')),
+    }
+
+
+def contact_hash(row):
+    """
+    Return a compact hash of the synced fields of a parsed contact row
+    """
+    values = [row['email']] + [
+        '' if row[field_name] is None else str(row[field_name])
+        for field_name in SYNCED_FIELDS
+    ]
+    return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=8).hexdigest()
+
+
+def parse_bitrix_datetime(value):
+    """
+    Parse a Bitrix24 timestamp such as 2025-07-14T12:30:00+03:00
+    """
+    if not value:
+        return None
+    try:
+        return parse_datetime(value)
+    except ValueError:
+        return None
+
+
+def latest_modified(records, current=None):
+    """
+    Return the newest DATE_MODIFY among records, or current if none is newer
+    """
+    for record in records:
+        modified = parse_bitrix_datetime(record.get('DATE_MODIFY'))
+        if modified and (current is None or modified > current):
+            current = modified
+    return current
+
+
+def current_portal():
+    """
+    Return the key sync states are stored under for the configured portal
+    """
+    return getattr(settings, 'BITRIX24_DOMAIN', None) or settings.BITRIX24_BASE_URL
+
+
+def get_sync_state(entity):
+    """
+    Return the sync state of an entity for the configured portal.
+
+    The row is not created until it is first saved, so dry runs leave the
+    database untouched.
+    """
+    portal = current_portal()
+    state = BitrixSyncState.objects.filter(portal=portal, entity=entity).first()
+    return state or BitrixSyncState(portal=portal, entity=entity)
+
+
+def upsert_contacts(rows, batch_size=DEFAULT_BATCH_SIZE, metrics=None):
+    """
+    Create or update contacts keyed by Bitrix ID using batched queries.
+
+    Existing rows are looked up with a single query that reads their sync
+    hash, by Bitrix ID or, for local contacts without one yet, by email. A
+    contact whose email changed in Bitrix24 keeps its row and takes the new
+    email. Rows whose hash is unchanged are not written at all, so a sync
+    with no upstream changes costs one SELECT per page. New rows are written
+    with bulk_create and changed rows with bulk_update. When the same
+    contact or email appears more than once the last row wins and the others
+    are counted as duplicates, as are contacts whose email is held by
+    another Bitrix24 contact locally. Contacts that were soft-deleted are
+    restored when they come back.
+
+    When given a SyncMetrics, the lookup and the writes are timed as the
+    db_lookup and db_write phases.
+    """
+    result = UpsertResult()
+
+    # One row per Bitrix contact, then one per email
+    latest = {}
+    for row in rows:
+        latest[row['bitrix_id'] if row['bitrix_id'] is not None else row['email']] = row
+    latest = {row['email']: row for row in latest.values()}
+    result.duplicates = len(rows) - len(latest)
+    if not latest:
+        return result
+
+    bitrix_ids = [row['bitrix_id'] for row in latest.values() if row['bitrix_id'] is not None]
+    with measure(metrics, 'db_lookup'):
+        found = list(BitrixContact.objects.filter(
+            Q(bitrix_id__in=bitrix_ids) | Q(email__in=latest.keys())
+        ).values_list('pk', 'email', 'bitrix_id', 'sync_hash', 'deleted_at'))
+    by_bitrix_id = {local[2]: local for local in found if local[2] is not None}
+    by_email = {local[1]: local for local in found}
+
+    matches = {}
+    for email, row in latest.items():
+        match = by_bitrix_id.get(row['bitrix_id']) if row['bitrix_id'] is not None else None
+        if match is None:
+            local = by_email.get(email)
+            if local is not None and (local[2] is None or row['bitrix_id'] is None):
+                match = local
+        matches[email] = match
+
+    # An email held by another local contact is only free if that contact
+    # moves to a new email in this page; drop the rows that would clash,
+    # until no move depends on a dropped one
+    clashing = set()
+    while True:
+        moving = {
+            match[0] for email, match in matches.items()
+            if match is not None and match[1] != email and email not in clashing
+        }
+        new_clashes = {
+            email for email, match in matches.items()
+            if email not in clashing
+            and email in by_email
+            and by_email[email][0] != (match[0] if match is not None else None)
+            and by_email[email][0] not in moving
+        }
+        if not new_clashes:
+            break
+        clashing |= new_clashes
+    result.duplicates += len(clashing)
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    handed_over = []
+    for email, row in latest.items():
+        match = matches[email]
+        if email in clashing:
+            continue
+        if match is None:
+            contact = BitrixContact(**row, sync_hash=contact_hash(row))
+            contact.refresh_search_fields()
+            to_create.append(contact)
+            continue
+
+        pk, _, bitrix_id, sync_hash, deleted_at = match
+        # Keep a known Bitrix ID when the source row does not carry one
+        if row['bitrix_id'] is None:
+            row = {**row, 'bitrix_id': bitrix_id}
+        row_hash = contact_hash(row)
+
+        contact = BitrixContact(pk=pk, **row, sync_hash=row_hash, updated_at=now)
+        if row_hash == sync_hash and deleted_at is None:
+            result.unchanged.append(contact)
+        else:
+            contact.refresh_search_fields()
+            to_update.append(contact)
+        if email in by_email and by_email[email][0] != pk:
+            handed_over.append(by_email[email][0])
+
+    with measure(metrics, 'db_write'), transaction.atomic():
+        if handed_over:
+            # Emails passed from one contact to another in this page are
+            # released first, since the unique index is checked row by row
+            BitrixContact.objects.bulk_update(
+                [BitrixContact(pk=pk, email=f'{pk}@released.invalid') for pk in handed_over], ['email']
+            )
+
+        if to_update:
+            # bulk_update bypasses auto_now, so updated_at is set explicitly above;
+            # deleted_at is None on every instance, which restores deleted contacts
+            BitrixContact.objects.bulk_update(to_update, ['email'] + CONTACT_WRITE_FIELDS, batch_size=batch_size)
+            result.updated = to_update
+
+        if to_create:
+            # A contact created through the API since the lookup becomes an update
+            result.created = BitrixContact.objects.bulk_create(
+                to_create,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['email'],
+                update_fields=CONTACT_WRITE_FIELDS,
+            )
+
+        refresh_search_tokens(to_update + result.created)
+
+    if to_create or to_update:
+        contacts_changed()
+
+    return result
+
+
+def _ascending_ids(queryset):
+    """
+    Yield the bitrix_id of every row of `queryset` in ascending order,
+    reading them in keyset chunks so no cursor stays open while rows are
+    updated
+    """
+    queryset = queryset.order_by('bitrix_id').values_list('bitrix_id', flat=True)
+
+    last = None
+    while True:
+        chunk = queryset.filter(bitrix_id__gt=last) if last is not None else queryset
+        chunk = list(chunk[:RECONCILE_CHUNK_SIZE])
+        if not chunk:
+            return
+        yield from chunk
+        last = chunk[-1]
+
+
+def _missing_ids(local_ids, remote_ids):
+    """
+    Yield the IDs of the ascending `local_ids` that the ascending
+    `remote_ids` lack, holding one ID of each side at a time
+    """
+    remote = iter(remote_ids)
+    remote_id = next(remote, None)
+    for local_id in local_ids:
+        while remote_id is not None and remote_id < local_id:
+            remote_id = next(remote, None)
+        # Either the stream passed local_id or it ended, so local_id is gone
+        if remote_id != local_id:
+            yield local_id
+
+
+def reconcile_contacts(remote_ids, fetch, dry_run=False):
+    """
+    Soft-delete local contacts whose Bitrix ID is missing upstream.
+
+    `remote_ids` must yield every Bitrix contact ID in ascending order, e.g.
+    streamed page by page from crm.contact.list. It is merged with the local
+    IDs, also ascending, so only one chunk of each side is held in memory.
+    Contacts written after the reconciliation started are left alone, since
+    the remote stream may already have passed their ID. As in
+    reconcile_deals, a contact deleted in Bitrix24 during the run shifts the
+    offset pages, so every missing ID is first looked up with `fetch(ids)`,
+    which returns {Bitrix ID: record} for those that exist, and only the
+    contacts it does not return are soft-deleted. Returns the number of
+    contacts soft-deleted, or that would be with dry_run.
+    """
+    started_at = timezone.now()
+    deleted = 0
+    missing = []
+
+    def flush():
+        nonlocal deleted
+        found = fetch(list(missing)) if missing else {}
+        gone = [bitrix_id for bitrix_id in missing if bitrix_id not in found]
+        if dry_run:
+            deleted += len(gone)
+        elif gone:
+            deleted += BitrixContact.objects.filter(
+                bitrix_id__in=gone, deleted_at__isnull=True
+            ).update(deleted_at=timezone.now(), updated_at=timezone.now())
+            contacts_changed()
+        missing.clear()
+
+    local_ids = _ascending_ids(BitrixContact.objects.filter(
+        bitrix_id__isnull=False, deleted_at__isnull=True, updated_at__lt=started_at
+    ))
+    for bitrix_id in _missing_ids(local_ids, remote_ids):
+        missing.append(bitrix_id)
+        if len(missing) >= RECONCILE_CHUNK_SIZE:
+            flush()
+
+    flush()
+    return deleted
+
+
+def reconcile_deals(remote_ids, started_at, fetch, dry_run=False):
+    """
+    Delete local deals whose Bitrix ID is missing upstream.
+
+    `remote_ids` are the ascending IDs read by a full sync that started at
+    `started_at`; deals written since then are left alone. A deal deleted in
+    Bitrix24 during the sync shifts the offset pages, so a live deal can be
+    missing from `remote_ids`: every missing ID is first looked up with
+    `fetch(ids)`, which returns {Bitrix ID: record} for those that exist,
+    and the deals found are upserted instead. Returns (deleted, restored)
+    counts, or what they would be with dry_run.
+    """
+    deleted = 0
+    restored = 0
+    missing = []
+
+    def flush():
+        nonlocal deleted, restored
+        records = fetch(list(missing)) if missing else {}
+        gone = [bitrix_id for bitrix_id in missing if bitrix_id not in records]
+        restored += len(records)
+        if dry_run:
+            deleted += len(gone)
+        else:
+            upsert_deals([row for row in map(parse_deal, records.values()) if row is not None])
+            deleted += BitrixDeal.objects.filter(bitrix_id__in=gone).delete()[0]
+        missing.clear()
+
+    local_ids = _ascending_ids(BitrixDeal.objects.filter(updated_at__lt=started_at))
+    for bitrix_id in _missing_ids(local_ids, remote_ids):
+        missing.append(bitrix_id)
+        if len(missing) >= RECONCILE_CHUNK_SIZE:
+            flush()
+
+    flush()
+    return deleted, restored
+
+
+def upsert_deals(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Create or update deals keyed by Bitrix ID, batched the same way as
+    upsert_contacts
+    """
+    result = UpsertResult()
+
+    latest = {}
+    for row in rows:
+        latest[row['bitrix_id']] = row
+    result.duplicates = len(rows) - len(latest)
+    if not latest:
+        return result
+
+    existing = {
+        deal.bitrix_id: deal
+        for deal in BitrixDeal.objects.filter(bitrix_id__in=latest.keys())
+    }
+
+    to_create = []
+    to_update = []
+    for bitrix_id, row in latest.items():
+        deal = existing.get(bitrix_id)
+        if deal is None:
+            to_create.append(BitrixDeal(**row))
+            continue
+
+        updated = False
+        for field_name in DEAL_SYNCED_FIELDS:
+            if getattr(deal, field_name) != row[field_name]:
+                setattr(deal, field_name, row[field_name])
+                updated = True
+
+        if updated:
+            to_update.append(deal)
+        else:
+            result.unchanged.append(deal)
+
+    if to_create:
+        # A deal written by a concurrent run since the lookup becomes an update
+        result.created = BitrixDeal.objects.bulk_create(
+            to_create,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['bitrix_id'],
+            update_fields=DEAL_SYNCED_FIELDS + ['updated_at'],
+        )
+
+    if to_update:
+        # bulk_update bypasses auto_now, so stamp updated_at explicitly
+        now = timezone.now()
+        for deal in to_update:
+            deal.updated_at = now
+        BitrixDeal.objects.bulk_update(
+            to_update, DEAL_SYNCED_FIELDS + ['updated_at'], batch_size=batch_size
+        )
+        result.updated = to_update
+
+    return result
@@ -0,0 +1,863 @@
+import base64
+import csv
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from openpyxl import Workbook
+from rest_framework.test import APITestCase
+
+from user.models import User
+from .cache import CONTACTS_VERSION_KEY, CacheWaitTimeout
+from .client import reset_client
+from .deals import mirror_is_synced
+from .fake_server import FakeBitrixServer
+from .models import BitrixContact, BitrixDeal, BitrixEvent, BitrixOutbox, BitrixSyncState
+from .outbox import enqueue_contact_add, process_outbox
+from .search import search_contacts
+from .sync import upsert_contacts
+
+
+class FakePortalMixin:
+    """
+    Point the Bitrix24 client at a FakeBitrixServer for the duration of a test
+    """
+    portal_options = {}
+
+    def setUp(self):
+        super().setUp()
+        self.portal = FakeBitrixServer(**self.portal_options)
+        self.portal.start()
+        self.addCleanup(self.portal.stop)
+
+        # No retries or rate limiting, so failures surface at once
+        settings = override_settings(
+            BITRIX24_BASE_URL=self.portal.url,
+            BITRIX24_MAX_RETRIES=0,
+            BITRIX24_REQUEST_MAX_RETRIES=0,
+            BITRIX24_RATE_LIMIT=1000,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+        cache.clear()
+
+    def call(self, *args):
+        out = io.StringIO()
+        call_command(*args, stdout=out)
+        return out.getvalue()
+
+
+class SyncContactsTests(FakePortalMixin, TestCase):
+    portal_options = {'contacts': 120, 'deals': 0, 'missing_email_every': 0}
+
+    def test_full_sync_creates_every_contact(self):
+        output = self.call('sync_bitrix_contacts')
+
+        self.assertIn('Sync completed successfully!', output)
+        self.assertEqual(BitrixContact.objects.count(), 120)
+        contact = BitrixContact.objects.get(bitrix_id=7)
+        self.assertEqual(contact.email, 'contact7@example.com')
+        self.assertEqual(contact.sync_status, BitrixContact.SYNC_SYNCED)
+
+        state = BitrixSyncState.objects.get(entity=BitrixSyncState.ENTITY_CONTACT)
+        self.assertIsNotNone(state.completed_at)
+        self.assertIsNotNone(state.last_modified)
+        self.assertIsNone(state.run_id)
+
+    def test_unchanged_contacts_are_not_written(self):
+        self.call('sync_bitrix_contacts')
+        before = dict(BitrixContact.objects.values_list('pk', 'updated_at'))
+
+        output = self.call('sync_bitrix_contacts')
+
+        self.assertIn('Updated contacts: 0', output)
+        self.assertEqual(dict(BitrixContact.objects.values_list('pk', 'updated_at')), before)
+
+    def test_max_pages_stops_and_resume_continues(self):
+        output = self.call('sync_bitrix_contacts', '--max-pages', '1')
+
+        self.assertNotIn('Sync completed successfully!', output)
+        self.assertIn('--resume', output)
+        self.assertEqual(BitrixContact.objects.count(), 50)
+        state = BitrixSyncState.objects.get(entity=BitrixSyncState.ENTITY_CONTACT)
+        self.assertIsNotNone(state.run_id)
+        self.assertIsNone(state.completed_at)
+        self.portal.reset_stats()
+
+        output = self.call('sync_bitrix_contacts', '--resume')
+
+        self.assertIn('Sync completed successfully!', output)
+        self.assertEqual(BitrixContact.objects.count(), 120)
+        # The resumed run starts after the last committed contact
+        self.assertEqual(self.portal.stats()['calls:crm.contact.list'], 2)
+
+    def test_incremental_sync_fetches_modified_contacts(self):
+        self.call('sync_bitrix_contacts')
+        edited = self.portal.touch_contacts(4)
+        self.portal.reset_stats()
+
+        self.call('sync_bitrix_contacts', '--incremental')
+
+        self.assertEqual(
+            set(BitrixContact.objects.filter(name__endswith='(edited)').values_list('bitrix_id', flat=True)),
+            set(edited)
+        )
+        self.assertEqual(self.portal.stats()['calls:crm.contact.list'], 1)
+
+    def test_incremental_sync_pages_through_contacts_modified_in_one_second(self):
+        self.call('sync_bitrix_contacts')
+        # More contacts than fit on a page share one DATE_MODIFY
+        self.portal.touch_contacts(120)
+
+        self.call('sync_bitrix_contacts', '--incremental')
+
+        self.assertEqual(BitrixContact.objects.filter(name__endswith='(edited)').count(), 120)
+
+    def test_batch_and_concurrent_fetches_match_a_plain_sync(self):
+        for args in (['--batch'], ['--concurrency', '4'], ['--batch', '--concurrency', '2']):
+            with self.subTest(args=args):
+                BitrixContact.objects.all().delete()
+                BitrixSyncState.objects.all().delete()
+                self.portal.reset_stats()
+
+                output = self.call('sync_bitrix_contacts', *args)
+
+                self.assertIn('Sync completed successfully!', output)
+                self.assertEqual(BitrixContact.objects.count(), 120)
+                self.assertEqual(BitrixContact.objects.get(bitrix_id=119).email, 'contact119@example.com')
+                stats = self.portal.stats()
+                if '--batch' in args:
+                    # The first call reads the total, the other two travel in a batch
+                    self.assertEqual(stats['calls:crm.contact.list'], 1)
+                    self.assertEqual(stats['batch_commands'], 2)
+                else:
+                    self.assertEqual(stats['calls:crm.contact.list'], 3)
+
+    def test_batch_reconcile(self):
+        self.call('sync_bitrix_contacts')
+        self.portal.delete_contacts([5, 80])
+
+        self.call('sync_bitrix_contacts', '--reconcile', '--batch')
+
+        self.assertEqual(
+            sorted(BitrixContact.objects.filter(deleted_at__isnull=False).values_list('bitrix_id', flat=True)),
+            [5, 80]
+        )
+
+    def test_email_change_updates_the_contact(self):
+        self.call('sync_bitrix_contacts')
+        contact = dict(self.portal.contact(10))
+        contact['EMAIL'] = [{'VALUE': 'new-address@example.com', 'VALUE_TYPE': 'WORK'}]
+        contact['DATE_MODIFY'] = '2030-01-01T00:00:00+00:00'
+        self.portal._contacts[10] = contact
+        self.portal._version += 1
+
+        self.call('sync_bitrix_contacts', '--incremental')
+
+        self.assertEqual(BitrixContact.objects.count(), 120)
+        self.assertEqual(BitrixContact.objects.get(bitrix_id=11).email, 'new-address@example.com')
+
+    def test_reconcile_soft_deletes_contacts_missing_upstream(self):
+        self.call('sync_bitrix_contacts')
+        self.portal.delete_contacts([3, 60])
+
+        self.call('sync_bitrix_contacts', '--reconcile')
+
+        deleted = BitrixContact.objects.filter(deleted_at__isnull=False)
+        self.assertEqual(set(deleted.values_list('bitrix_id', flat=True)), {3, 60})
+        self.assertEqual(BitrixContact.objects.filter(deleted_at__isnull=True).count(), 118)
+
+    def test_reconcile_keeps_contacts_shifted_by_a_deletion_during_the_run(self):
+        self.call('sync_bitrix_contacts')
+        handle = self.portal.handle
+        calls = []
+
+        def delete_after_first_page(method, params):
+            response = handle(method, params)
+            if method == 'crm.contact.list' and not calls:
+                calls.append(method)
+                self.portal.delete_contacts([3])
+            return response
+
+        self.portal.handle = delete_after_first_page
+        self.call('sync_bitrix_contacts', '--reconcile')
+
+        # Contact 51 moved onto the page already read, but is still live;
+        # contact 3 was read before it was deleted, so the next run finds it
+        self.assertFalse(BitrixContact.objects.filter(deleted_at__isnull=False).exists())
+
+        self.call('sync_bitrix_contacts', '--reconcile')
+
+        deleted = BitrixContact.objects.filter(deleted_at__isnull=False)
+        self.assertEqual(list(deleted.values_list('bitrix_id', flat=True)), [3])
+
+    def test_dry_run_writes_nothing(self):
+        self.call('sync_bitrix_contacts', '--dry-run')
+
+        self.assertFalse(BitrixContact.objects.exists())
+
+
+class UpsertContactsTests(TestCase):
+    def row(self, bitrix_id, email, name='Ann'):
+        return {'bitrix_id': bitrix_id, 'email': email, 'name': name, 'last_name': 'Zed', 'phone': None}
+
+    def test_local_contact_without_bitrix_id_is_matched_by_email(self):
+        local = BitrixContact.objects.create(name='Ann', email='ann@example.com')
+
+        result = upsert_contacts([self.row(5, 'ann@example.com')])
+
+        self.assertEqual(len(result.updated), 1)
+        local.refresh_from_db()
+        self.assertEqual(local.bitrix_id, 5)
+
+    def test_emails_can_move_between_contacts(self):
+        upsert_contacts([self.row(1, 'a@example.com'), self.row(2, 'b@example.com')])
+
+        upsert_contacts([self.row(1, 'b@example.com'), self.row(2, 'a@example.com')])
+
+        self.assertEqual(
+            dict(BitrixContact.objects.values_list('bitrix_id', 'email')),
+            {1: 'b@example.com', 2: 'a@example.com'}
+        )
+
+    def test_email_held_by_another_bitrix_contact_is_skipped(self):
+        upsert_contacts([self.row(1, 'a@example.com'), self.row(2, 'b@example.com')])
+
+        result = upsert_contacts([self.row(1, 'b@example.com')])
+
+        self.assertEqual(result.duplicates, 1)
+        self.assertEqual(BitrixContact.objects.get(bitrix_id=1).email, 'a@example.com')
+
+
+class SyncDealsTests(FakePortalMixin, TestCase):
+    portal_options = {'contacts': 10, 'deals': 120}
+
+    def test_full_sync_mirrors_deals_and_switches_the_endpoint(self):
+        self.assertFalse(mirror_is_synced())
+
+        self.call('sync_bitrix_deals')
+
+        self.assertEqual(BitrixDeal.objects.count(), 120)
+        self.assertTrue(mirror_is_synced())
+
+    def test_full_sync_removes_deleted_deals(self):
+        self.call('sync_bitrix_deals')
+        self.portal.delete_deals([4, 100])
+
+        output = self.call('sync_bitrix_deals')
+
+        self.assertIn('Deleted deals: 2', output)
+        self.assertFalse(BitrixDeal.objects.filter(bitrix_id__in=[4, 100]).exists())
+        self.assertEqual(BitrixDeal.objects.count(), 118)
+
+    def test_partial_sync_does_not_switch_the_endpoint(self):
+        self.call('sync_bitrix_deals', '--max-pages', '1')
+
+        self.assertFalse(mirror_is_synced())
+
+    def test_mirror_of_another_portal_does_not_count(self):
+        self.call('sync_bitrix_deals')
+
+        with override_settings(BITRIX24_DOMAIN='other.bitrix24.com'):
+            self.assertFalse(mirror_is_synced())
+
+    def test_incremental_sync_fetches_modified_deals(self):
+        self.call('sync_bitrix_deals')
+        self.portal.touch_deals([5, 70])
+        self.portal.reset_stats()
+
+        self.call('sync_bitrix_deals', '--incremental')
+
+        self.assertEqual(
+            set(BitrixDeal.objects.filter(title__endswith='(edited)').values_list('bitrix_id', flat=True)),
+            {5, 70}
+        )
+        self.assertEqual(self.portal.stats()['calls:crm.deal.list'], 1)
+
+    def test_incremental_sync_keeps_its_place_when_a_deal_is_edited_during_the_run(self):
+        handle = self.portal.handle
+        calls = []
+
+        def edit_after_first_page(method, params):
+            response = handle(method, params)
+            if method == 'crm.deal.list' and not calls:
+                calls.append(method)
+                # Moves deal 10 from the page just read to the end of the order
+                self.portal.touch_deals([10])
+            return response
+
+        self.portal.handle = edit_after_first_page
+        self.call('sync_bitrix_deals', '--incremental')
+
+        self.assertEqual(BitrixDeal.objects.count(), 120)
+        self.assertTrue(BitrixDeal.objects.get(bitrix_id=10).title.endswith('(edited)'))
+
+    def test_incremental_sync_pages_through_deals_modified_in_one_second(self):
+        self.call('sync_bitrix_deals')
+        # More deals than fit on a page share one DATE_MODIFY
+        self.portal.touch_deals(range(1, 121))
+
+        self.call('sync_bitrix_deals', '--incremental')
+
+        self.assertEqual(BitrixDeal.objects.filter(title__endswith='(edited)').count(), 120)
+
+
+class OutboxTests(FakePortalMixin, TestCase):
+    portal_options = {'contacts': 0, 'deals': 0}
+
+    def add_contact(self, name='Ann', email='ann@example.com'):
+        contact = BitrixContact.objects.create(name=name, email=email, sync_status=BitrixContact.SYNC_PENDING)
+        enqueue_contact_add(contact)
+        return contact
+
+    def test_pending_contact_is_pushed(self):
+        contact = self.add_contact()
+
+        result = process_outbox()
+
+        self.assertEqual(result.synced, 1)
+        contact.refresh_from_db()
+        self.assertEqual(contact.sync_status, BitrixContact.SYNC_SYNCED)
+        self.assertEqual(contact.bitrix_id, 1)
+        self.assertEqual(self.portal.contact(0)['ORIGIN_ID'], str(contact.outbox_entries.get().idempotency_key))
+
+    def test_failed_delivery_is_retried_without_duplicates(self):
+        contact = self.add_contact()
+        self.portal.error_rate = 1.0
+
+        result = process_outbox()
+
+        self.assertEqual(result.retried, 1)
+        entry = BitrixOutbox.objects.get()
+        self.assertEqual(entry.status, BitrixOutbox.STATUS_PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+
+        # Not due yet
+        self.portal.error_rate = 0.0
+        self.assertEqual(process_outbox().synced, 0)
+
+        BitrixOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(process_outbox().synced, 1)
+        contact.refresh_from_db()
+        self.assertEqual(contact.sync_status, BitrixContact.SYNC_SYNCED)
+        self.assertEqual(self.portal.contact_count, 1)
+
+    @override_settings(BITRIX24_MAX_RETRIES=2)
+    def test_batch_lost_after_bitrix_ran_it_is_not_sent_twice(self):
+        reset_client()
+        contact = self.add_contact()
+        handle = self.portal.handle
+        failed = []
+
+        def fail_after_running(method, params):
+            status, body = handle(method, params)
+            if method == 'batch' and not failed:
+                failed.append(method)
+                return 500, {'error': 'INTERNAL_SERVER_ERROR', 'error_description': 'Lost response'}
+            return status, body
+
+        self.portal.handle = fail_after_running
+        self.assertEqual(process_outbox().retried, 1)
+        self.assertEqual(self.portal.contact_count, 1)
+
+        # The next attempt finds the contact by its ORIGIN_ID
+        BitrixOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(process_outbox().synced, 1)
+        self.assertEqual(self.portal.contact_count, 1)
+        contact.refresh_from_db()
+        self.assertEqual(contact.bitrix_id, 1)
+
+    def test_rejected_contact_is_dead_lettered(self):
+        contact = self.add_contact(name='')
+
+        result = process_outbox()
+
+        self.assertEqual(result.dead, 1)
+        self.assertEqual(BitrixOutbox.objects.get().status, BitrixOutbox.STATUS_DEAD)
+        contact.refresh_from_db()
+        self.assertEqual(contact.sync_status, BitrixContact.SYNC_FAILED)
+
+    def test_entry_is_dead_lettered_after_max_attempts(self):
+        self.add_contact()
+        self.portal.error_rate = 1.0
+
+        result = process_outbox(max_attempts=1)
+
+        self.assertEqual(result.dead, 1)
+        self.assertEqual(BitrixOutbox.objects.get().status, BitrixOutbox.STATUS_DEAD)
+
+
+@override_settings(BITRIX24_APPLICATION_TOKEN='app-token')
+class EventTests(FakePortalMixin, TestCase):
+    portal_options = {'contacts': 10, 'deals': 5, 'missing_email_every': 0}
+    url = '/api/bitrix-events/'
+
+    def post_event(self, event, bitrix_id, token='app-token'):
+        return self.client.post(self.url, {
+            'event': event,
+            'data[FIELDS][ID]': str(bitrix_id),
+            'auth[application_token]': token,
+        })
+
+    def test_event_is_queued(self):
+        response = self.post_event('ONCRMCONTACTUPDATE', 3)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'queued'})
+        event = BitrixEvent.objects.get()
+        self.assertEqual((event.entity, event.bitrix_id), (BitrixEvent.ENTITY_CONTACT, 3))
+        # Nothing is fetched while Bitrix24 waits for the answer
+        self.assertEqual(self.portal.stats(), {})
+
+    def test_invalid_token_is_rejected(self):
+        self.assertEqual(self.post_event('ONCRMCONTACTUPDATE', 3, token='wrong').status_code, 403)
+        self.assertFalse(BitrixEvent.objects.exists())
+
+    def test_unknown_event_and_missing_id(self):
+        self.assertEqual(self.post_event('ONCRMLEADADD', 3).json(), {'status': 'ignored'})
+        self.assertEqual(self.post_event('ONCRMCONTACTADD', '').status_code, 400)
+        self.assertFalse(BitrixEvent.objects.exists())
+
+    def test_events_are_applied_in_one_request(self):
+        self.call('sync_bitrix_contacts')
+        self.call('sync_bitrix_deals')
+        edited = self.portal.touch_contacts(2)
+        self.portal.delete_contacts([7])
+        self.portal.delete_deals([2])
+        for bitrix_id in edited + edited + [7]:
+            self.post_event('ONCRMCONTACTUPDATE', bitrix_id)
+        self.post_event('ONCRMDEALDELETE', 2)
+        self.portal.reset_stats()
+
+        output = self.call('process_bitrix_events')
+
+        self.assertIn('Events: 6, Upserted: 2, Deleted: 2', output)
+        self.assertFalse(BitrixEvent.objects.exists())
+        self.assertEqual(
+            set(BitrixContact.objects.filter(name__endswith='(edited)').values_list('bitrix_id', flat=True)),
+            set(edited)
+        )
+        self.assertIsNotNone(BitrixContact.objects.get(bitrix_id=7).deleted_at)
+        self.assertFalse(BitrixDeal.objects.filter(bitrix_id=2).exists())
+        # Coalesced by record, one batch request per entity
+        self.assertEqual(self.portal.stats()['calls:batch'], 2)
+
+    def test_failed_fetch_keeps_the_events_queued(self):
+        self.post_event('ONCRMCONTACTUPDATE', 3)
+        self.portal.error_rate = 1.0
+
+        with self.assertRaises(CommandError):
+            self.call('process_bitrix_events')
+
+        self.assertEqual(BitrixEvent.objects.count(), 1)
+
+
+class ContactApiTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='staff@example.com', password='secret-pass-1')
+        self.client.force_authenticate(self.user)
+
+    def create_contacts(self, count):
+        for number in range(count):
+            BitrixContact.objects.create(
+                name=f'Name{number}', last_name=f'Last{number:02d}',
+                email=f'person{number}@example.com', phone=f'+1 (555) {number:03d}'
+            )
+
+
+class ContactListTests(ContactApiTestCase):
+    url = '/api/bitrix-contacts/'
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_cursor_pagination_walks_every_contact_once(self):
+        self.create_contacts(7)
+
+        emails = []
+        url = f'{self.url}?page_size=3'
+        pages = 0
+        while url:
+            data = self.client.get(url).json()
+            emails += [contact['email'] for contact in data['results']]
+            url = data['next']
+            pages += 1
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(emails, [f'person{number}@example.com' for number in range(7)])
+
+        previous = self.client.get(data['previous']).json()
+        self.assertEqual([contact['email'] for contact in previous['results']],
+                         ['person3@example.com', 'person4@example.com', 'person5@example.com'])
+
+    def test_tampered_cursor_is_rejected(self):
+        self.create_contacts(2)
+        positions = [
+            '["L", "N1", "abc"]', '["L", "N1", true]', '["L", null, 1]', '[{"a": 1}, "N1", 1]',
+            '["L", "N1"]', '{"id": 1}', 'not json',
+        ]
+        for position in positions:
+            with self.subTest(position=position):
+                cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+
+                response = self.client.get(self.url, {'cursor': cursor})
+
+                self.assertEqual(response.status_code, 404)
+
+    def test_all_returns_a_plain_list(self):
+        self.create_contacts(3)
+
+        data = self.client.get(f'{self.url}?all=true').json()
+
+        self.assertEqual(len(data), 3)
+
+    def test_deleted_contacts_are_hidden(self):
+        self.create_contacts(2)
+        BitrixContact.objects.filter(email='person0@example.com').update(deleted_at=timezone.now())
+
+        data = self.client.get(f'{self.url}?all=true').json()
+
+        self.assertEqual([contact['email'] for contact in data], ['person1@example.com'])
+
+    def test_conditional_get(self):
+        self.create_contacts(2)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+        # The cached pages are invalidated when the create commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'name': 'New', 'email': 'new@example.com'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_conditional_get_of_one_contact(self):
+        self.create_contacts(1)
+        url = f'{self.url}{BitrixContact.objects.get().pk}/'
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_fields_and_omit(self):
+        self.create_contacts(1)
+
+        data = self.client.get(f'{self.url}?all=true&fields=id,email,full_name').json()
+        self.assertEqual(set(data[0]), {'id', 'email', 'full_name'})
+        self.assertEqual(data[0]['full_name'], 'Name0 Last00')
+
+        data = self.client.get(f'{self.url}?all=true&omit=phone,created_at').json()
+        self.assertNotIn('phone', data[0])
+        self.assertNotIn('created_at', data[0])
+        self.assertIn('email', data[0])
+
+        pk = data[0]['id']
+        data = self.client.get(f'{self.url}{pk}/?fields=email').json()
+        self.assertEqual(data, {'email': 'person0@example.com'})
+
+    def test_unknown_field_is_rejected(self):
+        self.create_contacts(1)
+
+        response = self.client.get(f'{self.url}?fields=id,secret')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_search(self):
+        BitrixContact.objects.create(name='Ann', last_name='Zed', email='ann@example.com', phone='+1 (555) 123')
+        BitrixContact.objects.create(name='Bob', last_name='Kay', email='bob@example.com', phone='020 7946')
+
+        def search(term):
+            return [contact['email'] for contact in self.client.get(self.url, {'all': 'true', 'search': term}).json()]
+
+        self.assertEqual(search('zed'), ['ann@example.com'])
+        self.assertEqual(search('BOB'), ['bob@example.com'])
+        self.assertEqual(search('example'), ['bob@example.com', 'ann@example.com'])
+        self.assertEqual(search('555'), ['ann@example.com'])
+        self.assertEqual(search('7946'), ['bob@example.com'])
+        self.assertEqual(search('nobody'), [])
+
+    def test_search_follows_changes(self):
+        contact = BitrixContact.objects.create(name='Ann', last_name='Zed', email='ann@example.com')
+        upsert_contacts([{
+            'bitrix_id': 1, 'email': 'ann@example.com', 'name': 'Ann', 'last_name': 'Young', 'phone': None,
+        }])
+
+        def search(term):
+            return [row['id'] for row in self.client.get(self.url, {'all': 'true', 'search': term}).json()]
+
+        self.assertEqual(search('young'), [contact.pk])
+        self.assertEqual(search('zed'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Checks the SQLite query plan')
+    def test_search_uses_indexes(self):
+        queryset = BitrixContact.objects.all()
+        for term in ['zed', '555']:
+            sql, params = search_contacts(queryset, term).query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            with self.subTest(term=term):
+                self.assertFalse([step for step in plan if step.startswith('SCAN')], plan)
+
+    def test_busy_cache_answers_503(self):
+        with mock.patch('bitrix.views.get_or_build', side_effect=CacheWaitTimeout):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class ContactExportTests(ContactApiTestCase):
+    url = '/api/bitrix-contacts/export/'
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @override_settings(BITRIX24_EXPORT_CHUNK_SIZE=2)
+    def test_csv(self):
+        self.create_contacts(5)
+
+        response, content = self.export(fields='email,full_name')
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="contacts.csv"')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ['email', 'full_name'])
+        self.assertEqual(rows[1:], [[f'person{n}@example.com', f'Name{n} Last{n:02d}'] for n in range(5)])
+
+    @override_settings(BITRIX24_EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_matches_the_list(self):
+        self.create_contacts(5)
+
+        _, content = self.export(type='ndjson')
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(rows, self.client.get('/api/bitrix-contacts/?all=true&ordering=id').json())
+
+    def test_filters(self):
+        self.create_contacts(3)
+        BitrixContact.objects.filter(email='person1@example.com').update(sync_status=BitrixContact.SYNC_FAILED)
+        BitrixContact.objects.filter(email='person2@example.com').update(deleted_at=timezone.now())
+
+        self.assertEqual(self.export(fields='email', search='person1')[1].split(), ['email', 'person1@example.com'])
+        self.assertEqual(self.export(fields='email', sync_status='failed')[1].split(), ['email', 'person1@example.com'])
+        self.assertEqual(self.export(fields='email')[1].split(), ['email', 'person0@example.com', 'person1@example.com'])
+
+    def test_unknown_field_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'fields': 'email,password'}).status_code, 400)
+
+
+class ContactCreateTests(ContactApiTestCase):
+    url = '/api/bitrix-contacts/'
+
+    def test_create_queues_the_contact(self):
+        response = self.client.post(self.url, {'name': 'Ann', 'email': 'Ann@Example.com'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['sync_status'], BitrixContact.SYNC_PENDING)
+        contact = BitrixContact.objects.get()
+        self.assertEqual(contact.email, 'ann@example.com')
+        self.assertEqual(BitrixOutbox.objects.get().contact, contact)
+
+    def test_duplicate_email_is_rejected_case_insensitively(self):
+        self.client.post(self.url, {'name': 'Ann', 'email': 'ann@example.com'})
+
+        response = self.client.post(self.url, {'name': 'Ann', 'email': 'ANN@example.com'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json())
+        self.assertEqual(BitrixContact.objects.count(), 1)
+
+    def test_bulk_create(self):
+        BitrixContact.objects.create(name='Old', email='taken@example.com')
+
+        response = self.client.post(f'{self.url}bulk/', [
+            {'name': 'Ann', 'email': 'ann@example.com'},
+            {'name': 'Bob', 'email': 'taken@example.com'},
+            {'name': '', 'email': 'nameless@example.com'},
+            {'name': 'Cid', 'email': 'cid@example.com'},
+            {'name': 'Ann again', 'email': 'ANN@example.com'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (2, 3))
+        self.assertEqual([result['status'] for result in data['results']],
+                         ['created', 'error', 'error', 'created', 'error'])
+        self.assertEqual(BitrixOutbox.objects.count(), 2)
+
+    def test_bulk_create_rejects_a_non_list(self):
+        response = self.client.post(f'{self.url}bulk/', {'name': 'Ann'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(BITRIX24_BULK_CREATE_MAX=2)
+    def test_bulk_create_limit(self):
+        items = [{'name': 'A', 'email': f'a{number}@example.com'} for number in range(3)]
+
+        response = self.client.post(f'{self.url}bulk/', items, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BitrixContact.objects.exists())
+
+    def test_updates_are_not_allowed(self):
+        self.create_contacts(1)
+        url = f'{self.url}{BitrixContact.objects.get().pk}/'
+
+        self.assertEqual(self.client.patch(url, {'name': 'X'}).status_code, 405)
+        self.assertEqual(self.client.delete(url).status_code, 405)
+
+
+class ContactImportTests(ContactApiTestCase):
+    url = '/api/bitrix-contacts/import/'
+
+    def setUp(self):
+        super().setUp()
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+        settings = override_settings(BITRIX24_IMPORT_REPORT_DIR=report_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, name, content):
+        return self.client.post(self.url, {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_csv_import(self):
+        BitrixContact.objects.create(name='Local', email='local@example.com', sync_status=BitrixContact.SYNC_PENDING)
+        BitrixContact.objects.create(name='Synced', email='synced@example.com', bitrix_id=9)
+        content = (
+            'name,last_name,email,phone\n'
+            'Ann,Zed,ann@example.com,+1 555\n'
+            'Local renamed,,local@example.com,\n'
+            'Synced renamed,,synced@example.com,\n'
+            'Bad,,not-an-email,\n'
+            'Ann twice,,ANN@example.com,\n'
+        ).encode()
+
+        response = self.upload('contacts.csv', content)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            {key: data[key] for key in ['rows', 'created', 'updated', 'skipped', 'rejected']},
+            {'rows': 5, 'created': 1, 'updated': 1, 'skipped': 1, 'rejected': 2}
+        )
+        self.assertEqual(BitrixContact.objects.get(email='local@example.com').name, 'Local renamed')
+        self.assertEqual(BitrixContact.objects.get(email='synced@example.com').name, 'Synced')
+        self.assertEqual(BitrixOutbox.objects.get().contact.email, 'ann@example.com')
+
+        report = self.client.get(data['error_report'])
+        self.assertEqual(report.status_code, 200)
+        lines = b''.join(report.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('5,Bad'))
+
+    def test_xlsx_import(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['Email', 'Name', 'Phone'])
+        sheet.append(['ann@example.com', 'Ann', 5550100])
+        sheet.append(['bob@example.com', 'Bob', None])
+        content = io.BytesIO()
+        workbook.save(content)
+
+        response = self.upload('contacts.xlsx', content.getvalue())
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['created'], data['rejected'], data['error_report']), (2, 0, None))
+        self.assertEqual(BitrixContact.objects.get(email='ann@example.com').phone, '5550100')
+
+    def test_unknown_format_is_rejected(self):
+        response = self.upload('contacts.txt', b'name,email\n')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BitrixContact.objects.exists())
+
+
+class AdminTests(FakePortalMixin, TestCase):
+    portal_options = {'contacts': 0, 'deals': 0}
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='secret-pass-1')
+        self.client.force_login(self.admin)
+
+    def create_contact(self, email):
+        return BitrixContact.objects.create(name='Ann', email=email)
+
+    def test_deleting_contacts_invalidates_the_list_caches(self):
+        contacts = [self.create_contact(f'person{number}@example.com') for number in range(3)]
+        for url, data in [
+            (f'/admin/bitrix/bitrixcontact/{contacts[0].pk}/delete/', {'post': 'yes'}),
+            ('/admin/bitrix/bitrixcontact/', {
+                'action': 'delete_selected', 'post': 'yes', '_selected_action': [contacts[1].pk, contacts[2].pk],
+            }),
+        ]:
+            with self.subTest(url=url):
+                cache.set(CONTACTS_VERSION_KEY, 'before', timeout=None)
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post(url, data)
+
+                self.assertEqual(response.status_code, 302)
+                self.assertNotEqual(cache.get(CONTACTS_VERSION_KEY), 'before')
+        self.assertFalse(BitrixContact.objects.exists())
+
+    def test_retry_resets_dead_entries_without_sending_them_twice(self):
+        contact = self.create_contact('ann@example.com')
+        enqueue_contact_add(contact)
+        handle = self.portal.handle
+
+        def fail_after_running(method, params):
+            handle(method, params)
+            return 500, {'error': 'INTERNAL_SERVER_ERROR', 'error_description': 'Lost response'}
+
+        # Bitrix24 creates the contact but the response is lost
+        self.portal.handle = fail_after_running
+        self.assertEqual(process_outbox(max_attempts=1).dead, 1)
+        self.portal.handle = handle
+
+        response = self.client.post('/admin/bitrix/bitrixoutbox/', {
+            'action': 'retry_entries', '_selected_action': [BitrixOutbox.objects.get().pk],
+        })
+
+        self.assertEqual(response.status_code, 302)
+        entry = BitrixOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), (BitrixOutbox.STATUS_PENDING, 0))
+        contact.refresh_from_db()
+        self.assertEqual(contact.sync_status, BitrixContact.SYNC_PENDING)
+
+        self.assertEqual(process_outbox().synced, 1)
+        self.assertEqual(self.portal.contact_count, 1)
+
+    def test_contact_search(self):
+        self.create_contact('ann@example.com')
+        self.create_contact('bob@example.com')
+
+        response = self.client.get('/admin/bitrix/bitrixcontact/', {'q': 'bob'})
+
+        self.assertEqual(list(response.context['cl'].result_list.values_list('email', flat=True)), ['bob@example.com'])
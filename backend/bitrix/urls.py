@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BitrixContactViewSet
+from .views import BitrixContactViewSet, BitrixDealViewSet, bitrix_event_view
 
 router = DefaultRouter()
 router.register(r'bitrix-contacts', BitrixContactViewSet, basename='bitrix-contacts')
+router.register(r'bitrix-deals', BitrixDealViewSet, basename='bitrix-deals')
 
 urlpatterns = [
     path('', include(router.urls)),
+
+    # Bitrix24 outbound webhook target
+    path('bitrix-events/', bitrix_event_view, name='bitrix-events'),
 ]
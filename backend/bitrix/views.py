@@ -1,104 +1,408 @@
-import requests
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+import hashlib
+import os
+import uuid
+
 from django.conf import settings
-from .models import BitrixContact
-from .serializers import BitrixContactSerializer
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from ReyadaTasks.conditional import make_etag, not_modified, set_validators
+from ReyadaTasks.sparse_fields import SPARSE_FIELDS_PARAMETERS, requested_fields
+from .bulk import STATUS_CREATED, create_contacts
+from .cache import CacheWaitTimeout, contacts_version, get_or_build
+from .client import BitrixError
+from .deals import get_deals, mirror_is_synced
+from .events import EVENT_ENTITIES, is_valid_token
+from .export import EXPORT_FORMATS, export_contacts
+from .imports import IMPORT_FORMATS, ImportFileError, detect_format, import_contacts, read_contact_file
+from .models import DUPLICATE_EMAIL_MESSAGE, BitrixContact, BitrixDeal, BitrixEvent
+from .outbox import enqueue_contact_add
+from .pagination import ContactCursorPagination
+from .search import search_contacts
+from .serializers import BitrixContactExportSerializer, BitrixContactSerializer, BitrixDealSerializer
 import logging
+import requests
 
 logger = logging.getLogger(__name__)
 
+# "Waiting for payment" stage shown on the sales orders page
+DEFAULT_DEAL_STAGE = 'UC_3MCI1C'
+
 
 class BitrixContactViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing Bitrix contacts with CRUD operations and Bitrix24 sync
     """
-    queryset = BitrixContact.objects.all()
+    # Contacts deleted in Bitrix24 are kept but hidden
+    queryset = BitrixContact.objects.filter(deleted_at__isnull=True)
     serializer_class = BitrixContactSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ContactCursorPagination
+
+    def get_queryset(self):
+        """
+        Narrow the list and the export to contacts matching ?search=, and
+        read only the columns a contact needs for its ?fields=
+        """
+        queryset = super().get_queryset()
+        term = self.request.query_params.get('search', '').strip()
+        if term and self.action in ('list', 'export'):
+            queryset = search_contacts(queryset, term)
+        if self.action == 'retrieve':
+            fields = self._selected_fields()
+            if fields is not None:
+                # updated_at is the validator of conditional requests
+                queryset = queryset.only(*BitrixContactSerializer.value_fields(fields), 'updated_at')
+        return queryset
+
+    def _selected_fields(self):
+        """
+        Return the fields kept by ?fields= and ?omit=, or None when the
+        request has neither
+        """
+        fields, omit = requested_fields(self.request)
+        if fields is None and omit is None:
+            return None
+        return list(self.get_serializer().fields)
+
+    def paginate_queryset(self, queryset):
+        """
+        Let legacy clients opt out of pagination with ?all=true
+        """
+        if self.request.query_params.get('all', '').lower() in ('1', 'true', 'yes'):
+            return None
+        return super().paginate_queryset(queryset)
     
     def get_permissions(self):
         """
         Override permissions to allow only read and create operations
         """
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'export', 'import_report']:
             permission_classes = [IsAuthenticated]
-        elif self.action == 'create':
+        elif self.action in ['create', 'bulk', 'import_file']:
             permission_classes = [IsAuthenticated]
         else:
             # Disable update and delete operations
             permission_classes = []
         return [permission() for permission in permission_classes]
     
-    # Bitrix24 API configuration
-    @property
-    def bitrix_base_url(self):
-        return getattr(settings, 'BITRIX24_BASE_URL', 'https://b24-0r8mng.bitrix24.com/rest/1/iolappou7w3kdu2w')
-
     @swagger_auto_schema(
         operation_summary="List all Bitrix contacts",
-        operation_description="Retrieve a list of all Bitrix24 CRM contacts stored in the database",
+        operation_description=(
+            "Retrieve Bitrix24 CRM contacts stored in the database, ordered by last name, "
+            "name and ID, one page at a time. Follow the next and previous links to move "
+            "between pages. Pass all=true to get every contact as a plain list instead."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'search', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                description=(
+                    "Match name, last name or email, or digits anywhere in the phone number. "
+                    "On PostgreSQL terms of 3+ characters match anywhere in the text, "
+                    "otherwise the start of any word of the name, last name or email"
+                )
+            ),
+            openapi.Parameter(
+                'all', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                description="Return every contact as an unpaginated list"
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
+        ],
         responses={
             200: openapi.Response(
-                description="List of Bitrix contacts retrieved successfully",
+                description="Page of Bitrix contacts retrieved successfully",
                 schema=BitrixContactSerializer(many=True)
             ),
-            401: "Unauthorized - Authentication required"
+            304: "Not Modified - The contacts match the If-None-Match or If-Modified-Since header",
+            401: "Unauthorized - Authentication required",
+            503: "Service Unavailable - Another request is still building this page; retry later"
         }
     )
     def list(self, request, *args, **kwargs):
         logger.info(f"BitrixContact list accessed by user: {request.user}")
-        return super().list(request, *args, **kwargs)
+        fields = self._selected_fields()
+
+        # Pages are the same for every user, so they are cached per URL
+        # under the current table version, together with their validators
+        ttl = getattr(settings, 'BITRIX24_CONTACTS_CACHE_TTL', 30)
+        page = None
+        if ttl > 0:
+            url = hashlib.blake2b(request.build_absolute_uri().encode(), digest_size=16).hexdigest()
+            key = f'bitrix:contacts:{contacts_version()}:{url}'
+            try:
+                page = get_or_build(key, lambda: self._build_list(request, fields), timeout=ttl)
+            except CacheWaitTimeout:
+                return Response(
+                    {'detail': 'The contacts are being loaded, please try again shortly.'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': '5'}
+                )
+            etag, modified = page['etag'], page['modified']
+        else:
+            etag, modified = self._list_validators(request)
+
+        response = not_modified(request, etag, modified)
+        if response is None:
+            response = Response(page['data'] if page else self._list_data(fields))
+        return set_validators(response, etag, modified)
+
+    def _list_validators(self, request):
+        """
+        Return the ETag and Last-Modified of the list at this URL
+        """
+        # Every write to a contact bumps updated_at, soft deletes included,
+        # and the row count catches hard deletes; one aggregate over the
+        # updated_at index gives the validators
+        state = BitrixContact.objects.aggregate(modified=Max('updated_at'), count=Count('pk'))
+        etag = make_etag('contacts', state['count'], state['modified'], request.get_full_path())
+        return etag, state['modified']
+
+    def _build_list(self, request, fields):
+        """
+        Serialize one page of the list for the cache, with its validators
+        """
+        etag, modified = self._list_validators(request)
+        return {'data': self._list_data(fields), 'etag': etag, 'modified': modified}
+
+    def _list_data(self, fields=None):
+        """
+        Serialize the requested page, or the whole list with ?all=true.
+
+        Rows are read with values() and serialized by
+        BitrixContactSerializer.from_values(), which produces the same
+        output as the serializer at a fraction of the cost per row. With
+        `fields`, only the columns those fields need are selected.
+        """
+        columns = BitrixContactSerializer.value_fields(fields) if fields is not None else BitrixContactSerializer.VALUE_FIELDS
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(BitrixContactSerializer.from_values(page, fields)).data
+        return BitrixContactSerializer.from_values(queryset, fields)
+
+    @swagger_auto_schema(
+        operation_summary="Export Bitrix contacts",
+        operation_description=(
+            "Stream every contact as CSV or newline-delimited JSON, ordered by ID. "
+            "Rows are read from the database in chunks as the response is sent, "
+            "so exports of any size start at once and use constant memory."
+        ),
+        query_serializer=BitrixContactExportSerializer,
+        responses={
+            200: "CSV or NDJSON file of contacts",
+            400: "Bad Request - Invalid parameters",
+            401: "Unauthorized - Authentication required"
+        }
+    )
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        params = BitrixContactExportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        export_format = params.validated_data['type']
+        fields = params.validated_data.get('fields', BitrixContactSerializer.Meta.fields)
+
+        queryset = self.get_queryset()
+        if 'updated_since' in params.validated_data:
+            queryset = queryset.filter(updated_at__gte=params.validated_data['updated_since'])
+        if 'sync_status' in params.validated_data:
+            queryset = queryset.filter(sync_status=params.validated_data['sync_status'])
+        logger.info(f"BitrixContact {export_format} export started by user: {request.user}")
+
+        response = StreamingHttpResponse(
+            export_contacts(queryset, export_format, fields),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="contacts.{export_format}"'
+        return response
+
+    @swagger_auto_schema(
+        operation_summary="Get a Bitrix contact",
+        manual_parameters=SPARSE_FIELDS_PARAMETERS,
+        responses={
+            200: BitrixContactSerializer,
+            304: "Not Modified - The contact matches the If-None-Match or If-Modified-Since header",
+            401: "Unauthorized - Authentication required",
+            404: "Not Found"
+        }
+    )
+    def retrieve(self, request, *args, **kwargs):
+        contact = self.get_object()
+        etag = make_etag('contact', contact.pk, contact.updated_at, request.get_full_path())
+
+        response = not_modified(request, etag, contact.updated_at)
+        if response is None:
+            response = Response(self.get_serializer(contact).data)
+        return set_validators(response, etag, contact.updated_at)
 
     @swagger_auto_schema(
         operation_summary="Create new contact",
-        operation_description="Create a new contact in database and sync with Bitrix24 CRM",
+        operation_description=(
+            "Create a new contact in database and queue it for Bitrix24 CRM sync. "
+            "The sync_status field reports pending, synced or failed."
+        ),
         request_body=BitrixContactSerializer,
         responses={
             201: openapi.Response(
-                description="Contact created successfully and synced with Bitrix24",
+                description="Contact created successfully and queued for Bitrix24 sync",
                 schema=BitrixContactSerializer
             ),
             400: "Bad Request - Invalid data",
-            401: "Unauthorized - Authentication required",
-            500: "Internal Server Error - Bitrix sync failed"
+            401: "Unauthorized - Authentication required"
         }
     )
     def create(self, request, *args, **kwargs):
         logger.info(f"Creating new contact by user: {request.user}")
         
-        # Check for duplicate email
-        email = request.data.get('email', '').strip().lower()
-        if BitrixContact.objects.filter(email__iexact=email).exists():
-            return Response(
-                {'email': ['A contact with this email already exists.']},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         # Validate and save to database first
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Save to database
-        contact = serializer.save()
-        logger.info(f"Contact saved to database: {contact}")
-        
-        # Sync with Bitrix24
+        # Save to database together with its outbox entry; the
+        # process_bitrix_outbox command pushes it to Bitrix24. Duplicate
+        # emails are rejected by the unique index on Lower(email), which
+        # also holds when two requests race.
         try:
-            self._sync_contact_to_bitrix(contact)
-            logger.info(f"Contact successfully synced to Bitrix24: {contact}")
-        except Exception as e:
-            logger.error(f"Failed to sync contact to Bitrix24: {e}")
-            # Don't delete the contact from database, just log the error
-            # In production, you might want to implement a retry mechanism
+            with transaction.atomic():
+                contact = serializer.save(sync_status=BitrixContact.SYNC_PENDING)
+                enqueue_contact_add(contact)
+        except IntegrityError:
+            return Response(
+                {'email': [DUPLICATE_EMAIL_MESSAGE]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        logger.info(f"Contact saved to database and queued for Bitrix24 sync: {contact}")
         
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @swagger_auto_schema(
+        operation_summary="Create contacts in bulk",
+        operation_description=(
+            "Create up to BITRIX24_BULK_CREATE_MAX contacts from a JSON array in one transaction "
+            "and queue them for Bitrix24 CRM sync. Each item is validated on its own; the "
+            "response has one result per item, in order, with the created contact or its errors. "
+            "Returns 201 when at least one contact was created, otherwise 400."
+        ),
+        request_body=BitrixContactSerializer(many=True),
+        responses={
+            201: "Contacts created; see results for items that were rejected",
+            400: "Bad Request - Not a list, too many items, or no valid contact",
+            401: "Unauthorized - Authentication required"
+        }
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        items = request.data
+        limit = getattr(settings, 'BITRIX24_BULK_CREATE_MAX', 2000)
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'detail': 'Expected a non-empty list of contacts.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > limit:
+            return Response(
+                {'detail': f'At most {limit} contacts can be created per request.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = create_contacts(items)
+        created = sum(1 for result in results if result['status'] == STATUS_CREATED)
+        logger.info(f"Bulk created {created} of {len(items)} contacts by user: {request.user}")
+
+        return Response(
+            {'created': created, 'failed': len(items) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
+
+    @swagger_auto_schema(
+        operation_summary="Import contacts from a file",
+        operation_description=(
+            "Upload a CSV or XLSX file with name, last_name, email and phone columns. The file "
+            "is read as a stream and upserted by email in chunks: new contacts are created and "
+            "queued for Bitrix24, contacts not in Bitrix24 yet are updated, and contacts already "
+            "in Bitrix24 are skipped. Rejected rows are listed in a CSV report at error_report."
+        ),
+        manual_parameters=[
+            openapi.Parameter('file', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True),
+            openapi.Parameter(
+                'type', openapi.IN_FORM, type=openapi.TYPE_STRING, enum=IMPORT_FORMATS,
+                description="File format (default: from the file name)"
+            ),
+        ],
+        responses={
+            200: "Import finished; counts per outcome and the error report URL",
+            400: "Bad Request - Missing or unreadable file",
+            401: "Unauthorized - Authentication required"
+        }
+    )
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('type') or detect_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            return Response(
+                {'type': [f"Use one of: {', '.join(IMPORT_FORMATS)}."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Reports hold contact data, so they are kept outside MEDIA_ROOT and
+        # only served to authenticated users by import_report()
+        report_dir = getattr(settings, 'BITRIX24_IMPORT_REPORT_DIR', 'import_reports')
+        os.makedirs(report_dir, exist_ok=True)
+        report_name = uuid.uuid4().hex
+        report_path = os.path.join(report_dir, f'{report_name}.csv')
+        logger.info(f"Contact import of {upload.name} started by user: {request.user}")
+
+        try:
+            with open(report_path, 'w', encoding='utf-8', newline='') as report:
+                result = import_contacts(read_contact_file(upload, file_format), report=report)
+        except ImportFileError as e:
+            os.remove(report_path)
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        error_report = None
+        if result.rejected:
+            error_report = self.reverse_action('import-report', kwargs={'report': report_name})
+        else:
+            os.remove(report_path)
+        logger.info(f"Contact import finished: {result}")
+
+        return Response({
+            'rows': result.rows,
+            'created': result.created,
+            'updated': result.updated,
+            'unchanged': result.unchanged,
+            'skipped': result.skipped,
+            'rejected': result.rejected,
+            'error_report': error_report,
+        })
+
+    @swagger_auto_schema(
+        operation_summary="Download a contact import error report",
+        responses={
+            200: "CSV file of rejected rows",
+            401: "Unauthorized - Authentication required",
+            404: "Not Found"
+        }
+    )
+    @action(detail=False, methods=['get'], url_path=r'import/reports/(?P<report>[0-9a-f]{32})')
+    def import_report(self, request, report=None):
+        report_dir = getattr(settings, 'BITRIX24_IMPORT_REPORT_DIR', 'import_reports')
+        try:
+            file = open(os.path.join(report_dir, f'{report}.csv'), 'rb')
+        except FileNotFoundError:
+            raise Http404
+        return FileResponse(file, as_attachment=True, filename='contact-import-errors.csv', content_type='text/csv')
+
     def update(self, request, *args, **kwargs):
         """
         Disable update operations - contacts should be managed through Bitrix24
@@ -126,33 +430,91 @@ class BitrixContactViewSet(viewsets.ModelViewSet):
             status=status.HTTP_405_METHOD_NOT_ALLOWED
         )
 
-    def _sync_contact_to_bitrix(self, contact):
-        """
-        Sync contact to Bitrix24 CRM using crm.contact.add API
-        """
-        api_url = f"{self.bitrix_base_url}/crm.contact.add.json"
-        
-        # Prepare data in Bitrix24 format
-        fields = {
-            "NAME": contact.name or "",
-            "LAST_NAME": contact.last_name or "",
-            "EMAIL": [{"VALUE": contact.email, "VALUE_TYPE": "WORK"}]
+
+class BitrixDealViewSet(viewsets.ViewSet):
+    """
+    ViewSet serving Bitrix24 CRM deals from the local BitrixDeal mirror, or
+    from a shared server-side cache until the mirror has been synced
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="List Bitrix deals",
+        operation_description=(
+            "Retrieve Bitrix24 CRM deals in a stage. Deals are read from the local copy kept "
+            "by sync_bitrix_deals; before its first run they are fetched from Bitrix24 and "
+            "cached on the server, so concurrent users share one Bitrix24 call."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'stage_id', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                description=f"Deal stage to return (default: {DEFAULT_DEAL_STAGE})"
+            ),
+        ],
+        responses={
+            200: "List of deals retrieved successfully",
+            401: "Unauthorized - Authentication required",
+            502: "Bad Gateway - Bitrix24 request failed",
+            503: "Service Unavailable - Another request is still fetching the deals; retry later"
         }
-        
-        # Add phone if available
-        if contact.phone:
-            fields["PHONE"] = [{"VALUE": contact.phone, "VALUE_TYPE": "WORK"}]
-        
-        payload = {"fields": fields}
-        
-        logger.info(f"Sending contact to Bitrix24: {payload}")
-        
-        response = requests.post(api_url, json=payload, timeout=30)
-        response.raise_for_status()
-        
-        result = response.json()
-        if 'error' in result:
-            raise Exception(f"Bitrix24 API error: {result['error']}")
-        
-        logger.info(f"Bitrix24 response: {result}")
-        return result
+    )
+    def list(self, request):
+        stage_id = request.query_params.get('stage_id') or DEFAULT_DEAL_STAGE
+        if mirror_is_synced():
+            deals = BitrixDeal.objects.filter(stage_id=stage_id)
+            return Response(BitrixDealSerializer(deals, many=True).data)
+
+        try:
+            deals = get_deals(stage_id)
+        except CacheWaitTimeout:
+            # Another request is still fetching this stage from Bitrix24
+            return Response(
+                {'detail': 'Deals are being loaded from Bitrix24, please try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '5'}
+            )
+        except (requests.RequestException, BitrixError) as e:
+            logger.error(f"Failed to fetch deals from Bitrix24: {e}")
+            return Response(
+                {'detail': 'Failed to fetch deals from Bitrix24.'},
+                status=status.HTTP_502_BAD_GATEWAY
+            )
+        return Response(deals)
+
+
+@swagger_auto_schema(
+    method='post',
+    operation_summary="Receive Bitrix24 event",
+    operation_description=(
+        "Outbound webhook target for ONCRMCONTACTADD/UPDATE/DELETE and ONCRMDEALADD/UPDATE/DELETE. "
+        "Calls are authenticated with the application token Bitrix24 sends as auth[application_token]. "
+        "The event is only queued here; the process_bitrix_events command applies it."
+    ),
+    responses={
+        200: "Event queued or ignored",
+        400: "Bad Request - Missing entity ID",
+        403: "Forbidden - Invalid application token"
+    }
+)
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def bitrix_event_view(request):
+    """
+    Queue a Bitrix24 outbound webhook event
+    """
+    if not is_valid_token(request.data.get('auth[application_token]')):
+        return Response({'detail': 'Invalid application token.'}, status=status.HTTP_403_FORBIDDEN)
+
+    event = (request.data.get('event') or '').upper()
+    entity = EVENT_ENTITIES.get(event)
+    if entity is None:
+        return Response({'status': 'ignored'})
+
+    try:
+        bitrix_id = int(request.data.get('data[FIELDS][ID]'))
+    except (TypeError, ValueError):
+        return Response({'detail': 'Missing entity ID.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    BitrixEvent.objects.create(event=event, entity=entity, bitrix_id=bitrix_id)
+    return Response({'status': 'queued'})
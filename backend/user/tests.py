@@ -1,3 +1,123 @@
-from django.test import TestCase
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from .models import Profile, User
+
+
+class UserApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='ann@example.com', password='secret-pass-1', first_name='Ann', last_name='Zed'
+        )
+        Profile.objects.create(user=self.user, bio='Hello')
+        self.client.force_authenticate(self.user)
+
+
+class RegistrationTests(APITestCase):
+    def test_register_creates_user_and_profile(self):
+        response = self.client.post('/api/auth/users/', {
+            'email': 'bob@example.com',
+            'password': 'Str0ng-pass-word',
+            'password_confirm': 'Str0ng-pass-word',
+            'first_name': 'Bob',
+            'last_name': 'Kay',
+        })
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('access', response.json()['tokens'])
+        self.assertTrue(Profile.objects.filter(user__email='bob@example.com').exists())
+
+    def test_passwords_must_match(self):
+        response = self.client.post('/api/auth/users/', {
+            'email': 'bob@example.com',
+            'password': 'Str0ng-pass-word',
+            'password_confirm': 'other-pass-word',
+            'first_name': 'Bob',
+            'last_name': 'Kay',
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(email='bob@example.com').exists())
+
+
+class ProfileTests(UserApiTestCase):
+    urls = ['/api/auth/users/profile/', '/api/auth/profile/detail/']
+
+    def test_profile(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+
+                self.assertEqual(data['email'], 'ann@example.com')
+                self.assertEqual(data['profile']['bio'], 'Hello')
+
+    def test_conditional_get(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+                self.assertEqual(
+                    self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+                )
+
+    def test_edit_changes_the_etag(self):
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.patch('/api/auth/users/update_profile/', {'first_name': 'Anna'})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['first_name'], 'Anna')
+
+    def test_fields_have_their_own_etag(self):
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(f'{url}?fields=email', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'email': 'ann@example.com'})
+
+    def test_fields_and_omit(self):
+        url = self.urls[0]
+
+        data = self.client.get(f'{url}?fields=id,profile.bio').json()
+        self.assertEqual(data, {'id': self.user.pk, 'profile': {'bio': 'Hello'}})
+
+        data = self.client.get(f'{url}?omit=profile,last_login').json()
+        self.assertNotIn('profile', data)
+        self.assertNotIn('last_login', data)
+        self.assertEqual(data['email'], 'ann@example.com')
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(f'{self.urls[0]}?fields=password')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.client.get(self.urls[0]).status_code, 401)
+
+
+class UserListTests(UserApiTestCase):
+    def test_fields(self):
+        User.objects.create_user(email='bob@example.com', password='secret-pass-1')
+
+        data = self.client.get('/api/auth/users/?fields=id,email').json()
+
+        self.assertEqual(
+            sorted(data, key=lambda user: user['id']),
+            [
+                {'id': self.user.pk, 'email': 'ann@example.com'},
+                {'id': self.user.pk + 1, 'email': 'bob@example.com'},
+            ]
+        )
+
+    def test_nested_fields_need_a_nested_serializer(self):
+        response = self.client.get('/api/auth/users/?fields=email.domain')
+
+        self.assertEqual(response.status_code, 400)
@@ -6,6 +6,8 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from ReyadaTasks.conditional import make_etag, not_modified, set_validators
+from ReyadaTasks.sparse_fields import SPARSE_FIELDS_PARAMETERS
 from .serializers import (
     UserRegistrationSerializer,
     UserDetailSerializer,
@@ -20,12 +22,50 @@ from .models import User, Profile
 User = get_user_model()
 
 
+def profile_response(request):
+    """
+    Serialize the current user's profile, or answer 304 when the client's
+    copy is current. Profile edits bump Profile.updated_at, and the user's
+    own fields are already loaded by authentication, so checking costs one
+    indexed lookup of updated_at. With ?omit=profile the profile row itself
+    is never read.
+    """
+    user = request.user
+    profile_modified = Profile.objects.filter(user=user).values_list('updated_at', flat=True).first()
+    etag = make_etag(
+        'profile', user.pk, user.email, user.first_name, user.last_name,
+        user.date_joined, user.last_login, profile_modified, request.get_full_path(),
+    )
+    last_modified = max(
+        value for value in (profile_modified, user.last_login, user.date_joined) if value is not None
+    )
+
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        serializer = UserDetailSerializer(user, context={'request': request})
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+    return set_validators(response, etag, last_modified)
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """
     A ViewSet for managing users - handles registration, login, profile management
     """
     queryset = User.objects.all()
     serializer_class = UserDetailSerializer
+
+    def get_queryset(self):
+        """
+        Join the profile when the response includes it; otherwise read only
+        the columns of the fields asked for with ?fields= and ?omit=
+        """
+        queryset = super().get_queryset()
+        if self.action not in ['list', 'retrieve']:
+            return queryset
+        fields = list(self.get_serializer().fields)
+        if 'profile' in fields:
+            return queryset.select_related('profile')
+        return queryset.only(*fields)
     
     def get_permissions(self):
         """
@@ -171,11 +211,13 @@ class UserViewSet(viewsets.ModelViewSet):
     @swagger_auto_schema(
         operation_summary="Get user profile",
         operation_description="Get current authenticated user's profile information",
+        manual_parameters=SPARSE_FIELDS_PARAMETERS,
         responses={
             200: openapi.Response(
                 description="User profile retrieved successfully",
                 schema=UserDetailSerializer
             ),
+            304: "Not Modified - The profile matches the If-None-Match or If-Modified-Since header",
             401: "Unauthorized - Authentication required"
         }
     )
@@ -184,8 +226,7 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         Get current user profile
         """
-        serializer = UserDetailSerializer(request.user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return profile_response(request)
     
     @swagger_auto_schema(
         methods=['put', 'patch'],
@@ -282,11 +323,11 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
 
 # Keeping the function-based view for backward compatibility
+@swagger_auto_schema(method='get', manual_parameters=SPARSE_FIELDS_PARAMETERS)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_profile_view(request):
     """
     Get current user profile (function-based view for backward compatibility)
     """
-    serializer = UserDetailSerializer(request.user)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return profile_response(request)